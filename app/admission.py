@@ -0,0 +1,111 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from app.metrics import registry, Counter, Histogram
+
+admission_rejected = registry.register(Counter(
+    "admission_rejected_total", "Количество запросов, отклоненных ограничением нагрузки", ("route_class", "reason")))
+admission_wait_duration = registry.register(Histogram(
+    "admission_wait_seconds", "Время ожидания запроса в очереди ограничения нагрузки", ("route_class",)))
+
+
+# запрос отклонен из-за перегрузки; retry_after - через сколько секунд имеет смысл повторить
+class Overloaded(Exception):
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class}: {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ограничение одновременно выполняемых тяжелых запросов одного класса маршрутов: не больше max_concurrent
+# выполняются, не больше max_queue ждут в порядке очереди не дольше queue_timeout секунд, остальные сразу
+# отклоняются (Overloaded). так отчеты не занимают весь пул соединений и не задерживают легкие запросы
+class AdmissionLimiter:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = deque()
+        # сглаженное время выполнения запроса: по нему оценивается Retry-After
+        self.avg_duration = 0.0
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    # выполнение compute() в пределах ограничения
+    async def run(self, compute):
+        await self.acquire()
+        start_time = time.perf_counter()
+        try:
+            return await compute()
+        finally:
+            duration = time.perf_counter() - start_time
+            self.avg_duration = duration if not self.avg_duration else 0.9 * self.avg_duration + 0.1 * duration
+            self.release()
+
+    async def acquire(self):
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            admission_rejected.inc((self.name, "queue_full"))
+            raise Overloaded(self.name, "queue_full", self.retry_after())
+
+        # место передается ожидающему напрямую при освобождении (release), поэтому очередь не обгоняют
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # место могло быть передано одновременно с таймаутом или отменой: отдаем его следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._forget(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            admission_rejected.inc((self.name, "queue_timeout"))
+            raise Overloaded(self.name, "queue_timeout", self.retry_after())
+        finally:
+            admission_wait_duration.observe((self.name,), time.perf_counter() - start_time)
+        self.admitted += 1
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _forget(self, waiter):
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    # оценка времени до освобождения места для нового запроса: очередь перед ним, деленная на число мест
+    def retry_after(self):
+        estimate = self.avg_duration * (len(self.waiters) + 1) / self.max_concurrent
+        return min(max(math.ceil(estimate), 1), 60)
+
+    def stats(self):
+        return {"max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "active": self.active,
+                "queued": len(self.waiters),
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_duration_ms": self.avg_duration * 1000}
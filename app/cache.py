@@ -0,0 +1,93 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial
+
+
+# кэш результатов с ограниченным размером (вытеснение давно не использованных записей), временем жизни
+# записей и объединением одновременных одинаковых запросов в одно вычисление
+class TTLCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # ключ -> (время истечения, значение, теги)
+        self.in_flight = {}           # ключ -> (задача вычисления, теги)
+        # версия тега увеличивается при инвалидации: результат, вычисленный до нее, не сохраняется
+        self.tag_versions = {}
+        # тег -> ключи сохраненных записей с этим тегом, чтобы инвалидация не просматривала весь кэш
+        self.tag_keys = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # значение из кэша или результат compute(); теги используются для инвалидации
+    async def get_or_compute(self, key, ttl, compute, tags=()):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._remove(key)
+            self.expirations += 1
+
+        if key in self.in_flight:
+            self.coalesced += 1
+            task = self.in_flight[key][0]
+        else:
+            self.misses += 1
+            versions = tuple(self.tag_versions.get(tag, 0) for tag in tags)
+            task = asyncio.ensure_future(compute())
+            self.in_flight[key] = (task, tags)
+            task.add_done_callback(partial(self._store, key, ttl, tags, versions))
+        # отмена одного из ожидающих запросов не должна прерывать вычисление для остальных
+        return await asyncio.shield(task)
+
+    def _store(self, key, ttl, tags, versions, task):
+        if self.in_flight.get(key, (None,))[0] is task:
+            del self.in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if versions != tuple(self.tag_versions.get(tag, 0) for tag in tags):
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + ttl, task.result(), tags)
+        for tag in tags:
+            self.tag_keys.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        for tag in self.entries.pop(key)[2]:
+            keys = self.tag_keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tag_keys[tag]
+
+    # удаление всех записей с указанным тегом (в том числе еще вычисляемых)
+    def invalidate(self, tag):
+        for key in self.tag_keys.get(tag, set()).copy():
+            self._remove(key)
+            self.invalidations += 1
+        in_flight = [key for key, (task, tags) in self.in_flight.items() if tag in tags]
+        # версия нужна только для уже идущих вычислений, поэтому словарь версий растет лишь при таких совпадениях
+        if in_flight:
+            self.tag_versions[tag] = self.tag_versions.get(tag, 0) + 1
+        for key in in_flight:
+            del self.in_flight[key]
+
+    def stats(self):
+        return {"size": len(self.entries),
+                "max_size": self.max_size,
+                "in_flight": len(self.in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations}
@@ -4,6 +4,133 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Settings:
+    # хранилище: "postgres" - сервер PostgreSQL, "sqlite" - встроенная база в файле DB_PATH (для одного сервера)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "postgres")
+    DB_PATH: str = os.getenv("DB_PATH", "petitions.db")
+    # встроенная база: количество соединений для чтения и размер кэша подготовленных запросов на соединение
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", 4))
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
+
     DB_HOST: str = os.getenv("DB_HOST")
+    DB_PORT: int = int(os.getenv("DB_PORT", 5432))
+    DB_USER: str = os.getenv("DB_USER")
+    DB_PASSWORD: str = os.getenv("DB_PASSWORD")
+    DB_NAME: str = os.getenv("DB_NAME", "Petitions")
+
+    # размеры пула соединений и таймауты (в секундах)
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    DB_ACQUIRE_TIMEOUT: float = float(os.getenv("DB_ACQUIRE_TIMEOUT", 5))
+    DB_QUERY_TIMEOUT: float = float(os.getenv("DB_QUERY_TIMEOUT", 10))
+    DB_CLOSE_TIMEOUT: float = float(os.getenv("DB_CLOSE_TIMEOUT", 10))
+
+    PHOTOS_DIRECTORY: str = os.getenv("PHOTOS_DIRECTORY", "photos/")
+    # ограничения на фотографии: размер одного файла, суммарный размер и количество на петицию (в байтах)
+    MAX_PHOTO_SIZE: int = int(os.getenv("MAX_PHOTO_SIZE", 10 * 1024 * 1024))
+    MAX_PETITION_PHOTOS_SIZE: int = int(os.getenv("MAX_PETITION_PHOTOS_SIZE", 50 * 1024 * 1024))
+    MAX_PETITION_PHOTOS: int = int(os.getenv("MAX_PETITION_PHOTOS", 10))
+    # адрес, по которому клиенты получают изображения
+    PUBLIC_BASE_URL: str = os.getenv("PUBLIC_BASE_URL", "http://127.0.0.1:8002").rstrip("/")
+    # кэш небольших изображений в памяти: общий объем и максимальный размер файла (в байтах)
+    IMAGE_CACHE_SIZE: int = int(os.getenv("IMAGE_CACHE_SIZE", 32 * 1024 * 1024))
+    IMAGE_CACHE_MAX_FILE_SIZE: int = int(os.getenv("IMAGE_CACHE_MAX_FILE_SIZE", 256 * 1024))
+    # время кэширования изображений клиентами (в секундах)
+    IMAGE_MAX_AGE: int = int(os.getenv("IMAGE_MAX_AGE", 365 * 24 * 3600))
+
+    # импорт петиций из NDJSON: петиций в одной пакетной вставке, максимальная длина строки
+    # (по умолчанию вмещает фотографии петиции в base64) и объем результатов, хранимых в памяти до записи на диск
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+    IMPORT_MAX_LINE_SIZE: int = int(os.getenv("IMPORT_MAX_LINE_SIZE", MAX_PETITION_PHOTOS_SIZE * 4 // 3 + 1024 * 1024))
+    IMPORT_RESULTS_MEMORY_SIZE: int = int(os.getenv("IMPORT_RESULTS_MEMORY_SIZE", 1024 * 1024))
+
+    # уведомления о смене статуса: адресов в одном пакете, пауза диспетчера при пустой очереди
+    # и время (в секундах), на которое выданный пакет скрывается от других потребителей до подтверждения
+    NOTIFICATION_PAGE_SIZE: int = int(os.getenv("NOTIFICATION_PAGE_SIZE", 1000))
+    NOTIFICATION_IDLE_INTERVAL: float = float(os.getenv("NOTIFICATION_IDLE_INTERVAL", 1))
+    NOTIFICATION_LEASE: int = int(os.getenv("NOTIFICATION_LEASE", 60))
+
+    # кэш полной информации о петициях: максимальное число петиций и время жизни записи (в секундах).
+    # запись сбрасывается при лайке, смене статуса и загрузке фото; время жизни ограничивает устаревание
+    # при нескольких процессах приложения
+    PETITION_CACHE_SIZE: int = int(os.getenv("PETITION_CACHE_SIZE", 10000))
+    PETITION_CACHE_TTL: float = float(os.getenv("PETITION_CACHE_TTL", 10))
+
+    # списки петиций: сколько разных минут хранить в кэше отформатированных дат
+    DATE_CACHE_SIZE: int = int(os.getenv("DATE_CACHE_SIZE", 100000))
+
+    # поиск петиций: вклад лайков в релевантность (релевантность текста умножается на 1 + вес * ln(1 + лайки))
+    SEARCH_LIKES_WEIGHT: float = float(os.getenv("SEARCH_LIKES_WEIGHT", 0.2))
+
+    # петиции в тренде: за сколько секунд вес лайка уменьшается вдвое, сколько петиций хранить в рейтинге
+    # каждого города и как часто (в секундах) восстанавливать рейтинг по таблице LIKES - так учитываются лайки,
+    # поставленные через другие процессы приложения (0 - только при старте)
+    TRENDING_HALF_LIFE: float = float(os.getenv("TRENDING_HALF_LIFE", 24 * 3600))
+    TRENDING_CAPACITY: int = int(os.getenv("TRENDING_CAPACITY", 100))
+    TRENDING_REFRESH_INTERVAL: float = float(os.getenv("TRENDING_REFRESH_INTERVAL", 600))
+
+    # кэш аналитики: максимальное число записей и время жизни (в секундах) для каждого периода
+    ANALYTICS_CACHE_SIZE: int = int(os.getenv("ANALYTICS_CACHE_SIZE", 1024))
+    ANALYTICS_CACHE_TTL: dict = {"day": float(os.getenv("ANALYTICS_CACHE_TTL_DAY", 10)),
+                                 "week": float(os.getenv("ANALYTICS_CACHE_TTL_WEEK", 30)),
+                                 "month": float(os.getenv("ANALYTICS_CACHE_TTL_MONTH", 60)),
+                                 "year": float(os.getenv("ANALYTICS_CACHE_TTL_YEAR", 300)),
+                                 "detailed": float(os.getenv("ANALYTICS_CACHE_TTL_DETAILED", 60))}
+
+    # ограничение нагрузки от тяжелых маршрутов (только при промахе кэша аналитики): сколько запросов класса
+    # выполняются одновременно, сколько ждут в очереди и сколько секунд (дальше - 503 с Retry-After).
+    # reports - подробный анализ (7 параллельных запросов к БД) и временные ряды, analytics - краткая аналитика.
+    # reports * 7 + analytics должно быть меньше DB_POOL_MAX_SIZE, чтобы остальным маршрутам хватало соединений
+    ADMISSION_MAX_CONCURRENT: dict = {"reports": int(os.getenv("ADMISSION_MAX_CONCURRENT_REPORTS", 1)),
+                                      "analytics": int(os.getenv("ADMISSION_MAX_CONCURRENT_ANALYTICS", 2))}
+    ADMISSION_MAX_QUEUE: dict = {"reports": int(os.getenv("ADMISSION_MAX_QUEUE_REPORTS", 8)),
+                                 "analytics": int(os.getenv("ADMISSION_MAX_QUEUE_ANALYTICS", 32))}
+    ADMISSION_QUEUE_TIMEOUT: dict = {"reports": float(os.getenv("ADMISSION_QUEUE_TIMEOUT_REPORTS", 5)),
+                                     "analytics": float(os.getenv("ADMISSION_QUEUE_TIMEOUT_ANALYTICS", 1))}
+
+    # журнал ошибок: файл, уровень и сколько байт тела запроса сохранять для записи об ошибке
+    LOG_FILE: str = os.getenv("LOG_FILE", "app.log")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "ERROR")
+    LOG_BODY_SNAPSHOT_SIZE: int = int(os.getenv("LOG_BODY_SNAPSHOT_SIZE", 1024))
+    # ответов 4xx и 503 (ошибки клиента, отказы из-за перегрузки) в журнале не больше стольких в минуту на код ответа
+    LOG_RATE_LIMIT: int = int(os.getenv("LOG_RATE_LIMIT", 20))
+
+    # остановка по SIGTERM/SIGINT: сколько секунд после сигнала отвечать 503 на /ready, прежде чем ждать
+    # запросов в обработке (балансировщик должен успеть исключить процесс), и сколько секунд ждать их завершения.
+    # только после этого сигнал передается серверу, и он перестает принимать соединения
+    SHUTDOWN_DRAIN_DELAY: float = float(os.getenv("SHUTDOWN_DRAIN_DELAY", 5))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", 30))
+
+    # проверка настроек при старте приложения: список найденных ошибок
+    def validate(self):
+        errors = []
+        if self.DB_BACKEND not in ("postgres", "sqlite"):
+            errors.append(f"DB_BACKEND: неизвестное хранилище {self.DB_BACKEND!r}")
+        if self.DB_BACKEND == "postgres":
+            for name in ("DB_HOST", "DB_USER", "DB_NAME"):
+                if not getattr(self, name):
+                    errors.append(f"{name}: не задан")
+            if not 1 <= self.DB_POOL_MIN_SIZE <= self.DB_POOL_MAX_SIZE:
+                errors.append("DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE: нужно 1 <= DB_POOL_MIN_SIZE <= DB_POOL_MAX_SIZE")
+        for name in ("DB_ACQUIRE_TIMEOUT", "DB_QUERY_TIMEOUT", "DB_CLOSE_TIMEOUT", "IMPORT_BATCH_SIZE",
+                     "NOTIFICATION_PAGE_SIZE", "NOTIFICATION_IDLE_INTERVAL", "NOTIFICATION_LEASE", "PETITION_CACHE_SIZE",
+                     "ANALYTICS_CACHE_SIZE", "DATE_CACHE_SIZE", "TRENDING_HALF_LIFE", "TRENDING_CAPACITY",
+                     "LOG_RATE_LIMIT"):
+            if getattr(self, name) <= 0:
+                errors.append(f"{name}: должно быть больше нуля")
+        for name in ("ADMISSION_MAX_CONCURRENT", "ADMISSION_QUEUE_TIMEOUT"):
+            for route_class, value in getattr(self, name).items():
+                if value <= 0:
+                    errors.append(f"{name}_{route_class.upper()}: должно быть больше нуля")
+        for route_class, value in self.ADMISSION_MAX_QUEUE.items():
+            if value < 0:
+                errors.append(f"ADMISSION_MAX_QUEUE_{route_class.upper()}: не может быть отрицательным")
+        if self.TRENDING_REFRESH_INTERVAL < 0:
+            errors.append("TRENDING_REFRESH_INTERVAL: не может быть отрицательным")
+        for name in ("SHUTDOWN_DRAIN_DELAY", "SHUTDOWN_DRAIN_TIMEOUT"):
+            if getattr(self, name) < 0:
+                errors.append(f"{name}: не может быть отрицательным")
+        return errors
 
 settings = Settings()
+
+PHOTOS_DIRECTORY = settings.PHOTOS_DIRECTORY
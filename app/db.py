@@ -1,6 +1,202 @@
-from pymongo import MongoClient
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
 
 from app.config import settings
+from app.sqlite_db import SQLiteDatabase
+from app.metrics import (registry, Gauge, current_method, db_query_duration, db_query_errors,
+                         db_pool_wait_duration)
+
+
+class Database:
+    dialect = "postgres"
+
+    def __init__(self, host, port, user, password, database,
+                 min_size, max_size, acquire_timeout, query_timeout, close_timeout, server_settings=None):
+        self.connect_kwargs = dict(host=host, port=port, user=user, password=password, database=database,
+                                   server_settings=server_settings)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.query_timeout = query_timeout
+        self.close_timeout = close_timeout
+        self.pool = None
+
+        # счетчики для статистики пула
+        self.waiting = 0
+        self.acquired_total = 0
+        self.acquire_timeouts = 0
+        self.query_timeouts = 0
+        self.query_errors = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    # открытие пула соединений (вызывается при старте приложения)
+    async def connect(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(min_size=self.min_size,
+                                                  max_size=self.max_size,
+                                                  command_timeout=self.query_timeout,
+                                                  **self.connect_kwargs)
+
+    # закрытие пула: ждем возврата соединений, по истечении таймаута закрываем принудительно
+    async def close(self):
+        if self.pool is None:
+            return
+        pool, self.pool = self.pool, None
+        try:
+            await asyncio.wait_for(pool.close(), timeout=self.close_timeout)
+        except asyncio.TimeoutError:
+            pool.terminate()
+
+    # получение соединения из пула с учетом времени ожидания
+    @asynccontextmanager
+    async def _acquire(self, operation):
+        if self.pool is None:
+            raise RuntimeError("Database pool is not initialized")
+        self.waiting += 1
+        start_time = time.perf_counter()
+        try:
+            connection = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        query_start_time = time.perf_counter()
+        wait_time = query_start_time - start_time
+        self.acquired_total += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        method = current_method.get()
+        db_pool_wait_duration.observe((method,), wait_time)
+        try:
+            yield connection
+        except asyncio.TimeoutError:
+            self.query_timeouts += 1
+            db_query_errors.inc((method, operation, "TimeoutError"))
+            raise
+        except Exception as e:
+            self.query_errors += 1
+            db_query_errors.inc((method, operation, type(e).__name__))
+            raise
+        finally:
+            db_query_duration.observe((method, operation), time.perf_counter() - query_start_time)
+            await self.pool.release(connection)
+
+    # статистика пула соединений
+    def stats(self):
+        return {"min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self.pool.get_size() if self.pool else 0,
+                "idle": self.pool.get_idle_size() if self.pool else 0,
+                "waiting": self.waiting,
+                "acquired_total": self.acquired_total,
+                "acquire_timeouts": self.acquire_timeouts,
+                "query_timeouts": self.query_timeouts,
+                "query_errors": self.query_errors,
+                "avg_wait_ms": self.wait_time_total / self.acquired_total * 1000 if self.acquired_total else 0.0,
+                "max_wait_ms": self.wait_time_max * 1000}
+
+    # прогрев при старте: каждое из min_size соединений пула готовит все запросы менеджеров
+    # (разбор и типы параметров на сервере, кодеки типов в asyncpg), ошибки схемы видны до первого запроса.
+    # queries - [(запрос, аргументы)], возвращает число соединений и неподготовленные запросы
+    async def warmup(self, queries):
+        connections = []
+        failed = {}
+        try:
+            for _ in range(self.min_size):
+                connections.append(await self.pool.acquire(timeout=self.acquire_timeout))
+            for connection in connections:
+                for query, _ in queries:
+                    try:
+                        await connection.prepare(query, timeout=self.query_timeout)
+                    except Exception as e:
+                        failed[query] = e
+        finally:
+            for connection in connections:
+                await self.pool.release(connection)
+        return len(connections), failed
+
+    # выборка нескольких записей
+    async def select_query(self, query, *args):
+        async with self._acquire("select") as connection:
+            return await connection.fetch(query, *args, timeout=self.query_timeout)
+
+    # выборка одной записи (None, если записи нет)
+    async def select_one(self, query, *args):
+        async with self._acquire("select_one") as connection:
+            return await connection.fetchrow(query, *args, timeout=self.query_timeout)
+
+    # вставка с возвратом значения первого столбца из RETURNING
+    async def insert_returning(self, query, *args):
+        async with self._acquire("insert_returning") as connection:
+            return await connection.fetchval(query, *args, timeout=self.query_timeout)
+
+    # выполнение запроса без возврата данных
+    async def exec_query(self, query, *args):
+        async with self._acquire("exec") as connection:
+            return await connection.execute(query, *args, timeout=self.query_timeout)
+
+    # транзакция на одном соединении для запросов, которым нужны результаты предыдущих
+    # (интерфейс тот же, что у SQLiteDatabase.transaction)
+    @asynccontextmanager
+    async def transaction(self):
+        async with self._acquire("transaction") as connection:
+            async with connection.transaction():
+                yield PostgresTransaction(connection, self.query_timeout)
+
+    # выполнение нескольких запросов в одной транзакции: {запрос: [аргументы]}
+    async def exec_many_query(self, queries):
+        async with self._acquire("exec_many") as connection:
+            async with connection.transaction():
+                for query, args in queries.items():
+                    await connection.execute(query, *args, timeout=self.query_timeout)
+
+
+# запросы внутри открытой транзакции
+class PostgresTransaction:
+    def __init__(self, connection, query_timeout):
+        self.connection = connection
+        self.query_timeout = query_timeout
+
+    async def select_query(self, query, *args):
+        return await self.connection.fetch(query, *args, timeout=self.query_timeout)
+
+    async def select_one(self, query, *args):
+        return await self.connection.fetchrow(query, *args, timeout=self.query_timeout)
+
+    async def insert_returning(self, query, *args):
+        return await self.connection.fetchval(query, *args, timeout=self.query_timeout)
+
+    async def exec_query(self, query, *args):
+        return await self.connection.execute(query, *args, timeout=self.query_timeout)
+
+
+if settings.DB_BACKEND == "sqlite":
+    db = SQLiteDatabase(settings.DB_PATH,
+                        read_pool_size=settings.DB_READ_POOL_SIZE,
+                        statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+                        busy_timeout=settings.DB_ACQUIRE_TIMEOUT)
+elif settings.DB_BACKEND == "postgres":
+    db = Database(host=settings.DB_HOST,
+                  port=settings.DB_PORT,
+                  user=settings.DB_USER,
+                  password=settings.DB_PASSWORD,
+                  database=settings.DB_NAME,
+                  min_size=settings.DB_POOL_MIN_SIZE,
+                  max_size=settings.DB_POOL_MAX_SIZE,
+                  acquire_timeout=settings.DB_ACQUIRE_TIMEOUT,
+                  query_timeout=settings.DB_QUERY_TIMEOUT,
+                  close_timeout=settings.DB_CLOSE_TIMEOUT)
+else:
+    raise ValueError(f"Unknown DB_BACKEND: {settings.DB_BACKEND}")
 
-client = MongoClient(settings.DB_HOST)
-db = client['Petitions']
\ No newline at end of file
+registry.register(Gauge("db_pool_waiting", "Количество запросов, ожидающих соединение", lambda: db.waiting))
+if db.dialect == "postgres":
+    registry.register(Gauge("db_pool_size", "Количество соединений в пуле",
+                            lambda: db.pool.get_size() if db.pool else 0))
+    registry.register(Gauge("db_pool_idle", "Количество свободных соединений в пуле",
+                            lambda: db.pool.get_idle_size() if db.pool else 0))
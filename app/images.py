@@ -0,0 +1,188 @@
+import asyncio
+import mimetypes
+import os
+import re
+import stat as stat_module
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.config import settings
+from app.photo_storage import photo_storage, is_content_name
+
+
+class ImageNotFound(Exception):
+    pass
+
+
+# кэш небольших изображений в памяти с ограничением по суммарному размеру;
+# хранятся только файлы с именем по хешу содержимого, поэтому записи не устаревают
+class ImageCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # имя -> (содержимое, время изменения)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return entry
+
+    def put(self, name, data, mtime):
+        if name in self.entries or len(data) > self.max_bytes:
+            return
+        self.entries[name] = (data, mtime)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self.entries),
+                "size": self.size,
+                "max_size": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+
+# разбор заголовка Range для одного диапазона: (начало, конец включительно), None - заголовок не применим,
+# ValueError - диапазон за пределами файла
+def parse_range(header, size):
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if start == "":
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, end, chunk_size=64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(min(chunk_size, end - start + 1))
+
+
+# отдача изображений с условными запросами (ETag/Last-Modified), диапазонами и кэшированием
+class ImageServer:
+    def __init__(self, storage, cache, max_cached_file, max_age):
+        self.storage = storage
+        self.cache = cache
+        self.max_cached_file = max_cached_file
+        self.max_age = max_age
+
+    # путь к файлу и признак неизменяемости; старые ссылки вида photos/<id>/<файл> отдаются только из PHOTOS_DIRECTORY
+    def resolve(self, image_path):
+        if is_content_name(image_path):
+            return os.path.join(self.storage.content_directory, image_path), True
+        root = os.path.realpath(self.storage.directory)
+        path = os.path.realpath(image_path)
+        if os.path.commonpath([root, path]) != root:
+            raise ImageNotFound(image_path)
+        return path, False
+
+    async def load(self, image_path):
+        path, immutable = self.resolve(image_path)
+        if immutable:
+            cached = self.cache.get(image_path)
+            if cached is not None:
+                data, mtime = cached
+                return path, immutable, len(data), mtime, data
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise ImageNotFound(image_path)
+        if not stat_module.S_ISREG(stat.st_mode):
+            raise ImageNotFound(image_path)
+        data = None
+        if stat.st_size <= self.max_cached_file:
+            data = await asyncio.to_thread(read_range, path, 0, stat.st_size - 1, stat.st_size + 1)
+            if immutable:
+                self.cache.put(image_path, data, stat.st_mtime)
+        return path, immutable, stat.st_size, stat.st_mtime, data
+
+    async def respond(self, image_path, request_headers):
+        path, immutable, size, mtime, data = await self.load(image_path)
+        if immutable:
+            etag = '"' + os.path.splitext(image_path)[0] + '"'
+            cache_control = f"public, max-age={self.max_age}, immutable"
+        else:
+            etag = f'"{int(mtime * 1000):x}-{size:x}"'
+            cache_control = "no-cache"
+        last_modified = formatdate(mtime, usegmt=True)
+        headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": cache_control,
+                   "Accept-Ranges": "bytes"}
+
+        if self.not_modified(request_headers, etag, mtime):
+            return Response(status_code=304, headers=headers)
+
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        byte_range = None
+        range_header = request_headers.get("range")
+        if range_header and request_headers.get("if-range", etag) in (etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        if byte_range is None:
+            if data is not None:
+                return Response(data, media_type=media_type, headers=headers)
+            return FileResponse(path, media_type=media_type, headers=headers)
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        if data is not None:
+            return Response(data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(self.stream_range(path, start, end), status_code=206, media_type=media_type,
+                                 headers=headers)
+
+    @staticmethod
+    def not_modified(request_headers, etag, mtime):
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    async def stream_range(path, start, end):
+        while start <= end:
+            chunk = await asyncio.to_thread(read_range, path, start, end)
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
+
+    def stats(self):
+        return self.cache.stats()
+
+
+image_server = ImageServer(photo_storage,
+                           ImageCache(settings.IMAGE_CACHE_SIZE),
+                           max_cached_file=settings.IMAGE_CACHE_MAX_FILE_SIZE,
+                           max_age=settings.IMAGE_MAX_AGE)
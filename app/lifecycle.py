@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import logging
+import signal
+import threading
+import time
+
+from app.query_shapes import record_queries
+
+logger = logging.getLogger("app.lifecycle")
+
+
+# состояние процесса приложения для проверок готовности и плавной остановки:
+# starting - идет прогрев, ready - принимает запросы, not_ready - часть запросов не подготовилась при прогреве
+# (схема БД не соответствует коду), draining - остановка, ждем завершения запросов в обработке
+class Lifecycle:
+    def __init__(self):
+        self.state = "starting"
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.warmup = None
+        self.rejected = 0
+
+    # прогрев хранилища: подготовка запросов всех менеджеров на соединениях пула
+    async def warm_up(self, db):
+        start_time = time.perf_counter()
+        queries = await record_queries(db.dialect)
+        connections, failed = await db.warmup(queries)
+        for query, error in failed.items():
+            logger.error("Запрос не подготовлен при прогреве: %s: %s: %s",
+                         " ".join(query.split())[:200], type(error).__name__, error)
+        self.warmup = {"connections": connections,
+                       "queries": len(queries),
+                       "failed": len(failed),
+                       "duration_ms": (time.perf_counter() - start_time) * 1000}
+        self.state = "not_ready" if failed else "ready"
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def draining(self):
+        return self.state == "draining"
+
+    def request_started(self):
+        self.in_flight += 1
+        self.idle.clear()
+
+    def request_finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.idle.set()
+
+    # остановка: новые запросы отклоняются, ждем завершения начатых не дольше timeout секунд.
+    # возвращает количество запросов, которые так и не завершились
+    async def drain(self, timeout):
+        self.state = "draining"
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Остановка: не дождались завершения запросов (%d в обработке)", self.in_flight)
+        return self.in_flight
+
+    # перехват сигналов остановки, установленных сервером (uvicorn ставит свои обработчики до старта приложения).
+    # сервер по сигналу сразу перестает принимать соединения, поэтому сигнал передается ему не сразу:
+    # процесс переходит в draining (/ready отвечает 503, новые запросы получают 503 с Connection: close),
+    # ждет delay секунд, пока балансировщик исключит его по проверке готовности, затем завершения начатых
+    # запросов (не дольше timeout секунд). повторный сигнал передается серверу немедленно
+    def install_signal_handlers(self, delay, timeout, signals=(signal.SIGTERM, signal.SIGINT)):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            previous = signal.getsignal(sig)
+            # обработчика сервера нет (приложение запущено не из uvicorn)
+            if previous in (signal.SIG_DFL, signal.SIG_IGN, None, signal.default_int_handler):
+                continue
+            signal.signal(sig, functools.partial(self._on_signal, loop, previous, delay, timeout))
+
+    def _on_signal(self, loop, previous, delay, timeout, sig, frame):
+        if self.draining:
+            previous(sig, frame)
+            return
+        self.state = "draining"
+        logger.warning("Получен сигнал %s: остановка через %.0f сек после завершения запросов", signal.Signals(sig).name, delay)
+        loop.call_soon_threadsafe(lambda: loop.create_task(self._drain_and_exit(previous, delay, timeout, sig, frame)))
+
+    async def _drain_and_exit(self, previous, delay, timeout, sig, frame):
+        await asyncio.sleep(delay)
+        await self.drain(timeout)
+        previous(sig, frame)
+
+    def stats(self):
+        return {"state": self.state,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "warmup": self.warmup}
@@ -0,0 +1,18 @@
+import logging
+import logging.handlers
+import queue
+
+
+# логирование через очередь: обработчики с записью в файл работают в отдельном потоке QueueListener,
+# цикл событий только кладет запись в очередь
+def configure_logging(filename, level):
+    file_handler = logging.FileHandler(filename, encoding="utf-8", delay=True)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    return logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
@@ -0,0 +1,136 @@
+from app.metrics import instrumented
+
+
+# очередь уведомлений о смене статуса петиции. смена статуса только добавляет запись в NOTIFICATION_OUTBOX,
+# диспетчер постранично превращает подписчиков петиции в пакеты NOTIFICATION_BATCH,
+# а внешний отправитель забирает пакеты (с арендой на время отправки) и подтверждает их
+@instrumented("notification_manager")
+class NotificationManager:
+        def __init__(self, db):
+                self.db = db
+
+        # следующая страница получателей для самого давнего доступного уведомления: пакет с адресами
+        # (в первом пакете - автор петиции), сдвиг курсора по email или удаление уведомления после последней страницы.
+        # обработанное уведомление уходит в конец очереди, чтобы большие рассылки не задерживали остальные.
+        # возвращает количество адресов в пакете или None, если очередь пуста
+        async def dispatch_next(self, page_size):
+                if self.db.dialect == "sqlite":
+                        return await self._dispatch_next_sqlite(page_size)
+                query = '''WITH job AS (
+                        SELECT ID, PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, RECIPIENT_CURSOR
+                        FROM NOTIFICATION_OUTBOX
+                        WHERE AVAILABLE_AT <= CURRENT_TIMESTAMP
+                        ORDER BY AVAILABLE_AT, ID
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                ), petitioner AS (
+                        SELECT p.PETITIONER_EMAIL FROM PETITION p JOIN job ON p.ID = job.PETITION_ID
+                ), page AS (
+                        SELECT l.USER_EMAIL
+                        FROM job
+                        JOIN petitioner ON TRUE
+                        JOIN LIKES l ON l.PETITION_ID = job.PETITION_ID
+                        WHERE l.USER_EMAIL > COALESCE(job.RECIPIENT_CURSOR, '') AND l.USER_EMAIL <> petitioner.PETITIONER_EMAIL
+                        ORDER BY l.USER_EMAIL
+                        LIMIT $1
+                ), recipients AS (
+                        SELECT PETITIONER_EMAIL AS EMAIL FROM petitioner, job WHERE job.RECIPIENT_CURSOR IS NULL
+                        UNION ALL
+                        SELECT USER_EMAIL FROM page
+                ), batch AS (
+                        INSERT INTO NOTIFICATION_BATCH (PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, EMAILS)
+                        SELECT PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, ARRAY(SELECT EMAIL FROM recipients)
+                        FROM job WHERE EXISTS (SELECT 1 FROM recipients)
+                ), finished AS (
+                        DELETE FROM NOTIFICATION_OUTBOX o USING job
+                        WHERE o.ID = job.ID AND (SELECT COUNT(*) FROM page) < $1
+                ), advanced AS (
+                        UPDATE NOTIFICATION_OUTBOX o
+                        SET RECIPIENT_CURSOR = (SELECT MAX(USER_EMAIL) FROM page), AVAILABLE_AT = CURRENT_TIMESTAMP
+                        FROM job
+                        WHERE o.ID = job.ID AND (SELECT COUNT(*) FROM page) >= $1
+                )
+                SELECT (SELECT COUNT(*) FROM recipients) AS recipients FROM job;'''
+                result = await self.db.select_one(query, page_size)
+                return result["recipients"] if result else None
+
+        # вариант для SQLite: те же шаги в одной транзакции (запись и так выполняется одним потоком)
+        async def _dispatch_next_sqlite(self, page_size):
+                job_query = '''SELECT o.ID, o.PETITION_ID, o.PETITION_STATUS, o.COMMENT_DESCRIPTION, o.RECIPIENT_CURSOR,
+                                      p.PETITIONER_EMAIL
+                FROM NOTIFICATION_OUTBOX o
+                LEFT JOIN PETITION p ON p.ID = o.PETITION_ID
+                WHERE o.AVAILABLE_AT <= CURRENT_TIMESTAMP
+                ORDER BY o.AVAILABLE_AT, o.ID
+                LIMIT 1;'''
+                page_query = '''SELECT USER_EMAIL FROM LIKES
+                WHERE PETITION_ID = $1 AND USER_EMAIL > $2 AND USER_EMAIL <> $3
+                ORDER BY USER_EMAIL
+                LIMIT $4;'''
+                batch_query = '''INSERT INTO NOTIFICATION_BATCH (PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, EMAILS)
+                VALUES ($1, $2, $3, $4);'''
+                async with self.db.transaction() as transaction:
+                        job = await transaction.select_one(job_query)
+                        if job is None:
+                                return None
+                        page = []
+                        if job["petitioner_email"] is not None:
+                                page = [r["user_email"] for r in await transaction.select_query(
+                                        page_query, job["petition_id"], job["recipient_cursor"] or "", job["petitioner_email"], page_size)]
+                        emails = page if job["recipient_cursor"] is not None or job["petitioner_email"] is None \
+                                else [job["petitioner_email"], *page]
+                        if emails:
+                                await transaction.exec_query(batch_query, job["petition_id"], job["petition_status"],
+                                                             job["comment_description"], emails)
+                        if len(page) < page_size:
+                                await transaction.exec_query('''DELETE FROM NOTIFICATION_OUTBOX WHERE ID = $1;''', job["id"])
+                        else:
+                                await transaction.exec_query('''UPDATE NOTIFICATION_OUTBOX
+                                SET RECIPIENT_CURSOR = $2, AVAILABLE_AT = CURRENT_TIMESTAMP WHERE ID = $1;''', job["id"], page[-1])
+                return len(emails)
+
+        # выдача пакетов, ожидающих отправки: пакет скрывается от других потребителей на lease секунд,
+        # неподтвержденный за это время пакет выдается снова
+        async def claim_batches(self, limit, lease):
+                if self.db.dialect == "sqlite":
+                        return await self._claim_batches_sqlite(limit, lease)
+                query = '''UPDATE NOTIFICATION_BATCH
+                SET AVAILABLE_AT = CURRENT_TIMESTAMP + MAKE_INTERVAL(secs => $2)
+                WHERE ID IN (SELECT ID FROM NOTIFICATION_BATCH
+                             WHERE AVAILABLE_AT <= CURRENT_TIMESTAMP
+                             ORDER BY AVAILABLE_AT, ID
+                             LIMIT $1
+                             FOR UPDATE SKIP LOCKED)
+                RETURNING ID, PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, EMAILS;'''
+                result = await self.db.select_query(query, limit, float(lease))
+                return self._format_batches(result)
+
+        async def _claim_batches_sqlite(self, limit, lease):
+                select_query = '''SELECT ID, PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION, EMAILS
+                FROM NOTIFICATION_BATCH
+                WHERE AVAILABLE_AT <= CURRENT_TIMESTAMP
+                ORDER BY AVAILABLE_AT, ID
+                LIMIT $1;'''
+                lease_query = '''UPDATE NOTIFICATION_BATCH SET AVAILABLE_AT = DATETIME('now', $2)
+                WHERE ID IN (SELECT value FROM JSON_EACH($1));'''
+                async with self.db.transaction() as transaction:
+                        result = await transaction.select_query(select_query, limit)
+                        if result:
+                                await transaction.exec_query(lease_query, [r["id"] for r in result], f"+{lease} seconds")
+                return self._format_batches(result)
+
+        def _format_batches(self, rows):
+                return [{"id": r["id"],
+                         "petition_id": r["petition_id"],
+                         "status": r["petition_status"],
+                         "comment": r["comment_description"],
+                         "emails": list(r["emails"])} for r in sorted(rows, key=lambda r: r["id"])]
+
+        # подтверждение отправки: пакеты удаляются, возвращается количество удаленных
+        async def ack_batches(self, ids):
+                if self.db.dialect == "sqlite":
+                        query = '''DELETE FROM NOTIFICATION_BATCH WHERE ID IN (SELECT value FROM JSON_EACH($1)) RETURNING ID;'''
+                else:
+                        query = '''DELETE FROM NOTIFICATION_BATCH WHERE ID = ANY($1::INTEGER[]) RETURNING ID;'''
+                return len(await self.db.select_query(query, list(ids)))
+
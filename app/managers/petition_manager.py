@@ -1,19 +1,93 @@
-import os
-from app.config import PHOTOS_DIRECTORY
-import base64
+import json
+import logging
+import re
+from typing import List
 
-from app.models import PetitionStatus, NewPetition, Like, PetitionWithHeader, City, CityWithType, AdminPetition, Comment
+from pydantic import ValidationError
 
+from app.models import (PetitionStatus, PetitionStatusBatch, NewPetition, ImportedPetition, Like, LikeState,
+                        PageParams, CityPetitionsPage, AdminPetitionsPage, PetitionData, PetitionSearch,
+                        TrendingPetitions)
+from app.pagination import paginate, split_page, encode_cursor, decode_cursor
+from app.serialization import PetitionPage, petition_rows, admin_petition_rows
+from app.metrics import instrumented
+from app.photo_storage import photo_storage, photo_url, PhotoTooLarge, InvalidPhoto
+
+logger = logging.getLogger("app.managers")
+
+# окончания русских слов, отбрасываемые при поиске в SQLite (в PostgreSQL основу слова находит словарь russian)
+RUSSIAN_ENDINGS = sorted(["иями", "ями", "ами", "иях", "ях", "ах", "ией", "ием", "ого", "его", "ому", "ему", "ыми", "ими",
+                          "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ей", "ом", "ем", "ам", "ям", "ов", "ев",
+                          "ую", "юю", "ия", "ья", "ь", "а", "я", "о", "е", "ы", "и", "у", "ю", "й"], key=len, reverse=True)
+
+
+# запрос FTS5 из текста поиска: каждое слово без окончания ищется по префиксу, все слова обязательны
+def fts_query(text):
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        for ending in RUSSIAN_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 2:
+                word = word[:-len(ending)]
+                break
+        terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+# постановка уведомления о смене статуса в очередь (выполняется в транзакции смены статуса)
+NOTIFICATION_OUTBOX_QUERY = '''INSERT INTO NOTIFICATION_OUTBOX (PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION)
+SELECT ID, $2, $3 FROM PETITION WHERE ID = $1;'''
+
+# запросы для SQLite, где нет изменяющих данные CTE: в PostgreSQL эти шаги выполняются одним запросом
+# увеличение и уменьшение счетчика в сводной статистике
+STATS_INCREMENT_QUERY = '''INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+VALUES ($1, $2, $3, $4, $5, $6, 1)
+ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+DO UPDATE SET PETITIONS_COUNT = PETITIONS_COUNT + 1;'''
+STATS_DECREMENT_QUERY = '''UPDATE PETITION_STATS_DAILY SET PETITIONS_COUNT = PETITIONS_COUNT - 1
+WHERE DAY = $1 AND REGION = $2 AND CITY_NAME = $3 AND CATEGORY = $4 AND IS_INITIATIVE = $5 AND PETITION_STATUS = $6;'''
+# установка и снятие лайка (возвращают строку, только если лайк действительно добавлен или удален)
+# время лайка задается явно: в базах, дополненных миграцией, у столбца LIKED_AT постоянное значение по умолчанию.
+# при снятии возвращается возраст лайка в секундах (для рейтинга петиций в тренде)
+LIKE_INSERT_QUERY = '''INSERT INTO LIKES (PETITION_ID, USER_EMAIL, LIKED_AT)
+SELECT ID, $2, CURRENT_TIMESTAMP FROM PETITION WHERE ID = $1
+ON CONFLICT (PETITION_ID, USER_EMAIL) DO NOTHING
+RETURNING PETITION_ID;'''
+LIKE_DELETE_QUERY = '''DELETE FROM LIKES WHERE PETITION_ID = $1 AND USER_EMAIL = $2
+RETURNING PETITION_ID, (JULIANDAY('now') - JULIANDAY(LIKED_AT)) * 86400 AS AGE;'''
+# пакетное добавление импортированных петиций в сводную статистику по диапазону их id
+STATS_IMPORT_QUERY = '''INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+SELECT DATE(SUBMISSION_TIME), REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, COUNT(*)
+FROM PETITION WHERE ID BETWEEN $1 AND $2
+GROUP BY DATE(SUBMISSION_TIME), REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS
+ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+DO UPDATE SET PETITIONS_COUNT = PETITIONS_COUNT + excluded.PETITIONS_COUNT;'''
+LIKES_COUNT_UPDATE_QUERY = '''UPDATE PETITION SET LIKES_COUNT = LIKES_COUNT + $2 WHERE ID = $1
+RETURNING LIKES_COUNT, REGION, CITY_NAME, IS_INITIATIVE, PETITION_STATUS;'''
+
+@instrumented("petition_manager")
 class PetitionManager:
-        def __init__(self, db):
+        def __init__(self, db, storage=photo_storage, trending=None):
                 self.db = db
+                self.photo_storage = storage
+                # рейтинг петиций в тренде (TrendingTracker), обновляется при установке и снятии лайков
+                self.trending = trending
 
         # создание новой петиции
+        # вместе с петицией увеличивается счетчик в сводной статистике PETITION_STATS_DAILY
         async def add_new_petition(self, petition: NewPetition):
-                
-                query = '''INSERT INTO PETITION 
-                (IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME) 
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8) RETURNING ID;'''
+                if self.db.dialect == "sqlite":
+                        return await self._add_new_petition_sqlite(petition)
+                query = '''WITH new_petition AS (
+                        INSERT INTO PETITION 
+                        (IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME) 
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        RETURNING ID, DATE(SUBMISSION_TIME) AS DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS
+                ), stats AS (
+                        INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                        SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, 1 FROM new_petition
+                        ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+                        DO UPDATE SET PETITIONS_COUNT = PETITION_STATS_DAILY.PETITIONS_COUNT + 1
+                )
+                SELECT ID FROM new_petition;'''
                 petition_id = await self.db.insert_returning(query, petition.is_initiative,
                                                                 petition.category,
                                                                 petition.petition_description,
@@ -23,76 +97,480 @@ class PetitionManager:
                                                                 petition.region,
                                                                 petition.city_name)
                 return {"petition_id": f"{petition_id}"}
+
+        # вариант для SQLite, где нет изменяющих данные CTE: те же два запроса в одной транзакции
+        async def _add_new_petition_sqlite(self, petition: NewPetition):
+                query = '''INSERT INTO PETITION
+                (IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                RETURNING ID, DATE(SUBMISSION_TIME) AS DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS;'''
+                async with self.db.transaction() as transaction:
+                        new_petition = await transaction.select_one(query, petition.is_initiative,
+                                                                    petition.category,
+                                                                    petition.petition_description,
+                                                                    petition.petitioner_email,
+                                                                    petition.address,
+                                                                    petition.header,
+                                                                    petition.region,
+                                                                    petition.city_name)
+                        await transaction.exec_query(STATS_INCREMENT_QUERY, new_petition["day"], new_petition["region"],
+                                                     new_petition["city_name"], new_petition["category"],
+                                                     new_petition["is_initiative"], new_petition["petition_status"])
+                return {"petition_id": f"{new_petition['id']}"}
         
-        # обновление статуса петиции
+        # импорт петиций из строк NDJSON (номер строки, содержимое): строки проверяются по одной,
+        # петиции записываются пакетами не больше batch_size строк, так что в памяти держится только текущий пакет.
+        # выдает для каждого пакета результаты по строкам (id петиции или ошибка) и регионы добавленных петиций
+        async def import_petition_lines(self, lines, batch_size):
+                batch, results = [], []
+                async for number, line in lines:
+                        petition = await self._parse_imported_petition(number, line, results)
+                        if petition is not None:
+                                batch.append((number, *petition))
+                        if len(batch) + len(results) >= batch_size:
+                                yield await self._import_batch(batch, results)
+                                batch, results = [], []
+                if batch or results:
+                        yield await self._import_batch(batch, results)
+
+        # проверка строки импорта и сохранение ее фотографий: (петиция, имена фото) или None с ошибкой в results
+        async def _parse_imported_petition(self, number, line, results):
+                if line is None:
+                        results.append({"line": number, "error": "Line is too long"})
+                        return None
+                try:
+                        petition = ImportedPetition.model_validate_json(line)
+                except ValidationError as e:
+                        errors = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in e.errors())
+                        results.append({"line": number, "error": errors})
+                        return None
+                names = []
+                if petition.photos:
+                        try:
+                                self.photo_storage.check_base64_photos(petition.photos)
+                                names = await self.save_petition_photos(petition.photos)
+                        except (PhotoTooLarge, InvalidPhoto) as e:
+                                results.append({"line": number, "error": str(e)})
+                                return None
+                        # содержимое фотографий уже на диске и в пакете не нужно
+                        petition.photos = None
+                return petition, names
+
+        async def _import_batch(self, batch, results):
+                regions = set()
+                if batch:
+                        try:
+                                ids = await self.import_petitions([(petition, names) for _, petition, names in batch])
+                                results.extend({"line": number, "petition_id": petition_id}
+                                               for (number, _, _), petition_id in zip(batch, ids))
+                                regions = {petition.region for _, petition, _ in batch}
+                        except Exception:
+                                logger.exception("Ошибка записи пакета импорта (строки %d-%d)", batch[0][0], batch[-1][0])
+                                results.extend({"line": number, "error": "Failed to save petition"} for number, _, _ in batch)
+                results.sort(key=lambda result: result["line"])
+                return results, regions
+
+        # пакетная вставка импортированных петиций [(петиция, имена фото)] одним запросом вместе со сводной статистикой.
+        # id выделяются из последовательности заранее, поэтому возвращаются в порядке входного списка
+        async def import_petitions(self, records):
+                if self.db.dialect == "sqlite":
+                        return await self._import_petitions_sqlite(records)
+                query = '''WITH input AS (
+                        SELECT NEXTVAL(PG_GET_SERIAL_SEQUENCE('petition', 'id')) AS ID, t.*
+                        FROM UNNEST($1::BOOLEAN[], $2::TEXT[], $3::TEXT[], $4::TEXT[], $5::TEXT[], $6::TEXT[], $7::TEXT[],
+                                    $8::TEXT[], $9::TEXT[], $10::TIMESTAMP[], $11::TEXT[])
+                             WITH ORDINALITY AS t(IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER,
+                                                  REGION, CITY_NAME, PETITION_STATUS, SUBMISSION_TIME, PHOTOS, ORD)
+                ), new_petitions AS (
+                        INSERT INTO PETITION
+                        (ID, IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME,
+                         PETITION_STATUS, SUBMISSION_TIME, PHOTOS)
+                        SELECT ID, IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME,
+                               COALESCE(PETITION_STATUS, 'На модерации'), COALESCE(SUBMISSION_TIME, CURRENT_TIMESTAMP),
+                               ARRAY(SELECT JSONB_ARRAY_ELEMENTS_TEXT(PHOTOS::JSONB))
+                        FROM input
+                        RETURNING DATE(SUBMISSION_TIME) AS DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS
+                ), stats AS (
+                        INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                        SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, COUNT(*) FROM new_petitions
+                        GROUP BY DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS
+                        ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+                        DO UPDATE SET PETITIONS_COUNT = PETITION_STATS_DAILY.PETITIONS_COUNT + EXCLUDED.PETITIONS_COUNT
+                )
+                SELECT ID FROM input ORDER BY ORD;'''
+                petitions = [petition for petition, _ in records]
+                result = await self.db.select_query(query,
+                                                    [p.is_initiative for p in petitions],
+                                                    [p.category for p in petitions],
+                                                    [p.petition_description for p in petitions],
+                                                    [p.petitioner_email for p in petitions],
+                                                    [p.address for p in petitions],
+                                                    [p.header for p in petitions],
+                                                    [p.region for p in petitions],
+                                                    [p.city_name for p in petitions],
+                                                    [p.petition_status for p in petitions],
+                                                    [p.submission_time for p in petitions],
+                                                    [json.dumps(names) for _, names in records])
+                return [r["id"] for r in result]
+
+        # вариант для SQLite: id следуют за максимальным (запись блокирована транзакцией), вставка одним запросом
+        # с несколькими строками VALUES, затем сводная статистика по диапазону новых id
+        async def _import_petitions_sqlite(self, records):
+                rows = []
+                for i in range(len(records)):
+                        n = [f"${i * 12 + j}" for j in range(1, 13)]
+                        rows.append(f"({', '.join(n[:9])}, COALESCE({n[9]}, 'На модерации'), "
+                                    f"COALESCE({n[10]}, CURRENT_TIMESTAMP), {n[11]})")
+                query = f'''INSERT INTO PETITION
+                (ID, IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL, ADDRESS, HEADER, REGION, CITY_NAME,
+                 PETITION_STATUS, SUBMISSION_TIME, PHOTOS)
+                VALUES {', '.join(rows)};'''
+                async with self.db.transaction() as transaction:
+                        first_id = await transaction.insert_returning('''SELECT COALESCE(MAX(ID), 0) + 1 FROM PETITION;''')
+                        ids = list(range(first_id, first_id + len(records)))
+                        args = []
+                        for petition_id, (p, names) in zip(ids, records):
+                                args += [petition_id, p.is_initiative, p.category, p.petition_description, p.petitioner_email,
+                                         p.address, p.header, p.region, p.city_name, p.petition_status, p.submission_time, names]
+                        await transaction.exec_query(query, *args)
+                        await transaction.exec_query(STATS_IMPORT_QUERY, ids[0], ids[-1])
+                return ids
+
+        # обновление статуса петиции: петиция переносится в сводной статистике из старого статуса в новый.
+        # в той же транзакции в очередь добавляется уведомление подписчикам (рассылку готовит NotificationManager)
         async def update_petition_status(self, petition: PetitionStatus):
-                query1 = f'''UPDATE PETITION
-                             SET PETITION_STATUS = $1
-                             WHERE ID = $2;'''
+                if self.db.dialect == "sqlite":
+                        return await self._update_petition_status_sqlite(petition)
+                query1 = f'''WITH old AS (
+                                SELECT ID, PETITION_STATUS FROM PETITION WHERE ID = $2 FOR UPDATE
+                             ), updated AS (
+                                UPDATE PETITION p
+                                SET PETITION_STATUS = $1
+                                FROM old
+                                WHERE p.ID = old.ID
+                                RETURNING old.PETITION_STATUS AS OLD_STATUS, DATE(p.SUBMISSION_TIME) AS DAY,
+                                          p.REGION, p.CITY_NAME, p.CATEGORY, p.IS_INITIATIVE
+                             ), moved_out AS (
+                                UPDATE PETITION_STATS_DAILY s
+                                SET PETITIONS_COUNT = s.PETITIONS_COUNT - 1
+                                FROM updated u
+                                WHERE u.OLD_STATUS != $1
+                                AND s.REGION = u.REGION AND s.CITY_NAME = u.CITY_NAME AND s.DAY = u.DAY
+                                AND s.IS_INITIATIVE = u.IS_INITIATIVE AND s.CATEGORY = u.CATEGORY
+                                AND s.PETITION_STATUS = u.OLD_STATUS
+                             )
+                             INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                             SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, $1, 1 FROM updated
+                             WHERE OLD_STATUS != $1
+                             ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+                             DO UPDATE SET PETITIONS_COUNT = PETITION_STATS_DAILY.PETITIONS_COUNT + 1;'''
                 query2 = f'''INSERT INTO COMMENTS (PETITION_ID, USER_ID, COMMENT_DESCRIPTION)
                              VALUES ($1, $2, $3);'''
                 try:
                         await self.db.exec_many_query({
                         query1: [petition.status, petition.id],
-                        query2: [petition.id, petition.admin_id, petition.comment]
+                        query2: [petition.id, petition.admin_id, petition.comment],
+                        NOTIFICATION_OUTBOX_QUERY: [petition.id, petition.status, petition.comment]
                         })
                         return True
                 except:
                         return False
+
+        async def _update_petition_status_sqlite(self, petition: PetitionStatus):
+                old_query = '''SELECT PETITION_STATUS, DATE(SUBMISSION_TIME) AS DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE
+                FROM PETITION WHERE ID = $1;'''
+                update_query = '''UPDATE PETITION SET PETITION_STATUS = $1 WHERE ID = $2;'''
+                comment_query = '''INSERT INTO COMMENTS (PETITION_ID, USER_ID, COMMENT_DESCRIPTION) VALUES ($1, $2, $3);'''
+                try:
+                        async with self.db.transaction() as transaction:
+                                old = await transaction.select_one(old_query, petition.id)
+                                if old is None:
+                                        return False
+                                if old["petition_status"] != petition.status:
+                                        await transaction.exec_query(update_query, petition.status, petition.id)
+                                        keys = (old["day"], old["region"], old["city_name"], old["category"], old["is_initiative"])
+                                        await transaction.exec_query(STATS_DECREMENT_QUERY, *keys, old["petition_status"])
+                                        await transaction.exec_query(STATS_INCREMENT_QUERY, *keys, petition.status)
+                                await transaction.exec_query(comment_query, petition.id, petition.admin_id, petition.comment)
+                                await transaction.exec_query(NOTIFICATION_OUTBOX_QUERY, petition.id, petition.status, petition.comment)
+                        return True
+                except:
+                        return False
         
-        # получение списка пользователей, которые подписались под заявкой + сам заявитель
-        async def get_petitioners_email(self, petition: PetitionStatus):
-                query = f'''
-                        SELECT PETITIONER_EMAIL AS email
-                        FROM PETITION
-                        WHERE ID = $1
-
-                        UNION
-
-                        SELECT USER_EMAIL AS email
-                        FROM PETITION 
-                        JOIN LIKES ON PETITION.ID = LIKES.PETITION_ID
-                        WHERE PETITION.ID = $1;
-                '''
-                results = await self.db.select_query(query, petition.id)
-                emails = [item["email"] for item in results]
-                return {"petitioner_emails": emails}
-        
-        # установка лайка на петицию
+        # пакетная модерация: права админа на город проверяются сразу для всех петиций, смена статусов, сводная
+        # статистика, комментарии и очередь уведомлений записываются одним запросом.
+        # для повторяющихся id применяется последнее изменение. возвращает результат для каждого элемента пакета:
+        # "updated", "forbidden" (петиция в другом городе) или "not_found"
+        async def update_petition_statuses(self, batch: PetitionStatusBatch):
+                if self.db.dialect == "sqlite":
+                        return await self._update_petition_statuses_sqlite(batch)
+                query = '''WITH input AS (
+                        SELECT DISTINCT ON (ID) ID, STATUS, COMMENT
+                        FROM UNNEST($1::INTEGER[], $2::TEXT[], $3::TEXT[], $4::INTEGER[]) AS t(ID, STATUS, COMMENT, ORD)
+                        ORDER BY ID, ORD DESC
+                ), old AS (
+                        SELECT p.ID, p.PETITION_STATUS, p.REGION, p.CITY_NAME
+                        FROM PETITION p JOIN input i ON p.ID = i.ID
+                        ORDER BY p.ID
+                        FOR UPDATE
+                ), allowed AS (
+                        SELECT o.ID, o.PETITION_STATUS AS OLD_STATUS, i.STATUS, i.COMMENT
+                        FROM old o JOIN input i ON i.ID = o.ID
+                        WHERE o.REGION = $6 AND o.CITY_NAME = $7
+                ), updated AS (
+                        UPDATE PETITION p
+                        SET PETITION_STATUS = a.STATUS
+                        FROM allowed a
+                        WHERE p.ID = a.ID AND a.OLD_STATUS != a.STATUS
+                        RETURNING a.OLD_STATUS, a.STATUS, DATE(p.SUBMISSION_TIME) AS DAY,
+                                  p.REGION, p.CITY_NAME, p.CATEGORY, p.IS_INITIATIVE
+                ), stats AS (
+                        INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                        SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, SUM(D)
+                        FROM (SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, OLD_STATUS AS PETITION_STATUS, -1 AS D FROM updated
+                              UNION ALL
+                              SELECT DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, STATUS, 1 FROM updated) changes
+                        GROUP BY DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS
+                        HAVING SUM(D) != 0
+                        ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+                        DO UPDATE SET PETITIONS_COUNT = PETITION_STATS_DAILY.PETITIONS_COUNT + EXCLUDED.PETITIONS_COUNT
+                ), comments AS (
+                        INSERT INTO COMMENTS (PETITION_ID, USER_ID, COMMENT_DESCRIPTION)
+                        SELECT ID, $5, COMMENT FROM allowed
+                ), notifications AS (
+                        INSERT INTO NOTIFICATION_OUTBOX (PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION)
+                        SELECT ID, STATUS, COMMENT FROM allowed
+                )
+                SELECT i.ID, o.ID IS NOT NULL AS petition_exists, o.REGION = $6 AND o.CITY_NAME = $7 AS allowed
+                FROM input i LEFT JOIN old o ON o.ID = i.ID;'''
+                changes = batch.changes
+                result = await self.db.select_query(query,
+                                                    [c.id for c in changes],
+                                                    [c.status for c in changes],
+                                                    [c.comment for c in changes],
+                                                    list(range(len(changes))),
+                                                    batch.admin_id, batch.admin_region, batch.admin_city)
+                outcomes = {r["id"]: "updated" if r["allowed"] else "forbidden" if r["petition_exists"] else "not_found"
+                            for r in result}
+                return [{"id": c.id, "result": outcomes[c.id]} for c in changes]
+
+        # вариант для SQLite: выборка петиций, изменения пакетом через JSON_EACH и сводная статистика
+        # по посчитанным здесь разностям, все в одной транзакции
+        async def _update_petition_statuses_sqlite(self, batch: PetitionStatusBatch):
+                select_query = '''SELECT ID, PETITION_STATUS, DATE(SUBMISSION_TIME) AS DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE
+                FROM PETITION WHERE ID IN (SELECT value FROM JSON_EACH($1));'''
+                update_query = '''UPDATE PETITION SET PETITION_STATUS = c.STATUS
+                FROM (SELECT JSON_EXTRACT(value, '$[0]') AS ID, JSON_EXTRACT(value, '$[1]') AS STATUS FROM JSON_EACH($1)) c
+                WHERE PETITION.ID = c.ID;'''
+                stats_query = '''INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                SELECT JSON_EXTRACT(value, '$[0]'), JSON_EXTRACT(value, '$[1]'), JSON_EXTRACT(value, '$[2]'), JSON_EXTRACT(value, '$[3]'),
+                       JSON_EXTRACT(value, '$[4]'), JSON_EXTRACT(value, '$[5]'), JSON_EXTRACT(value, '$[6]')
+                FROM JSON_EACH($1) WHERE TRUE
+                ON CONFLICT (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+                DO UPDATE SET PETITIONS_COUNT = PETITIONS_COUNT + excluded.PETITIONS_COUNT;'''
+                comments_query = '''INSERT INTO COMMENTS (PETITION_ID, USER_ID, COMMENT_DESCRIPTION)
+                SELECT JSON_EXTRACT(value, '$[0]'), $2, JSON_EXTRACT(value, '$[2]') FROM JSON_EACH($1);'''
+                notifications_query = '''INSERT INTO NOTIFICATION_OUTBOX (PETITION_ID, PETITION_STATUS, COMMENT_DESCRIPTION)
+                SELECT JSON_EXTRACT(value, '$[0]'), JSON_EXTRACT(value, '$[1]'), JSON_EXTRACT(value, '$[2]') FROM JSON_EACH($1);'''
+                # для повторяющихся id остается последнее изменение
+                changes = {c.id: c for c in batch.changes}
+                async with self.db.transaction() as transaction:
+                        old = {r["id"]: r for r in await transaction.select_query(select_query, list(changes))}
+                        allowed = [c for petition_id, c in changes.items() if petition_id in old
+                                   and (old[petition_id]["region"], old[petition_id]["city_name"]) == (batch.admin_region, batch.admin_city)]
+                        deltas = {}
+                        for c in allowed:
+                                r = old[c.id]
+                                if r["petition_status"] == c.status:
+                                        continue
+                                keys = (r["day"], r["region"], r["city_name"], r["category"], r["is_initiative"])
+                                deltas[(*keys, r["petition_status"])] = deltas.get((*keys, r["petition_status"]), 0) - 1
+                                deltas[(*keys, c.status)] = deltas.get((*keys, c.status), 0) + 1
+                        if allowed:
+                                rows = [[c.id, c.status, c.comment] for c in allowed]
+                                await transaction.exec_query(update_query, rows)
+                                stats = [[*keys, delta] for keys, delta in deltas.items() if delta]
+                                if stats:
+                                        await transaction.exec_query(stats_query, stats)
+                                await transaction.exec_query(comments_query, rows, batch.admin_id)
+                                await transaction.exec_query(notifications_query, rows)
+                allowed_ids = {c.id for c in allowed}
+                return [{"id": c.id,
+                         "result": "updated" if c.id in allowed_ids else "forbidden" if c.id in old else "not_found"}
+                        for c in batch.changes]
+
+        # установка или снятие лайка одним запросом: уникальный ключ (PETITION_ID, USER_EMAIL)
+        # не дает создать дубликат при одновременных кликах, счетчик меняется в том же запросе.
+        # возвращает новое состояние лайка и количество лайков или None, если петиции нет
         async def like_petition(self, like: Like):
-                petition_query = '''SELECT * FROM PETITIONS WHERE ID = $1;'''
-                existing_petition = await self.db.select_one(petition_query, like.petition_id)
+                if self.db.dialect == "sqlite":
+                        return await self._like_petition_sqlite(like)
+                query = '''WITH removed AS (
+                        DELETE FROM LIKES WHERE PETITION_ID = $1 AND USER_EMAIL = $2
+                        RETURNING PETITION_ID, EXTRACT(EPOCH FROM LOCALTIMESTAMP - LIKED_AT)::FLOAT8 AS AGE
+                ), added AS (
+                        INSERT INTO LIKES (PETITION_ID, USER_EMAIL)
+                        SELECT ID, $2 FROM PETITION
+                        WHERE ID = $1 AND NOT EXISTS (SELECT 1 FROM removed)
+                        ON CONFLICT (PETITION_ID, USER_EMAIL) DO NOTHING
+                        RETURNING PETITION_ID
+                )
+                UPDATE PETITION
+                SET LIKES_COUNT = LIKES_COUNT + (SELECT COUNT(*) FROM added) - (SELECT COUNT(*) FROM removed)
+                WHERE ID = $1
+                RETURNING NOT EXISTS (SELECT 1 FROM removed) AS liked, LIKES_COUNT,
+                          EXISTS (SELECT 1 FROM added) AS added, (SELECT AGE FROM removed) AS unliked_age,
+                          REGION, CITY_NAME, IS_INITIATIVE, PETITION_STATUS;'''
+                result = await self.db.select_one(query, like.petition_id, like.user_email)
+                if not result:
+                        return None
+                if result["added"] or result["unliked_age"] is not None:
+                        await self._track_likes([(like.petition_id, result, result["unliked_age"])])
+                return {"liked": result["liked"], "likes_count": result["likes_count"]}
 
-                if not existing_petition:
-                        return False
+        async def _like_petition_sqlite(self, like: Like):
+                async with self.db.transaction() as transaction:
+                        removed = await transaction.select_one(LIKE_DELETE_QUERY, like.petition_id, like.user_email)
+                        if removed:
+                                liked, delta = False, -1
+                        else:
+                                liked = await transaction.select_one(LIKE_INSERT_QUERY, like.petition_id, like.user_email) is not None
+                                delta = 1 if liked else 0
+                        result = await transaction.select_one(LIKES_COUNT_UPDATE_QUERY, like.petition_id, delta)
+                if not result:
+                        return None
+                if delta:
+                        await self._track_likes([(like.petition_id, result, removed["age"] if removed else None)])
+                return {"liked": liked, "likes_count": result["likes_count"]}
 
-                query = '''SELECT * FROM LIKES WHERE PETITION_ID = $1 AND USER_EMAIL = $2;'''
-                existing_like = await self.db.select_one(query, like.petition_id, like.user_email)
+        # учет установленных и снятых лайков в рейтинге петиций в тренде: changes - (id петиции, строка петиции
+        # с регионом, городом, типом и статусом, возраст снятого лайка в секундах или None, если лайк установлен).
+        # для петиций, которых нет в заполненном рейтинге, полный счет загружается из БД одним запросом
+        async def _track_likes(self, changes):
+                if self.trending is None:
+                        return
+                unknown = set()
+                for petition_id, r, unliked_age in changes:
+                        group = (r["region"], r["city_name"], r["is_initiative"])
+                        if unliked_age is not None:
+                                self.trending.unlike(petition_id, group, r["petition_status"], unliked_age)
+                        elif not self.trending.like(petition_id, group, r["petition_status"]):
+                                unknown.add(petition_id)
+                if unknown:
+                        await self.track_petitions(sorted(unknown))
 
-                if not existing_like:
-                        query = '''INSERT INTO LIKES (PETITION_ID, USER_EMAIL) VALUES ($1, $2);'''
-                        await self.db.exec_query(query, like.petition_id, like.user_email)
-                else:
-                        query = '''DELETE FROM LIKES WHERE PETITION_ID = $1 AND USER_EMAIL = $2;'''
-                        await self.db.exec_query(query, like.petition_id, like.user_email)
-                return
+        # обновление рейтинга петиций в тренде полными счетами петиций из БД (после смены статуса - петиция
+        # убирается из рейтинга или попадает в него с уже набранными лайками)
+        async def track_petitions(self, petition_ids):
+                if self.trending is not None and petition_ids:
+                        await self.trending.load_scores(self.get_petition_like_scores, petition_ids)
+
+        # пакетная установка состояний лайков (для лайков, накопленных клиентом офлайн).
+        # для повторяющихся пар (петиция, пользователь) применяется последнее состояние
+        async def like_petitions(self, likes: List[LikeState]):
+                if self.db.dialect == "sqlite":
+                        return await self._like_petitions_sqlite(likes)
+                query = '''WITH input AS (
+                        SELECT DISTINCT ON (PETITION_ID, USER_EMAIL) PETITION_ID, USER_EMAIL, LIKED
+                        FROM UNNEST($1::INTEGER[], $2::TEXT[], $3::BOOLEAN[], $4::INTEGER[])
+                             AS t(PETITION_ID, USER_EMAIL, LIKED, ORD)
+                        ORDER BY PETITION_ID, USER_EMAIL, ORD DESC
+                ), removed AS (
+                        DELETE FROM LIKES l USING input i
+                        WHERE l.PETITION_ID = i.PETITION_ID AND l.USER_EMAIL = i.USER_EMAIL AND NOT i.LIKED
+                        RETURNING l.PETITION_ID, l.USER_EMAIL, EXTRACT(EPOCH FROM LOCALTIMESTAMP - l.LIKED_AT)::FLOAT8 AS AGE
+                ), added AS (
+                        INSERT INTO LIKES (PETITION_ID, USER_EMAIL)
+                        SELECT i.PETITION_ID, i.USER_EMAIL FROM input i
+                        JOIN PETITION p ON p.ID = i.PETITION_ID
+                        WHERE i.LIKED
+                        ON CONFLICT (PETITION_ID, USER_EMAIL) DO NOTHING
+                        RETURNING PETITION_ID, USER_EMAIL
+                ), delta AS (
+                        SELECT PETITION_ID, SUM(d) AS d
+                        FROM (SELECT PETITION_ID, 1 AS d FROM added
+                              UNION ALL
+                              SELECT PETITION_ID, -1 AS d FROM removed) changes
+                        GROUP BY PETITION_ID
+                ), updated AS (
+                        UPDATE PETITION p SET LIKES_COUNT = p.LIKES_COUNT + delta.d
+                        FROM delta WHERE p.ID = delta.PETITION_ID
+                        RETURNING p.ID, p.LIKES_COUNT
+                )
+                SELECT i.PETITION_ID, i.USER_EMAIL, i.LIKED, p.ID IS NOT NULL AS petition_exists,
+                       COALESCE(u.LIKES_COUNT, p.LIKES_COUNT) AS likes_count,
+                       a.PETITION_ID IS NOT NULL AS added, r.AGE AS unliked_age,
+                       p.REGION, p.CITY_NAME, p.IS_INITIATIVE, p.PETITION_STATUS
+                FROM input i
+                LEFT JOIN PETITION p ON p.ID = i.PETITION_ID
+                LEFT JOIN updated u ON u.ID = i.PETITION_ID
+                LEFT JOIN added a ON a.PETITION_ID = i.PETITION_ID AND a.USER_EMAIL = i.USER_EMAIL
+                LEFT JOIN removed r ON r.PETITION_ID = i.PETITION_ID AND r.USER_EMAIL = i.USER_EMAIL;'''
+                result = await self.db.select_query(query,
+                                                    [l.petition_id for l in likes],
+                                                    [l.user_email for l in likes],
+                                                    [l.liked for l in likes],
+                                                    list(range(len(likes))))
+                await self._track_likes([(r["petition_id"], r, r["unliked_age"]) for r in result
+                                         if r["added"] or r["unliked_age"] is not None])
+                return [{"petition_id": r["petition_id"],
+                         "user_email": r["user_email"],
+                         "liked": r["liked"] if r["petition_exists"] else None,
+                         "likes_count": r["likes_count"]} for r in result]
+
+        async def _like_petitions_sqlite(self, likes: List[LikeState]):
+                # для повторяющихся пар остается последнее состояние
+                states = {(l.petition_id, l.user_email): l.liked for l in likes}
+                deltas = {}
+                changes = []  # (id петиции, возраст снятого лайка или None) для рейтинга петиций в тренде
+                async with self.db.transaction() as transaction:
+                        for (petition_id, user_email), liked in states.items():
+                                query = LIKE_INSERT_QUERY if liked else LIKE_DELETE_QUERY
+                                changed = await transaction.select_one(query, petition_id, user_email)
+                                if changed:
+                                        deltas[petition_id] = deltas.get(petition_id, 0) + (1 if liked else -1)
+                                        changes.append((petition_id, None if liked else changed["age"]))
+                        counts = {}
+                        petitions = {}
+                        for petition_id in {petition_id for petition_id, _ in states}:
+                                result = await transaction.select_one(LIKES_COUNT_UPDATE_QUERY, petition_id, deltas.get(petition_id, 0))
+                                if result:
+                                        counts[petition_id] = result["likes_count"]
+                                        petitions[petition_id] = result
+                await self._track_likes([(petition_id, petitions[petition_id], unliked_age) for petition_id, unliked_age in changes])
+                return [{"petition_id": petition_id,
+                         "user_email": user_email,
+                         "liked": liked if petition_id in counts else None,
+                         "likes_count": counts.get(petition_id)} for (petition_id, user_email), liked in states.items()]
 
-        # получаем список петиций пользователя по его email
-        async def get_petitions_by_email(self, email):
+        # пересчет счетчиков лайков по таблице LIKES, возвращает id исправленных петиций.
+        # подсчет берется из снимка на начало запроса: лайк, зафиксированный во время пересчета, был бы затерт
+        # устаревшим значением. поэтому на время пересчета запись в LIKES блокируется (лайки ждут его окончания):
+        # в PostgreSQL - LOCK TABLE в транзакции, в SQLite - блокировкой записи транзакции
+        async def reconcile_likes_count(self):
+                query = '''UPDATE PETITION
+                SET LIKES_COUNT = c.ACTUAL_COUNT
+                FROM (SELECT p.ID AS PETITION_ID, COUNT(l.PETITION_ID) AS ACTUAL_COUNT
+                      FROM PETITION p
+                      LEFT JOIN LIKES l ON p.ID = l.PETITION_ID
+                      GROUP BY p.ID) c
+                WHERE PETITION.ID = c.PETITION_ID AND PETITION.LIKES_COUNT != c.ACTUAL_COUNT
+                RETURNING ID;'''
+                async with self.db.transaction() as transaction:
+                        if self.db.dialect == "postgres":
+                                await transaction.exec_query("LOCK TABLE LIKES IN SHARE MODE;")
+                        result = await transaction.select_query(query)
+                return [r["id"] for r in result]
+
+        # получаем страницу петиций пользователя по его email
+        async def get_petitions_by_email(self, email, page: PageParams):
                 query = '''SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS,
-                         p.SUBMISSION_TIME, COUNT(l.petition_id) AS likes_count
+                         p.SUBMISSION_TIME, p.LIKES_COUNT
                         FROM petition p
-                        LEFT JOIN likes l ON p.ID = l.PETITION_ID
-                        WHERE p.PETITIONER_EMAIL = $1 
-                        GROUP BY p.ID;'''
-                result = await self.db.select_query(query, email)
-                petitions = [PetitionWithHeader(id=r["id"], 
-                                        header=r["header"], 
-                                        status=r["petition_status"], 
-                                        address=r["address"], 
-                                        date=r["submission_time"].strftime('%d.%m.%Y %H:%M'),
-                                        likes = r["likes_count"]) for r in result]
-                return petitions
+                        WHERE p.PETITIONER_EMAIL = $1'''
+                query, args = paginate(query, [email], page)
+                result, next_cursor = split_page(await self.db.select_query(query, *args), page)
+                return PetitionPage(petition_rows(result), next_cursor)
 
         # проверка соответствия города петиции
         async def check_city_by_petition_id(self, petition: PetitionStatus):
@@ -102,85 +580,275 @@ class PetitionManager:
                 result = await self.db.select_query(query, petition.id, petition.admin_region, petition.admin_city)
                 return result[0]["result"]
 
-        # получаем список петиций и краткую информацию о них в указанном городе
-        async def get_city_petitions(self, city: CityWithType):
-                query = '''SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, COUNT(l.petition_id) AS likes_count
+        # получаем страницу петиций и краткую информацию о них в указанном городе
+        async def get_city_petitions(self, city: CityPetitionsPage):
+                query = '''SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT
                 FROM petition p
-                LEFT JOIN likes l ON p.ID = l.PETITION_ID
                 WHERE p.REGION = $1 
                 AND p.CITY_NAME = $2 
                 AND p.PETITION_STATUS != 'На модерации'
-                AND p.IS_INITIATIVE = $3
-                GROUP BY p.ID;
-                '''
-                result = await self.db.select_query(query, city.region, city.name, city.is_initiative)
-                petitions = [PetitionWithHeader(id=r["id"], 
-                                        header=r["header"], 
-                                        status=r["petition_status"], 
-                                        address=r["address"], 
-                                        date=r["submission_time"].strftime('%d.%m.%Y %H:%M'),
-                                        likes=r["likes_count"]) for r in result]
-                return petitions
-
-        # получаем список петиций с информацией о них в указанном городе, включая со статусом на модерации (доступно только админам)
-        async def get_admin_petitions(self, city: City):
-                query = '''SELECT p.ID, p.IS_INITIATIVE, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, COUNT(l.petition_id) AS likes_count
+                AND p.IS_INITIATIVE = $3'''
+                query, args = paginate(query, [city.region, city.name, city.is_initiative], city)
+                result, next_cursor = split_page(await self.db.select_query(query, *args), city)
+                return PetitionPage(petition_rows(result), next_cursor)
+
+        # получаем страницу петиций с информацией о них в указанном городе, включая со статусом на модерации (доступно только админам)
+        async def get_admin_petitions(self, city: AdminPetitionsPage):
+                query = '''SELECT p.ID, p.IS_INITIATIVE, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT
                 FROM petition p
-                LEFT JOIN likes l ON p.ID = l.PETITION_ID
                 WHERE p.REGION = $1 
-                AND p.CITY_NAME = $2
-                GROUP BY p.ID;'''
-                result = await self.db.select_query(query, city.region, city.name)
-                petitions = [AdminPetition(id=r["id"],
-                                        header=r["header"], 
-                                        status=r["petition_status"], 
-                                        address=r["address"], 
-                                        date=r["submission_time"].strftime('%d.%m.%Y %H:%M'),
-                                        likes=r["likes_count"],
-                                        type = 'Жалоба' if r["is_initiative"] == False else 'Инициатива') for r in result]
-                return result
-        
-        # получаем полную информацию о петиции
-        async def get_full_petition_info(self, *args):
-                query = '''SELECT p.*, COUNT(l.petition_id) AS likes_count
-                FROM petition p
-                LEFT JOIN likes l ON p.ID = l.PETITION_ID
-                WHERE p.ID = $1
-                GROUP BY p.ID;'''
-                result = await self.db.select_one(query, *args)
-                return result
+                AND p.CITY_NAME = $2'''
+                query, args = paginate(query, [city.region, city.name], city)
+                result, next_cursor = split_page(await self.db.select_query(query, *args), city)
+                return PetitionPage(admin_petition_rows(result), next_cursor, admin=True)
         
-        # получаем комментарии к петиции
-        async def get_petition_comments(self, petition_id):
-                query = '''SELECT SUBMISSION_TIME, COMMENT_DESCRIPTION FROM COMMENTS WHERE PETITION_ID = $1;'''
-                comments = await self.db.select_query(query, petition_id)
-                output_comments = [Comment(date=c["submission_time"].strftime('%d.%m.%Y %H:%M'), data=c["comment_description"]) for c in comments]
-                return output_comments
+        # полнотекстовый поиск по заголовку, адресу и описанию с фильтрами. результаты упорядочены по релевантности
+        # текста, умноженной на 1 + likes_weight * ln(1 + лайки); страницы - по курсору (релевантность, id).
+        # петиции на модерации находятся, только если include_moderation (поиск для админов)
+        async def search_petitions(self, search: PetitionSearch, include_moderation, likes_weight):
+                if self.db.dialect == "sqlite":
+                        text = fts_query(search.query)
+                        if not text:
+                                return PetitionPage([])
+                        query = '''SELECT * FROM (
+                                SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT,
+                                       -BM25(PETITION_SEARCH, 10.0, 5.0, 1.0) * (1 + $2 * LN(1 + p.LIKES_COUNT)) AS RELEVANCE
+                                FROM PETITION_SEARCH
+                                JOIN PETITION p ON p.ID = PETITION_SEARCH.ROWID
+                                WHERE PETITION_SEARCH MATCH $1'''
+                else:
+                        text = search.query
+                        query = '''SELECT * FROM (
+                                SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT,
+                                       (TS_RANK_CD(p.SEARCH_VECTOR, q) * (1 + $2 * LN(1 + p.LIKES_COUNT)))::FLOAT8 AS RELEVANCE
+                                FROM PETITION p, WEBSEARCH_TO_TSQUERY('russian', $1) q
+                                WHERE p.SEARCH_VECTOR @@ q'''
+                args = [text, likes_weight]
+                for column, value in (("p.REGION", search.region), ("p.CITY_NAME", search.city_name),
+                                      ("p.CATEGORY", search.category), ("p.IS_INITIATIVE", search.is_initiative),
+                                      ("p.PETITION_STATUS", search.status)):
+                        if value is not None:
+                                args.append(value)
+                                query += f" AND {column} = ${len(args)}"
+                if not include_moderation:
+                        query += " AND p.PETITION_STATUS != 'На модерации'"
+                query += ") r"
+                if search.cursor is not None:
+                        relevance, petition_id = decode_cursor(search.cursor, "relevance")
+                        args.extend([relevance, petition_id])
+                        query += f" WHERE (r.RELEVANCE, r.ID) < (${len(args) - 1}, ${len(args)})"
+                args.append(search.limit + 1)
+                query += f" ORDER BY r.RELEVANCE DESC, r.ID DESC LIMIT ${len(args)};"
+                result = await self.db.select_query(query, *args)
+                next_cursor = None
+                if len(result) > search.limit:
+                        result = result[:search.limit]
+                        next_cursor = encode_cursor("relevance", result[-1]["relevance"], result[-1]["id"])
+                return PetitionPage(petition_rows(result), next_cursor)
+
+        # полная информация о петиции одним запросом: комментарии собираются в JSON, даты форматируются в БД.
+        # возвращает PetitionData или None, если петиции нет
+        async def get_petition_data(self, petition_id):
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT p.ID, p.HEADER, p.IS_INITIATIVE, p.CATEGORY, p.PETITION_DESCRIPTION, p.PETITION_STATUS,
+                               p.PETITIONER_EMAIL, STRFTIME('%d.%m.%Y %H:%M', p.SUBMISSION_TIME) AS SUBMISSION_TIME, p.ADDRESS,
+                               p.REGION, p.CITY_NAME, p.LIKES_COUNT, p.PHOTOS,
+                               (SELECT JSON_GROUP_ARRAY(JSON_OBJECT('date', STRFTIME('%d.%m.%Y %H:%M', c.SUBMISSION_TIME),
+                                                                    'data', c.COMMENT_DESCRIPTION))
+                                FROM (SELECT SUBMISSION_TIME, COMMENT_DESCRIPTION FROM COMMENTS
+                                      WHERE PETITION_ID = p.ID ORDER BY SUBMISSION_TIME, ID) c) AS COMMENTS
+                        FROM PETITION p
+                        WHERE p.ID = $1;'''
+                else:
+                        query = '''SELECT p.ID, p.HEADER, p.IS_INITIATIVE, p.CATEGORY, p.PETITION_DESCRIPTION, p.PETITION_STATUS,
+                               p.PETITIONER_EMAIL, TO_CHAR(p.SUBMISSION_TIME, 'DD.MM.YYYY HH24:MI') AS SUBMISSION_TIME, p.ADDRESS,
+                               p.REGION, p.CITY_NAME, p.LIKES_COUNT, p.PHOTOS,
+                               COALESCE((SELECT JSON_AGG(JSON_BUILD_OBJECT('date', TO_CHAR(c.SUBMISSION_TIME, 'DD.MM.YYYY HH24:MI'),
+                                                                           'data', c.COMMENT_DESCRIPTION)
+                                                         ORDER BY c.SUBMISSION_TIME, c.ID)
+                                         FROM COMMENTS c WHERE c.PETITION_ID = p.ID), '[]') AS COMMENTS
+                        FROM PETITION p
+                        WHERE p.ID = $1;'''
+                r = await self.db.select_one(query, petition_id)
+                if not r:
+                        return None
+                return PetitionData(id=r["id"],
+                                    header=r["header"],
+                                    is_initiative=r["is_initiative"],
+                                    category=r["category"],
+                                    description=r["petition_description"],
+                                    status=r["petition_status"],
+                                    petitioner_email=r["petitioner_email"],
+                                    submission_time=r["submission_time"],
+                                    address=r["address"],
+                                    region=r["region"],
+                                    city_name=r["city_name"],
+                                    likes_count=r["likes_count"],
+                                    comments=json.loads(r["comments"]),
+                                    photos=[photo_url(name) for name in r["photos"]])
+
         # проверяем лайк пользователя на записи
         async def check_user_like(self, like: Like):
-                query = '''SELECT * FROM LIKES WHERE PETITION_ID = $1 AND USER_EMAIL = $2;'''
-                existing_like = await self.db.select_one(query, like.petition_id, like.user_email)
-                if not existing_like:
-                        return False
-                return True
+                return like.petition_id in await self.get_liked_petitions(like.user_email, [like.petition_id])
+
+        # id петиций из списка, которые лайкнул пользователь: один запрос по индексу (PETITION_ID, USER_EMAIL)
+        async def get_liked_petitions(self, user_email, petition_ids):
+                petition_ids = sorted(set(petition_ids))
+                if not petition_ids:
+                        return []
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT PETITION_ID FROM LIKES
+                        WHERE PETITION_ID IN (SELECT value FROM JSON_EACH($2)) AND USER_EMAIL = $1
+                        ORDER BY PETITION_ID;'''
+                else:
+                        query = '''SELECT PETITION_ID FROM LIKES
+                        WHERE PETITION_ID = ANY($2::INTEGER[]) AND USER_EMAIL = $1
+                        ORDER BY PETITION_ID;'''
+                result = await self.db.select_query(query, user_email, petition_ids)
+                return [r["petition_id"] for r in result]
+
+        # петиции города в тренде: id берутся из рейтинга в памяти (без обращения к LIKES), из БД - только их данные
+        async def get_trending_petitions(self, city: TrendingPetitions):
+                if self.trending is None:
+                        return PetitionPage([])
+                return await self.get_petitions_by_ids(self.trending.top((city.region, city.name, city.is_initiative), city.limit))
+
+        # краткая информация о петициях в порядке переданных id (петиции на модерации пропускаются)
+        async def get_petitions_by_ids(self, petition_ids):
+                if not petition_ids:
+                        return PetitionPage([])
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT
+                        FROM PETITION p
+                        WHERE p.ID IN (SELECT value FROM JSON_EACH($1)) AND p.PETITION_STATUS != 'На модерации';'''
+                else:
+                        query = '''SELECT p.ID, p.HEADER, p.PETITION_STATUS, p.ADDRESS, p.SUBMISSION_TIME, p.LIKES_COUNT
+                        FROM PETITION p
+                        WHERE p.ID = ANY($1::INTEGER[]) AND p.PETITION_STATUS != 'На модерации';'''
+                rows = {r["id"]: r for r in await self.db.select_query(query, list(petition_ids))}
+                return PetitionPage(petition_rows([rows[i] for i in petition_ids if i in rows]))
+
+        # полные счета отдельных петиций для рейтинга в тренде (как в get_like_scores, но с учетом статуса;
+        # петиции без лайков за окно получают счет 0)
+        async def get_petition_like_scores(self, petition_ids, decay, window):
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT p.ID, p.REGION, p.CITY_NAME, p.IS_INITIATIVE, p.PETITION_STATUS,
+                               COALESCE((SELECT SUM(EXP(-$2 * (JULIANDAY('now') - JULIANDAY(l.LIKED_AT)) * 86400))
+                                         FROM LIKES l
+                                         WHERE l.PETITION_ID = p.ID AND l.LIKED_AT > DATETIME('now', '-' || $3 || ' seconds')), 0) AS SCORE
+                        FROM PETITION p
+                        WHERE p.ID IN (SELECT value FROM JSON_EACH($1));'''
+                else:
+                        query = '''SELECT p.ID, p.REGION, p.CITY_NAME, p.IS_INITIATIVE, p.PETITION_STATUS,
+                               COALESCE((SELECT SUM(EXP(-$2::FLOAT8 * EXTRACT(EPOCH FROM LOCALTIMESTAMP - l.LIKED_AT)::FLOAT8))
+                                         FROM LIKES l
+                                         WHERE l.PETITION_ID = p.ID AND l.LIKED_AT > LOCALTIMESTAMP - MAKE_INTERVAL(secs => $3::FLOAT8)), 0) AS SCORE
+                        FROM PETITION p
+                        WHERE p.ID = ANY($1::INTEGER[]);'''
+                return await self.db.select_query(query, list(petition_ids), decay, window)
+
+        # счета петиций для восстановления рейтинга в тренде: сумма весов лайков за последние window секунд,
+        # вес лайка - exp(-decay * возраст в секундах). петиции на модерации не учитываются
+        async def get_like_scores(self, decay, window):
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT p.ID, p.REGION, p.CITY_NAME, p.IS_INITIATIVE, s.SCORE
+                        FROM (SELECT PETITION_ID, SUM(EXP(-$1 * (JULIANDAY('now') - JULIANDAY(LIKED_AT)) * 86400)) AS SCORE
+                              FROM LIKES
+                              WHERE LIKED_AT > DATETIME('now', '-' || $2 || ' seconds')
+                              GROUP BY PETITION_ID) s
+                        JOIN PETITION p ON p.ID = s.PETITION_ID
+                        WHERE p.PETITION_STATUS != 'На модерации';'''
+                else:
+                        query = '''SELECT p.ID, p.REGION, p.CITY_NAME, p.IS_INITIATIVE, s.SCORE
+                        FROM (SELECT PETITION_ID, SUM(EXP(-$1::FLOAT8 * EXTRACT(EPOCH FROM LOCALTIMESTAMP - LIKED_AT)::FLOAT8)) AS SCORE
+                              FROM LIKES
+                              WHERE LIKED_AT > LOCALTIMESTAMP - MAKE_INTERVAL(secs => $2::FLOAT8)
+                              GROUP BY PETITION_ID) s
+                        JOIN PETITION p ON p.ID = s.PETITION_ID
+                        WHERE p.PETITION_STATUS != 'На модерации';'''
+                return await self.db.select_query(query, decay, window)
         
-        # добавляем фотографии петиции
+        # добавляем фотографии петиции, переданные в base64 (декодирование и запись на диск - вне цикла событий)
         async def add_petition_photos(self, petition_id, photos):
-                folder_path = PHOTOS_DIRECTORY + f"{petition_id}"
-                os.mkdir(folder_path)
-                for p in photos:
-                        with open(PHOTOS_DIRECTORY + f'{petition_id}/{p.filename}', 'wb') as f:
-                                f.write(base64.b64decode(p.content))
+                await self.attach_petition_photos(petition_id, await self.save_petition_photos(photos))
+
+        # сохраняем фотографии в base64 в хранилище, возвращаем имена файлов
+        async def save_petition_photos(self, photos):
+                return [await self.photo_storage.save_base64(p.filename, p.content) for p in photos]
+
+        # потоковая загрузка фотографий петиции из multipart-запроса с проверкой ограничений на размер и количество.
+        # по списку manifest, прочитанному до загрузки, слишком большие запросы прерываются сразу; окончательно
+        # ограничения проверяются при добавлении фотографий в петицию (attach_uploaded_photos)
+        async def upload_petition_photos(self, petition_id, manifest, parts):
+                storage = self.photo_storage
+                count, total_size = await storage.get_usage(manifest)
+                names = []
+                upload = None
+                try:
+                        async for event, value in parts:
+                                if event == "file":
+                                        if count >= storage.max_petition_photos:
+                                                raise PhotoTooLarge(f"Petition can have at most {storage.max_petition_photos} photos")
+                                        upload = await storage.open_upload(value, storage.max_petition_size - total_size)
+                                elif event == "data":
+                                        await upload.write(value)
+                                else:
+                                        names.append(await upload.commit())
+                                        count += 1
+                                        total_size += upload.size
+                                        upload = None
+                except BaseException:
+                        if upload is not None:
+                                await upload.abort()
+                        raise
+                if names:
+                        await self.attach_uploaded_photos(petition_id, names)
+                return names
+
+        # добавление загруженных фотографий с проверкой ограничений по текущему списку петиции: строка петиции
+        # блокируется (FOR UPDATE, в SQLite - блокировка записи транзакции), поэтому одновременные загрузки
+        # проверяются по очереди и вместе не превысят ограничения
+        async def attach_uploaded_photos(self, petition_id, names):
+                storage = self.photo_storage
+                if self.db.dialect == "sqlite":
+                        query = '''SELECT PHOTOS FROM PETITION WHERE ID = $1;'''
+                else:
+                        query = '''SELECT PHOTOS FROM PETITION WHERE ID = $1 FOR UPDATE;'''
+                async with self.db.transaction() as transaction:
+                        result = await transaction.select_one(query, petition_id)
+                        if not result:
+                                return
+                        photos = list(dict.fromkeys([*result["photos"], *names]))
+                        count, total_size = await storage.get_usage(photos)
+                        if count > storage.max_petition_photos:
+                                raise PhotoTooLarge(f"Petition can have at most {storage.max_petition_photos} photos")
+                        if total_size > storage.max_petition_size:
+                                raise PhotoTooLarge(f"Petition photos exceed {storage.max_petition_size} bytes")
+                        await transaction.exec_query('''UPDATE PETITION SET PHOTOS = $2 WHERE ID = $1;''', petition_id, photos)
+
+        # дописываем сохраненные файлы в список фотографий петиции (без повторов, с сохранением порядка)
+        async def attach_petition_photos(self, petition_id, names):
+                if self.db.dialect == "sqlite":
+                        return await self._attach_petition_photos_sqlite(petition_id, names)
+                query = '''UPDATE PETITION
+                SET PHOTOS = PHOTOS || ARRAY(SELECT n FROM UNNEST($2::TEXT[]) WITH ORDINALITY AS u(n, i)
+                                             WHERE n <> ALL(PHOTOS) ORDER BY i)
+                WHERE ID = $1;'''
+                await self.db.exec_query(query, petition_id, list(dict.fromkeys(names)))
+
+        async def _attach_petition_photos_sqlite(self, petition_id, names):
+                async with self.db.transaction() as transaction:
+                        result = await transaction.select_one('''SELECT PHOTOS FROM PETITION WHERE ID = $1;''', petition_id)
+                        if result:
+                                photos = list(dict.fromkeys([*result["photos"], *names]))
+                                await transaction.exec_query('''UPDATE PETITION SET PHOTOS = $2 WHERE ID = $1;''', petition_id, photos)
 
-                query = '''INSERT INTO PHOTO_FOLDER (PETITION_ID, FOLDER_PATH) VALUES ($1, $2);'''
-                await self.db.exec_query(query, petition_id, folder_path)
+        # список фотографий петиции (None, если петиции нет)
+        async def get_photo_manifest(self, petition_id):
+                query = '''SELECT PHOTOS FROM PETITION WHERE ID = $1;'''
+                result = await self.db.select_one(query, petition_id)
+                return list(result["photos"]) if result else None
 
-        # получаем фотографии петиции
+        # получаем ссылки на фотографии петиции
         async def get_petition_photos(self, petition_id):
-                photos = []
-                query = f'''SELECT FOLDER_PATH FROM PHOTO_FOLDER WHERE PETITION_ID = $1;'''
-                folder_path = (await self.db.select_one(query, petition_id))["folder_path"]
-                for filename in os.listdir(folder_path):
-                        file_path = os.path.join(folder_path, filename)
-                        photos.append('http://127.0.0.1:8002/images/' +file_path)
-                return photos
\ No newline at end of file
+                return [photo_url(name) for name in await self.get_photo_manifest(petition_id) or []]
\ No newline at end of file
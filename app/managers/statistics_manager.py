@@ -1,61 +1,143 @@
 import asyncio
+from datetime import date, datetime, timedelta
 
+from app.metrics import instrumented
+
+
+# начало периода для краткой аналитики (аналог CURRENT_DATE - INTERVAL '1 month' и т.п.)
+def get_period_start(period):
+    today = date.today()
+    if period == "day":
+        return today - timedelta(days=1)
+    if period == "week":
+        return today - timedelta(weeks=1)
+    months = 1 if period == "month" else 12
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    month += 1
+    # последний день месяца, если в нем нет такого числа (31 марта -> 29 февраля)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return date(year, month, min(today.day, (next_month - timedelta(days=1)).day))
+
+
+# дата из строки вида 2024-01-31 или 2024-01-31 12:00:00
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+# начало интервала (день, неделя с понедельника, месяц), в который попадает дата
+def get_bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def get_next_bucket(day, bucket):
+    if bucket == "week":
+        return day + timedelta(weeks=1)
+    if bucket == "month":
+        return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+@instrumented("statistics_manager")
 class StatisticsManager:
     def __init__(self, db):
                 self.db = db
-    
-    async def get_most_popular_city_petition_by_period(self, region_name, city_name, period, is_initiative, rows):
+
+    async def get_most_popular_city_petition_by_period(self, region_name, city_name, period_start, is_initiative, rows):
         # получаем самую популярную категорию жалоб/иниициатив в указанном городе за определенный период
-        query = f'''SELECT CATEGORY, count(*) FROM PETITION
-                     WHERE SUBMISSION_TIME >= CURRENT_DATE - INTERVAL '{period}'
+        query = f'''SELECT CATEGORY, SUM(PETITIONS_COUNT) AS count FROM PETITION_STATS_DAILY
+                     WHERE DAY >= $5
                      AND IS_INITIATIVE = $3
                      AND REGION = $1 AND CITY_NAME = $2
                      GROUP BY CATEGORY
-                     ORDER BY COUNT(*) DESC
+                     HAVING SUM(PETITIONS_COUNT) > 0
+                     ORDER BY count DESC, CATEGORY
                      LIMIT $4;'''
-        result = {record["category"]: record["count"] for record in await self.db.select_query(query, region_name, city_name, is_initiative, rows)}
+        result = {record["category"]: record["count"] for record in await self.db.select_query(query, region_name, city_name, is_initiative, rows, period_start)}
         return result
-        
-    async def get_most_popular_region_petition_by_period(self, region, period, is_initiative, rows):
+
+    async def get_most_popular_region_petition_by_period(self, region, period_start, is_initiative, rows):
             # получаем самую популярную категорию жалоб/инициатив в указанном РЕГИОНЕ за определенный период
-            query = f'''SELECT CATEGORY, count(*) FROM PETITION
-                        WHERE SUBMISSION_TIME >= CURRENT_DATE - INTERVAL '{period}'
+            query = f'''SELECT CATEGORY, SUM(PETITIONS_COUNT) AS count FROM PETITION_STATS_DAILY
+                        WHERE DAY >= $4
                         AND IS_INITIATIVE = $2
                         AND REGION = $1
                         GROUP BY CATEGORY
-                        ORDER BY COUNT(*) DESC
+                        HAVING SUM(PETITIONS_COUNT) > 0
+                        ORDER BY count DESC, CATEGORY
                         LIMIT $3;'''
-            result = {record["category"]: record["count"] for record in await self.db.select_query(query, region, is_initiative, rows)}
+            result = {record["category"]: record["count"] for record in await self.db.select_query(query, region, is_initiative, rows, period_start)}
             return result
-            
-    async def get_city_petition_count_per_status_by_period(self, region, city, period, is_initiative):
+
+    async def get_city_petition_count_per_status_by_period(self, region, city, period_start, is_initiative):
             # получаем количество жалоб/инициатив на статус за период в указанном городе
-            query = f'''SELECT PETITION_STATUS, COUNT(*) FROM PETITION
+            query = f'''SELECT PETITION_STATUS, SUM(PETITIONS_COUNT) AS count FROM PETITION_STATS_DAILY
                     WHERE IS_INITIATIVE = $3
-                    AND SUBMISSION_TIME >= CURRENT_DATE - INTERVAL '{period}'
+                    AND DAY >= $4
                     AND REGION = $1 AND CITY_NAME = $2
-                    GROUP BY PETITION_STATUS;'''
-            result = {record["petition_status"]: record["count"] for record in await self.db.select_query(query, region, city, is_initiative)}
+                    GROUP BY PETITION_STATUS
+                    HAVING SUM(PETITIONS_COUNT) > 0;'''
+            result = {record["petition_status"]: record["count"] for record in await self.db.select_query(query, region, city, is_initiative, period_start)}
             return result
 
-    async def get_region_petition_count_per_status_by_period(self, region, period, is_initiative):
+    async def get_region_petition_count_per_status_by_period(self, region, period_start, is_initiative):
             # получаем количество жалоб/инициатив на статус за период в указанном РЕГИОНЕ
-            query = f'''SELECT PETITION_STATUS, COUNT(*) FROM PETITION
+            query = f'''SELECT PETITION_STATUS, SUM(PETITIONS_COUNT) AS count FROM PETITION_STATS_DAILY
                     WHERE IS_INITIATIVE = $2
-                    AND SUBMISSION_TIME >= CURRENT_DATE - INTERVAL '{period}'
+                    AND DAY >= $3
                     AND REGION = $1
-                    GROUP BY PETITION_STATUS;'''
-            result = {record["petition_status"]: record["count"] for record in await self.db.select_query(query, region, is_initiative)}
+                    GROUP BY PETITION_STATUS
+                    HAVING SUM(PETITIONS_COUNT) > 0;'''
+            result = {record["petition_status"]: record["count"] for record in await self.db.select_query(query, region, is_initiative, period_start)}
             return result
 
+    # краткая аналитика за один проход по сводной статистике региона за период:
+    # все восемь блоков собираются из одной выборки, сгруппированной по (город?, тип, категория, статус)
     async def get_brief_subject_analysis(self, region_name, city_name, period):
-            interval_mapping = {
-                        "year": "1 year",
-                        "month": "1 month",
-                        "day": "1 day",
-                        "week": "1 week"
-                }
-            period = interval_mapping[period]
+            period_start = get_period_start(period)
+            query = f'''SELECT CITY_NAME = $2 AS IN_CITY, IS_INITIATIVE, CATEGORY, PETITION_STATUS,
+                        SUM(PETITIONS_COUNT) AS count
+                        FROM PETITION_STATS_DAILY
+                        WHERE REGION = $1
+                        AND DAY >= $3
+                        GROUP BY IN_CITY, IS_INITIATIVE, CATEGORY, PETITION_STATUS
+                        HAVING SUM(PETITIONS_COUNT) > 0;'''
+            records = await self.db.select_query(query, region_name, city_name, period_start)
+
+            # (scope, is_initiative) -> счетчики по категориям и статусам
+            categories = {(scope, kind): {} for scope in ("city", "region") for kind in (True, False)}
+            statuses = {(scope, kind): {} for scope in ("city", "region") for kind in (True, False)}
+            for record in records:
+                scopes = ("city", "region") if record["in_city"] else ("region",)
+                for scope in scopes:
+                    key = (scope, record["is_initiative"])
+                    categories[key][record["category"]] = categories[key].get(record["category"], 0) + record["count"]
+                    statuses[key][record["petition_status"]] = statuses[key].get(record["petition_status"], 0) + record["count"]
+
+            # три самые популярные категории, при равенстве - по алфавиту
+            def top(counts, rows=3):
+                return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:rows])
+
+            return {"most_popular_city_initiatives": top(categories[("city", True)])
+                    ,"most_popular_city_complaints": top(categories[("city", False)])
+                    ,"city_initiatives_count_per_status": statuses[("city", True)]
+                    ,"city_complaints_count_per_status": statuses[("city", False)]
+                    ,"most_popular_region_initiatives": top(categories[("region", True)])
+                    ,"most_popular_region_complaints": top(categories[("region", False)])
+                    ,"region_initiatives_count_per_status": statuses[("region", True)]
+                    ,"region_complaints_count_per_status": statuses[("region", False)]
+                    }
+
+    # прежний вариант краткой аналитики: восемь параллельных запросов (оставлен для сравнения в scripts/bench_brief_analysis.py)
+    async def get_brief_subject_analysis_fanout(self, region_name, city_name, period):
+            period_start = get_period_start(period)
             (
             most_popular_city_initiatives
             ,most_popular_city_complaints
@@ -66,16 +148,16 @@ class StatisticsManager:
             ,region_complaints_count_per_status
             ,region_initiatives_count_per_status
             ) = await asyncio.gather(
-                self.get_most_popular_city_petition_by_period(region_name, city_name, period, True, 3)
-                ,self.get_most_popular_city_petition_by_period(region_name, city_name, period, False, 3)
-                ,self.get_most_popular_region_petition_by_period(region_name, period, True, 3)
-                ,self.get_most_popular_region_petition_by_period(region_name, period, False, 3)
-                ,self.get_city_petition_count_per_status_by_period(region_name, city_name, period, False)
-                ,self.get_city_petition_count_per_status_by_period(region_name, city_name, period, True)
-                ,self.get_region_petition_count_per_status_by_period(region_name, period, False)
-                ,self.get_region_petition_count_per_status_by_period(region_name, period, True)
+                self.get_most_popular_city_petition_by_period(region_name, city_name, period_start, True, 3)
+                ,self.get_most_popular_city_petition_by_period(region_name, city_name, period_start, False, 3)
+                ,self.get_most_popular_region_petition_by_period(region_name, period_start, True, 3)
+                ,self.get_most_popular_region_petition_by_period(region_name, period_start, False, 3)
+                ,self.get_city_petition_count_per_status_by_period(region_name, city_name, period_start, False)
+                ,self.get_city_petition_count_per_status_by_period(region_name, city_name, period_start, True)
+                ,self.get_region_petition_count_per_status_by_period(region_name, period_start, False)
+                ,self.get_region_petition_count_per_status_by_period(region_name, period_start, True)
             )
-            
+
 
             return {"most_popular_city_initiatives": most_popular_city_initiatives
                     ,"most_popular_city_complaints": most_popular_city_complaints
@@ -86,117 +168,103 @@ class StatisticsManager:
                     ,"region_initiatives_count_per_status": region_initiatives_count_per_status
                     ,"region_complaints_count_per_status": region_complaints_count_per_status
                     }
-    
+
     async def get_full_statistics(self, region_name, city_name, start_time, end_time, rows_count):
-            
-            # количество жалоб на категорию в городе
-            count_per_category_city_query = f'''SELECT CATEGORY, COUNT(*) AS COUNT_PER_CATEGORY
-                                        FROM PETITION
+            # границы периода включительно, по дням
+            start_day, end_day = to_date(start_time), to_date(end_time)
+            start_time = datetime.combine(start_day, datetime.min.time())
+            end_time = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+
+            # количество жалоб/инициатив на категорию в городе
+            count_per_category_city_query = f'''SELECT CATEGORY, SUM(PETITIONS_COUNT) AS COUNT_PER_CATEGORY
+                                        FROM PETITION_STATS_DAILY
                                         WHERE REGION = $1 AND CITY_NAME = $2
-                                        AND (SUBMISSION_TIME BETWEEN $3 AND $4)
-                                        AND IS_INITIATIVE = FALSE
-                                        GROUP BY CATEGORY;'''
-            
-            # Список наиболее популярных инициатив в указанном городе
-            most_popular_initiatives_city_query = f'''SELECT P.ID, P.HEADER, P.CATEGORY, P.SUBMISSION_TIME, COUNT(L.ID) AS LIKE_COUNT
-                                            FROM PETITION P
-                                            LEFT JOIN LIKES L ON P.ID = L.PETITION_ID
-                                            WHERE P.IS_INITIATIVE = TRUE
-                                            AND REGION = $1 AND CITY_NAME = $2
-                                            AND (SUBMISSION_TIME BETWEEN $3 AND $4)
-                                            GROUP BY P.ID
-                                            ORDER BY LIKE_COUNT DESC
-                                            LIMIT $5;'''
-            
-            # самые попклярные жалобы в указанном городе
-            most_popular_complaints_city_query = f'''SELECT P.ID, P.HEADER, P.CATEGORY, P.SUBMISSION_TIME, COUNT(L.ID) AS LIKE_COUNT
+                                        AND DAY BETWEEN $3 AND $4
+                                        AND IS_INITIATIVE = $5
+                                        GROUP BY CATEGORY
+                                        HAVING SUM(PETITIONS_COUNT) > 0;'''
+
+            # Список наиболее популярных жалоб/инициатив в указанном городе
+            most_popular_city_query = f'''SELECT P.ID, P.HEADER, P.CATEGORY, P.SUBMISSION_TIME, P.LIKES_COUNT AS LIKE_COUNT
                                             FROM PETITION P
-                                            LEFT JOIN LIKES L ON P.ID = L.PETITION_ID
-                                            WHERE P.IS_INITIATIVE = FALSE
+                                            WHERE P.IS_INITIATIVE = $5
                                             AND REGION = $1 AND CITY_NAME = $2
-                                            AND (SUBMISSION_TIME BETWEEN $3 AND $4)
-                                            GROUP BY P.ID
-                                            ORDER BY LIKE_COUNT DESC
-                                            LIMIT $5;'''
-            
-            # среднее количество жалоб на категорию в регионе
-            count_per_category_region_query = f'''WITH CITY_COUNT AS (
-                                            SELECT COUNT(DISTINCT CITY_NAME) AS CITY_COUNT
-                                            FROM PETITION
-                                            WHERE REGION = $1
-                                            )
+                                            AND SUBMISSION_TIME >= $3 AND SUBMISSION_TIME < $4
+                                            ORDER BY P.LIKES_COUNT DESC
+                                            LIMIT $6;'''
 
-                                            SELECT CATEGORY, CAST(COUNT(*) AS FLOAT) / (SELECT CITY_COUNT FROM CITY_COUNT) AS COUNT_PER_CATEGORY
-                                            FROM PETITION
-                                            WHERE REGION = $1
-                                            AND (SUBMISSION_TIME BETWEEN $2 AND $3)
-                                            AND IS_INITIATIVE = FALSE
-                                            GROUP BY CATEGORY;
-                                            '''
-            
-            # среднее количество инициатив на категорию в регионе
-            init_count_per_category_region_query = f'''WITH CITY_COUNT AS (
+            # среднее количество жалоб/инициатив на категорию в регионе (на один город региона)
+            count_per_category_region_query = f'''WITH CITY_COUNT AS (
                                             SELECT COUNT(DISTINCT CITY_NAME) AS CITY_COUNT
-                                            FROM PETITION
+                                            FROM PETITION_STATS_DAILY
                                             WHERE REGION = $1
                                             )
 
-                                            SELECT CATEGORY, CAST(COUNT(*) AS FLOAT) / (SELECT CITY_COUNT FROM CITY_COUNT) AS COUNT_PER_CATEGORY
-                                            FROM PETITION
+                                            SELECT CATEGORY, CAST(SUM(PETITIONS_COUNT) AS FLOAT) / (SELECT CITY_COUNT FROM CITY_COUNT) AS COUNT_PER_CATEGORY
+                                            FROM PETITION_STATS_DAILY
                                             WHERE REGION = $1
-                                            AND (SUBMISSION_TIME BETWEEN $2 AND $3)
-                                            AND IS_INITIATIVE = TRUE
-                                            GROUP BY CATEGORY;
-                                            '''
-            
-            # количество инициатив на категорию в городе
-            init_count_per_category_city_query = f'''SELECT CATEGORY, COUNT(*) AS COUNT_PER_CATEGORY
-                                        FROM PETITION
-                                        WHERE REGION = $1 AND CITY_NAME = $2
-                                        AND (SUBMISSION_TIME BETWEEN $3 AND $4)
-                                        AND IS_INITIATIVE = TRUE
-                                        GROUP BY CATEGORY;'''
-            
-            
-            # количество инициатив в городе на день за указанный период
-            init_count_per_day_query = f'''SELECT DATE(dates.d) AS DAY, COUNT(PETITION.SUBMISSION_TIME) AS INITIATIVES_COUNT
-                                            FROM GENERATE_SERIES($2::TIMESTAMP, $3::TIMESTAMP, '1 day') AS dates(d)
-                                            LEFT JOIN PETITION ON DATE(PETITION.SUBMISSION_TIME) = DATE(dates.d)
-                                            AND PETITION.IS_INITIATIVE = TRUE
-                                            AND PETITION.CITY_NAME = $1
-                                            WHERE DATE(dates.d) BETWEEN $2 AND $3
-                                            GROUP BY DATE(dates.d)
-                                            ORDER BY DAY;
-                                            '''
-            # количество жалоб в день в городе за указанный период
-            comp_count_per_day_query = f'''SELECT DATE(dates.d) AS DAY, COUNT(PETITION.SUBMISSION_TIME) AS COMPLAINTS_COUNT
-                                            FROM GENERATE_SERIES($2::TIMESTAMP, $3::TIMESTAMP, '1 day') AS dates(d)
-                                            LEFT JOIN PETITION ON DATE(PETITION.SUBMISSION_TIME) = DATE(dates.d)
-                                            AND PETITION.IS_INITIATIVE = FALSE
-                                            AND PETITION.CITY_NAME = $1
-                                            WHERE DATE(dates.d) BETWEEN $2 AND $3
-                                            GROUP BY DATE(dates.d)
-                                            ORDER BY DAY;
+                                            AND DAY BETWEEN $2 AND $3
+                                            AND IS_INITIATIVE = $4
+                                            GROUP BY CATEGORY
+                                            HAVING SUM(PETITIONS_COUNT) > 0;
                                             '''
 
-
             (
              cpc_city, mpi_city, mpc_city, cpc_reg,
-             init_cpc_city, init_cpc_reg, icpd, ccpd
-             ) = await asyncio.gather(self.db.select_query(count_per_category_city_query, region_name, city_name, start_time, end_time, rows_count),
-                self.db.select_query(most_popular_initiatives_city_query, region_name, city_name, start_time, end_time, rows_count),
-                self.db.select_query(most_popular_complaints_city_query, region_name, city_name, start_time, end_time, rows_count),
-                self.db.select_query(count_per_category_region_query, region_name, start_time, end_time),
-                self.db.select_query(init_count_per_category_city_query, region_name, city_name, start_time, end_time),
-                self.db.select_query(init_count_per_category_region_query, region_name, start_time, end_time),
-                self.db.select_query(init_count_per_day_query, city_name, start_time, end_time),
-                self.db.select_query(comp_count_per_day_query))
-            
+             init_cpc_city, init_cpc_reg, per_day
+             ) = await asyncio.gather(self.db.select_query(count_per_category_city_query, region_name, city_name, start_day, end_day, False),
+                self.db.select_query(most_popular_city_query, region_name, city_name, start_time, end_time, True, rows_count),
+                self.db.select_query(most_popular_city_query, region_name, city_name, start_time, end_time, False, rows_count),
+                self.db.select_query(count_per_category_region_query, region_name, start_day, end_day, False),
+                self.db.select_query(count_per_category_city_query, region_name, city_name, start_day, end_day, True),
+                self.db.select_query(count_per_category_region_query, region_name, start_day, end_day, True),
+                self.get_time_series(region_name, city_name, start_day, end_day, "day"))
+
             return {"count_per_category_city": {record["category"]: record["count_per_category"] for record in cpc_city},
                     "count_per_category_region": {record["category"]: record["count_per_category"] for record in cpc_reg},
                     "init_count_per_category_region": {record["category"]: record["count_per_category"] for record in init_cpc_reg},
                     "init_count_per_category_city": {record["category"]: record["count_per_category"] for record in init_cpc_city},
-                    "init_per_day": {record["day"]: record["initiatives_count"] for record in icpd},
-                    "comp_per_day": {record["day"]: record["complaints_count"] for record in ccpd},
-                    "most_popular_city_initiatives": [dict(record) for record in mpi_city],
-                    "most_popular_city_complaints": [dict(record) for record in mpc_city]}
\ No newline at end of file
+                    "init_per_day": per_day["initiatives"],
+                    "comp_per_day": per_day["complaints"],
+                    "most_popular_city_initiatives": [dict(record, submission_time=record["submission_time"].strftime('%d.%m.%Y %H:%M')) for record in mpi_city],
+                    "most_popular_city_complaints": [dict(record, submission_time=record["submission_time"].strftime('%d.%m.%Y %H:%M')) for record in mpc_city]}
+
+    # количество инициатив и жалоб в городе по дням, неделям или месяцам за период (границы включительно).
+    # обе серии считаются одним запросом по диапазону дней сводной статистики,
+    # интервалы без петиций дополняются нулями на стороне приложения
+    async def get_time_series(self, region_name, city_name, start_time, end_time, bucket):
+            start_day, end_day = to_date(start_time), to_date(end_time)
+            query = '''SELECT DAY,
+                       COALESCE(SUM(PETITIONS_COUNT) FILTER (WHERE IS_INITIATIVE), 0) AS INITIATIVES_COUNT,
+                       COALESCE(SUM(PETITIONS_COUNT) FILTER (WHERE NOT IS_INITIATIVE), 0) AS COMPLAINTS_COUNT
+                       FROM PETITION_STATS_DAILY
+                       WHERE REGION = $1 AND CITY_NAME = $2
+                       AND DAY >= $3 AND DAY <= $4
+                       GROUP BY DAY;'''
+            initiatives, complaints = {}, {}
+            bucket_start = get_bucket_start(start_day, bucket)
+            while bucket_start <= end_day:
+                initiatives[bucket_start] = complaints[bucket_start] = 0
+                bucket_start = get_next_bucket(bucket_start, bucket)
+            for record in await self.db.select_query(query, region_name, city_name, start_day, end_day):
+                bucket_start = get_bucket_start(record["day"], bucket)
+                initiatives[bucket_start] += record["initiatives_count"]
+                complaints[bucket_start] += record["complaints_count"]
+            return {"bucket": bucket,
+                    "initiatives": {day.strftime('%d.%m.%Y'): count for day, count in initiatives.items()},
+                    "complaints": {day.strftime('%d.%m.%Y'): count for day, count in complaints.items()}}
+
+    # полный пересчет сводной статистики PETITION_STATS_DAILY по таблице PETITION.
+    # на время пересчета запись в сводную таблицу блокируется, поэтому новые петиции не теряются
+    async def rebuild_stats_rollup(self):
+            lock_query = '''LOCK TABLE PETITION_STATS_DAILY IN EXCLUSIVE MODE;'''
+            clear_query = '''DELETE FROM PETITION_STATS_DAILY;'''
+            fill_query = '''INSERT INTO PETITION_STATS_DAILY (DAY, REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, PETITIONS_COUNT)
+                            SELECT DATE(SUBMISSION_TIME), REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS, COUNT(*)
+                            FROM PETITION
+                            GROUP BY DATE(SUBMISSION_TIME), REGION, CITY_NAME, CATEGORY, IS_INITIATIVE, PETITION_STATUS;'''
+            # в SQLite транзакция exec_many_query и так блокирует запись во всю базу
+            queries = {clear_query: [], fill_query: []}
+            if self.db.dialect == "postgres":
+                queries = {lock_query: [], **queries}
+            await self.db.exec_many_query(queries)
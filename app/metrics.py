@@ -0,0 +1,150 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# метод менеджера, выполняющийся в текущей задаче: им помечаются метрики запросов к БД
+current_method = ContextVar("current_method", default="")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# гистограмма с фиксированными границами; значения меток передаются кортежем в порядке labelnames
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}  # метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {count}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.series = {}
+
+    def inc(self, labels=(), amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.series.items():
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+
+
+# текущее значение: задается явно или вычисляется функцией при каждом чтении метрик
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        yield f"{self.name} {self.function() if self.function else self.value}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # текстовый формат Prometheus
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Количество обрабатываемых HTTP-запросов"))
+manager_call_duration = registry.register(Histogram(
+    "manager_call_duration_seconds", "Время выполнения метода менеджера", ("method",)))
+manager_call_errors = registry.register(Counter(
+    "manager_call_errors_total", "Количество ошибок в методах менеджеров", ("method", "error")))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения запроса к БД (без ожидания соединения)", ("method", "operation")))
+db_query_errors = registry.register(Counter(
+    "db_query_errors_total", "Количество ошибок запросов к БД", ("method", "operation", "error")))
+db_pool_wait_duration = registry.register(Histogram(
+    "db_pool_wait_seconds", "Время ожидания соединения из пула", ("method",)))
+
+
+# замер времени и ошибок всех асинхронных методов класса менеджера; имя метода доступно
+# запросам к БД через current_method
+def instrumented(prefix):
+    def decorate(cls):
+        for name, function in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(function):
+                setattr(cls, name, instrument(f"{prefix}.{name}", function))
+        return cls
+    return decorate
+
+
+def instrument(label, function):
+    labels = (label,)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = current_method.set(label)
+        start_time = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            manager_call_errors.inc((label, type(e).__name__))
+            raise
+        finally:
+            manager_call_duration.observe(labels, time.perf_counter() - start_time)
+            current_method.reset(token)
+    return wrapper
@@ -0,0 +1,171 @@
+import logging
+import time
+
+from app.metrics import http_request_duration, http_requests_in_flight
+
+logger = logging.getLogger("app.requests")
+
+
+# заголовки, значения которых не попадают в журнал
+SENSITIVE_HEADERS = {"authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key", "x-auth-token"}
+
+
+# ограничение частоты однотипных записей: не больше limit записей за interval секунд на ключ,
+# о пропущенных записях сообщается одной строкой в следующем интервале
+class LogRateLimiter:
+    def __init__(self, limit, interval=60.0):
+        self.limit = limit
+        self.interval = interval
+        self.windows = {}  # ключ -> [начало интервала, записано, пропущено]
+
+    # разрешена ли запись; второе значение - сколько записей пропущено в предыдущем интервале
+    def allow(self, key):
+        now = time.monotonic()
+        window = self.windows.get(key)
+        suppressed = 0
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self.windows[key] = [now, 0, 0]
+        if window[1] >= self.limit:
+            window[2] += 1
+            return False, suppressed
+        window[1] += 1
+        return True, suppressed
+
+
+# журналирование запросов и заголовок X-Process-Time без BaseHTTPMiddleware:
+# тело запроса не читается заранее, сохраняется только его начало, а строка для лога
+# формируется лишь для ответов с ошибкой. ошибки сервера (5xx, кроме 503) пишутся с уровнем ERROR
+# вместе с началом тела; ошибки клиента (4xx, WARNING) и отказы из-за перегрузки или остановки (503, INFO) -
+# без тела и не чаще rate_limit записей в минуту на код ответа, чтобы журнал не добавлял ввода-вывода
+# именно тогда, когда сервис сбрасывает нагрузку. значения заголовков с учетными данными не записываются
+class RequestLoggingMiddleware:
+    def __init__(self, app, body_snapshot_size=1024, rate_limit=20):
+        self.app = app
+        self.body_snapshot_size = body_snapshot_size
+        self.rate_limiter = LogRateLimiter(rate_limit)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        snapshot = []
+        snapshot_size = 0
+        status_code = None
+
+        async def receive_wrapper():
+            nonlocal snapshot_size
+            message = await receive()
+            if message["type"] == "http.request" and snapshot_size < self.body_snapshot_size:
+                body = message.get("body", b"")
+                if body:
+                    part = body[:self.body_snapshot_size - snapshot_size]
+                    snapshot.append(part)
+                    snapshot_size += len(part)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-process-time", str(process_time).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            self.log_error(scope, 500 if status_code is None else status_code, start_time, snapshot, exc_info=True)
+            raise
+        if status_code is not None and status_code >= 400:
+            self.log_error(scope, status_code, start_time, snapshot)
+
+    def log_error(self, scope, status_code, start_time, snapshot, exc_info=False):
+        expected = not exc_info and (status_code < 500 or status_code == 503)
+        level = logging.ERROR if not expected else logging.INFO if status_code == 503 else logging.WARNING
+        if not logger.isEnabledFor(level):
+            return
+        if expected:
+            allowed, suppressed = self.rate_limiter.allow(status_code)
+            if suppressed:
+                logger.log(level, "Пропущено записей об ответах %s за минуту: %d", status_code, suppressed)
+            if not allowed:
+                return
+        execution_time = time.perf_counter() - start_time
+        path = scope.get("path", "")
+        if scope.get("query_string"):
+            path += "?" + scope["query_string"].decode("latin-1")
+        headers = {name.decode("latin-1"): "<скрыто>" if name.decode("latin-1").lower() in SENSITIVE_HEADERS
+                   else value.decode("latin-1") for name, value in scope.get("headers", [])}
+        if expected:
+            logger.log(level, "Ответ: %s %s %s Время выполнения: %.2f сек, Headers: %s",
+                       status_code, scope["method"], path, execution_time, headers)
+            return
+        body = b"".join(snapshot)
+        truncated = "..." if len(body) >= self.body_snapshot_size else ""
+        logger.error("Ошибка: %s %s %s Время выполнения: %.2f сек, Headers: %s Body: %r%s",
+                     status_code, scope["method"], path, execution_time, headers, body, truncated,
+                     exc_info=exc_info)
+
+
+# время обработки запросов по шаблону маршрута и коду ответа, количество запросов в обработке
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    # шаблон пути по обработчику, найденному маршрутизатором (чтобы /images/<файл> не порождали отдельные метки)
+    def get_route(self, scope):
+        if self.route_paths is None:
+            self.route_paths = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self.route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.observe((scope["method"], self.get_route(scope), str(status_code)),
+                                          time.perf_counter() - start_time)
+
+
+# учет запросов в обработке для плавной остановки. во время остановки новые запросы (кроме проверок
+# состояния) получают 503 с Connection: close, чтобы клиент повторил их на другом процессе
+class LifecycleMiddleware:
+    def __init__(self, app, lifecycle, exempt_paths=("/health", "/ready")):
+        self.app = app
+        self.lifecycle = lifecycle
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            return await self.app(scope, receive, send)
+
+        if self.lifecycle.draining:
+            self.lifecycle.rejected += 1
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json"), (b"connection", b"close"),
+                                    (b"retry-after", b"1")]})
+            await send({"type": "http.response.body", "body": b'{"detail":"Server is shutting down"}'})
+            return
+
+        self.lifecycle.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.lifecycle.request_finished()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 
 class Emails(BaseModel):
@@ -22,6 +22,19 @@ class NewPetition(BaseModel):
     city_name: str
     photos: Optional[List[Photo]] = None
 
+# класс для импорта петиций из другой системы: дата подачи и статус могут быть заданы задним числом
+class ImportedPetition(NewPetition):
+    submission_time: Optional[datetime] = None
+    petition_status: Optional[str] = None
+
+    # время с часовым поясом приводится к локальному, как у CURRENT_TIMESTAMP в БД
+    @field_validator("submission_time")
+    @classmethod
+    def to_local_time(cls, value):
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
 # класс для обновления статуса заявки
 class PetitionStatus(BaseModel):
     id: int
@@ -30,6 +43,19 @@ class PetitionStatus(BaseModel):
     admin_region: str
     status: str
     comment: str
+
+# элемент пакетной модерации
+class StatusChange(BaseModel):
+    id: int
+    status: str
+    comment: str
+
+# класс для пакетного обновления статусов заявок одним админом
+class PetitionStatusBatch(BaseModel):
+    admin_id: int
+    admin_city: str
+    admin_region: str
+    changes: List[StatusChange] = Field(min_length=1, max_length=1000)
     
 
 # класс для установки или отмены лайка
@@ -37,10 +63,40 @@ class Like(BaseModel):
     petition_id: int
     user_email: str
 
+# класс для пакетной установки лайков: liked - итоговое состояние лайка
+class LikeState(Like):
+    liked: bool
+
+class Likes(BaseModel):
+    likes: List[LikeState] = Field(max_length=1000)
+
+# запрос лайков пользователя сразу для нескольких петиций (например, для всех карточек страницы списка)
+class LikesLookup(BaseModel):
+    user_email: str
+    petition_ids: List[int] = Field(max_length=1000)
+
+# запрос пакетов уведомлений на отправку
+class NotificationClaim(BaseModel):
+    limit: int = Field(default=10, ge=1, le=100)
+
+# подтверждение отправки пакетов уведомлений
+class NotificationAck(BaseModel):
+    ids: List[int] = Field(max_length=1000)
+
 # класс для получения id пользователя от шлюза
 class UserInfo(BaseModel):
     email: str
 
+# параметры постраничной выдачи списков петиций: cursor - значение next_cursor из предыдущего ответа
+class PageParams(BaseModel):
+    limit: int = Field(default=50, ge=1, le=500)
+    sort: Literal["submission_time", "likes"] = "submission_time"
+    status: Optional[str] = None
+    cursor: Optional[str] = None
+
+class UserPetitionsPage(UserInfo, PageParams):
+    pass
+
 # класс с краткой информации о петиции
 class PetitionWithHeader(BaseModel):
     id: int
@@ -54,6 +110,7 @@ class PetitionWithHeader(BaseModel):
 # класс, используемый для передачи массива с краткой информацией по нескольким заявкам
 class PetitionsByUser(BaseModel):
     petitions: List[PetitionWithHeader]
+    next_cursor: Optional[str] = None
 
 
 class AdminPetition(PetitionWithHeader):
@@ -61,6 +118,7 @@ class AdminPetition(PetitionWithHeader):
 
 class AdminPetitions(BaseModel):
     petitions: List[AdminPetition]
+    next_cursor: Optional[str] = None
 
 # класс для получения данных о заявке, по которой нужно вернуть информацию
 class PetitionToGetData(BaseModel):
@@ -94,12 +152,41 @@ class City(BaseModel):
 class CityWithType(City):
     is_initiative: bool
 
+class CityPetitionsPage(CityWithType, PageParams):
+    pass
+
+class AdminPetitionsPage(City, PageParams):
+    pass
+
+# петиции города в тренде: limit петиций с наибольшим затухающим со временем счетом лайков
+class TrendingPetitions(CityWithType):
+    limit: int = Field(default=10, ge=1, le=50)
+
+# параметры полнотекстового поиска петиций: текст запроса, необязательные фильтры и страница результатов
+# (cursor - значение next_cursor из предыдущего ответа)
+class PetitionSearch(BaseModel):
+    query: str = Field(min_length=1, max_length=200)
+    region: Optional[str] = None
+    city_name: Optional[str] = None
+    category: Optional[str] = None
+    is_initiative: Optional[bool] = None
+    status: Optional[str] = None
+    limit: int = Field(default=20, ge=1, le=100)
+    cursor: Optional[str] = None
+
 class SubjectForBriefAnalysis(City):
-    period: str
+    period: Literal["day", "week", "month", "year"]
 
 class RegionForDetailedAnalysis(BaseModel):
     region_name: str
     city_name: str
     start_time: str
     end_time: str
-    rows_count: int
\ No newline at end of file
+    rows_count: int
+
+class TimeSeriesRequest(BaseModel):
+    region_name: str
+    city_name: str
+    start_time: str
+    end_time: str
+    bucket: Literal["day", "week", "month"] = "day"
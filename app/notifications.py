@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("app.notifications")
+
+
+# фоновая задача, которая разбирает очередь уведомлений о смене статуса в пакеты получателей.
+# работает, пока в очереди есть записи; без работы спит idle_interval секунд или до вызова wake()
+class NotificationDispatcher:
+    def __init__(self, manager, page_size, idle_interval):
+        self.manager = manager
+        self.page_size = page_size
+        self.idle_interval = idle_interval
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.batches = 0
+        self.recipients = 0
+        self.errors = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # сигнал о новом уведомлении в очереди
+    def wake(self):
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                recipients = await self.manager.dispatch_next(self.page_size)
+            except Exception:
+                self.errors += 1
+                logger.exception("Ошибка разбора очереди уведомлений")
+                recipients = None
+            if recipients is not None:
+                self.batches += 1
+                self.recipients += recipients
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.idle_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {"running": self.task is not None and not self.task.done(),
+                "batches": self.batches,
+                "recipients": self.recipients,
+                "errors": self.errors}
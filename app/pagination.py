@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# столбцы, по которым можно сортировать списки петиций (сортировка всегда по убыванию, ID - для однозначности)
+SORT_COLUMNS = {"submission_time": "p.SUBMISSION_TIME",
+                "likes": "p.LIKES_COUNT"}
+
+
+# курсор - непрозрачная для клиента строка: способ сортировки и ключ последней выданной записи
+def encode_cursor(sort, value, petition_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, petition_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, petition_id = json.loads(raw)
+        if cursor_sort != sort:
+            raise InvalidCursor("Cursor was issued for another sort order")
+        if sort == "submission_time":
+            value = datetime.fromisoformat(value)
+        if sort == "likes":
+            value = int(value)
+        elif sort == "relevance":
+            value = float(value)
+        return value, int(petition_id)
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+# добавляет к запросу фильтр по статусу, условие курсора, сортировку и лимит.
+# запрос должен заканчиваться условием WHERE без точки с запятой, args - уже занятые параметры
+def paginate(query, args, page):
+    args = list(args)
+    column = SORT_COLUMNS[page.sort]
+    if page.status is not None:
+        args.append(page.status)
+        query += f" AND p.PETITION_STATUS = ${len(args)}"
+    if page.cursor is not None:
+        value, petition_id = decode_cursor(page.cursor, page.sort)
+        args.extend([value, petition_id])
+        query += f" AND ({column}, p.ID) < (${len(args) - 1}, ${len(args)})"
+    # запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    args.append(page.limit + 1)
+    query += f" ORDER BY {column} DESC, p.ID DESC LIMIT ${len(args)};"
+    return query, args
+
+
+# обрезает лишнюю запись и формирует курсор следующей страницы
+def split_page(rows, page):
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    last = rows[-1]
+    value = last["submission_time"] if page.sort == "submission_time" else last["likes_count"]
+    return rows, encode_cursor(page.sort, value, last["id"])
@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from app.config import settings
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+# расширение исходного файла, если оно похоже на расширение изображения
+def get_extension(filename):
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,8}", extension) else ""
+
+
+# имя файла в хранилище: sha256 содержимого и расширение
+def is_content_name(name):
+    return re.fullmatch(r"[0-9a-f]{64}(\.[a-z0-9]{1,8})?", name) is not None
+
+
+# ссылка, по которой клиенты получают фотографию
+def photo_url(name):
+    return f"{settings.PUBLIC_BASE_URL}/images/{name}"
+
+
+# загружаемый файл: пишется во временный файл в отдельном потоке, имя определяется хешем содержимого
+class PhotoUpload:
+    def __init__(self, storage, extension, limit):
+        self.storage = storage
+        self.extension = extension
+        self.limit = limit
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.file = None
+
+    async def open(self):
+        self.file = await asyncio.to_thread(tempfile.NamedTemporaryFile, dir=self.storage.content_directory,
+                                            prefix=".upload-", delete=False)
+        return self
+
+    async def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise PhotoTooLarge(f"Photo exceeds {self.limit} bytes")
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+
+    # возвращает имя файла в хранилище; одинаковые фотографии хранятся в одном экземпляре
+    async def commit(self):
+        return await asyncio.to_thread(self._commit)
+
+    def _commit(self):
+        self.file.close()
+        name = self.hash.hexdigest() + self.extension
+        path = os.path.join(self.storage.content_directory, name)
+        if os.path.exists(path):
+            os.remove(self.file.name)
+        else:
+            os.replace(self.file.name, path)
+        return name
+
+    async def abort(self):
+        await asyncio.to_thread(self._abort)
+
+    def _abort(self):
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+
+# хранилище фотографий петиций: файлы лежат в content/ под именами по хешу содержимого,
+# список фотографий петиции хранится в самой петиции (PETITION.PHOTOS)
+class PhotoStorage:
+    def __init__(self, directory, max_photo_size, max_petition_size, max_petition_photos):
+        self.directory = directory
+        self.content_directory = os.path.join(directory, "content")
+        self.max_photo_size = max_photo_size
+        self.max_petition_size = max_petition_size
+        self.max_petition_photos = max_petition_photos
+        os.makedirs(self.content_directory, exist_ok=True)
+
+    # количество и суммарный размер фотографий из списка петиции
+    async def get_usage(self, names):
+        return await asyncio.to_thread(self._get_usage, names)
+
+    def _get_usage(self, names):
+        size = 0
+        for name in names:
+            try:
+                size += os.stat(os.path.join(self.content_directory, name)).st_size
+            except FileNotFoundError:
+                pass
+        return len(names), size
+
+    async def open_upload(self, filename, limit):
+        return await PhotoUpload(self, get_extension(filename), min(limit, self.max_photo_size)).open()
+
+    # сохранение фотографии, переданной строкой base64 (декодирование и запись - вне цикла событий)
+    async def save_base64(self, filename, content):
+        return await asyncio.to_thread(self._save_base64, filename, content)
+
+    def _save_base64(self, filename, content):
+        try:
+            data = base64.b64decode(content, validate=True)
+        except binascii.Error:
+            raise InvalidPhoto(f"Photo {filename} is not valid base64")
+        name = hashlib.sha256(data).hexdigest() + get_extension(filename)
+        path = os.path.join(self.content_directory, name)
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile(dir=self.content_directory, prefix=".upload-", delete=False) as f:
+                f.write(data)
+            os.replace(f.name, path)
+        return name
+
+    # перенос существующего файла (из папок петиций старого формата) в хранилище
+    def import_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        name = digest.hexdigest() + get_extension(path)
+        target = os.path.join(self.content_directory, name)
+        if not os.path.exists(target):
+            with open(path, "rb") as source, tempfile.NamedTemporaryFile(dir=self.content_directory, prefix=".upload-",
+                                                                          delete=False) as f:
+                shutil.copyfileobj(source, f)
+            os.replace(f.name, target)
+        return name
+
+    # проверка ограничений для фотографий в base64 до их декодирования
+    def check_base64_photos(self, photos):
+        if len(photos) > self.max_petition_photos:
+            raise PhotoTooLarge(f"Petition can have at most {self.max_petition_photos} photos")
+        sizes = [len(p.content) * 3 // 4 for p in photos]
+        if any(size > self.max_photo_size for size in sizes):
+            raise PhotoTooLarge(f"Photo exceeds {self.max_photo_size} bytes")
+        if sum(sizes) > self.max_petition_size:
+            raise PhotoTooLarge(f"Petition photos exceed {self.max_petition_size} bytes")
+
+
+photo_storage = PhotoStorage(settings.PHOTOS_DIRECTORY,
+                             max_photo_size=settings.MAX_PHOTO_SIZE,
+                             max_petition_size=settings.MAX_PETITION_PHOTOS_SIZE,
+                             max_petition_photos=settings.MAX_PETITION_PHOTOS)
@@ -0,0 +1,107 @@
+import math
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from app.managers.petition_manager import PetitionManager
+from app.managers.statistics_manager import StatisticsManager
+from app.managers.notification_manager import NotificationManager
+from app.models import (NewPetition, ImportedPetition, PetitionStatus, PetitionStatusBatch, StatusChange, Like, LikeState,
+                        UserPetitionsPage, CityPetitionsPage, AdminPetitionsPage, PetitionSearch)
+from app.pagination import encode_cursor
+
+
+# подменяет хранилище для менеджеров: запросы не выполняются, а записываются вместе с аргументами
+class QueryRecorder:
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.queries = []
+
+    async def select_query(self, query, *args):
+        self.queries.append((query, args))
+        return []
+
+    async def select_one(self, query, *args):
+        self.queries.append((query, args))
+
+    async def insert_returning(self, query, *args):
+        self.queries.append((query, args))
+
+    async def exec_query(self, query, *args):
+        self.queries.append((query, args))
+
+    async def exec_many_query(self, queries):
+        for query, args in queries.items():
+            self.queries.append((query, args))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self
+
+
+# вызовы менеджеров с типичными аргументами: по ним проверяются планы запросов (scripts/db_setup.py explain)
+# и готовятся запросы при старте приложения
+def query_shapes(petition_manager, statistics_manager, notification_manager):
+    now = datetime.now()
+    petition = NewPetition(is_initiative=True, category="Дороги", petition_description="", petitioner_email="user@mail.ru",
+                           address="", header="", region="Регион", city_name="Город")
+    status = PetitionStatus(id=1, admin_id=1, admin_city="Город", admin_region="Регион", status="Открыта", comment="")
+    like = Like(petition_id=1, user_email="user@mail.ru")
+    return {
+        "add_new_petition": petition_manager.add_new_petition(petition),
+        "import_petitions": petition_manager.import_petitions(
+            [(ImportedPetition(**petition.model_dump(), submission_time=now - timedelta(days=30), petition_status="Открыта"), [])]),
+        "update_petition_status": petition_manager.update_petition_status(status),
+        "update_petition_statuses": petition_manager.update_petition_statuses(
+            PetitionStatusBatch(admin_id=1, admin_city="Город", admin_region="Регион",
+                                changes=[StatusChange(id=1, status="Открыта", comment=""), StatusChange(id=2, status="Отклонена", comment="")])),
+        "like_petition": petition_manager.like_petition(like),
+        "like_petitions": petition_manager.like_petitions([LikeState(petition_id=1, user_email="user@mail.ru", liked=True)]),
+        "get_petitions_by_email": petition_manager.get_petitions_by_email("user@mail.ru", UserPetitionsPage(email="user@mail.ru")),
+        "check_city_by_petition_id": petition_manager.check_city_by_petition_id(status),
+        "get_city_petitions": petition_manager.get_city_petitions(
+            CityPetitionsPage(region="Регион", name="Город", is_initiative=True,
+                              cursor=encode_cursor("submission_time", now, 1))),
+        "get_city_petitions (likes)": petition_manager.get_city_petitions(
+            CityPetitionsPage(region="Регион", name="Город", is_initiative=True, sort="likes",
+                              cursor=encode_cursor("likes", 10, 1))),
+        "get_admin_petitions": petition_manager.get_admin_petitions(
+            AdminPetitionsPage(region="Регион", name="Город", status="На модерации",
+                               cursor=encode_cursor("submission_time", now, 1))),
+        "get_admin_petitions (likes)": petition_manager.get_admin_petitions(
+            AdminPetitionsPage(region="Регион", name="Город", sort="likes", cursor=encode_cursor("likes", 10, 1))),
+        "search_petitions": petition_manager.search_petitions(
+            PetitionSearch(query="яма на дороге", region="Регион", city_name="Город",
+                           cursor=encode_cursor("relevance", 0.5, 1)), False, 0.2),
+        "get_petition_data": petition_manager.get_petition_data(1),
+        "check_user_like": petition_manager.check_user_like(like),
+        "get_liked_petitions": petition_manager.get_liked_petitions("user@mail.ru", list(range(1, 101))),
+        "get_petitions_by_ids": petition_manager.get_petitions_by_ids(list(range(1, 11))),
+        "get_like_scores": petition_manager.get_like_scores(math.log(2) / 86400, 10 * 86400),
+        "get_petition_like_scores": petition_manager.get_petition_like_scores(list(range(1, 11)), math.log(2) / 86400, 10 * 86400),
+        "get_petition_photos": petition_manager.get_petition_photos(1),
+        "get_photo_manifest": petition_manager.get_photo_manifest(1),
+        "attach_petition_photos": petition_manager.attach_petition_photos(1, ["photo.jpg"]),
+        "attach_uploaded_photos": petition_manager.attach_uploaded_photos(1, ["photo.jpg"]),
+        "get_brief_subject_analysis": statistics_manager.get_brief_subject_analysis("Регион", "Город", "month"),
+        "get_full_statistics": statistics_manager.get_full_statistics("Регион", "Город", now - timedelta(days=365), now, 10),
+        "get_time_series": statistics_manager.get_time_series("Регион", "Город", now - timedelta(days=365), now, "month"),
+        "dispatch_next": notification_manager.dispatch_next(1000),
+        "claim_batches": notification_manager.claim_batches(10, 60),
+        "ack_batches": notification_manager.ack_batches([1, 2]),
+    }
+
+
+# запросы всех вызовов из query_shapes для диалекта хранилища без повторов: [(запрос, аргументы)]
+async def record_queries(dialect):
+    recorder = QueryRecorder(dialect)
+    shapes = query_shapes(PetitionManager(recorder), StatisticsManager(recorder), NotificationManager(recorder))
+    for call in shapes.values():
+        try:
+            await call
+        except Exception:
+            # менеджер может упасть на пустом результате, запросы к этому моменту уже записаны
+            pass
+    queries = {}
+    for query, args in recorder.queries:
+        queries.setdefault(query, args)
+    return list(queries.items())
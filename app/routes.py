@@ -1,49 +1,195 @@
 import os
-import asyncio
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import FileResponse, JSONResponse
+import json
+import logging
+import tempfile
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, Response
 
-from app.models import (NewPetition, PetitionStatus, Like, UserInfo, PetitionToGetData,
-                        PetitionData, CityWithType, SubjectForBriefAnalysis, City, 
-                        Comment, RegionForDetailedAnalysis)
+from app.models import (NewPetition, PetitionStatus, PetitionStatusBatch, Like, Likes, LikesLookup, NotificationClaim, NotificationAck, UserPetitionsPage, PetitionToGetData,
+                        CityPetitionsPage, AdminPetitionsPage, TrendingPetitions, PetitionSearch, PetitionsByUser, AdminPetitions, SubjectForBriefAnalysis,
+                        Comment, RegionForDetailedAnalysis, TimeSeriesRequest)
+from app.pagination import InvalidCursor
+from app.photo_storage import photo_storage, photo_url, PhotoTooLarge, InvalidPhoto
+from app.images import image_server, ImageNotFound
+from app.uploads import iter_multipart_files, iter_ndjson_lines, InvalidUpload
 
 from app.managers.petition_manager import PetitionManager
 from app.managers.statistics_manager import StatisticsManager
+from app.managers.notification_manager import NotificationManager
+from app.notifications import NotificationDispatcher
+from app.lifecycle import Lifecycle
+from app.admission import AdmissionLimiter, Overloaded
+from app.trending import TrendingTracker
 
 from app.db import db
-from app.config import host, port, user, database, password
+from app.cache import TTLCache
+from app.config import settings
+from app.metrics import registry
 
-petition_manager = PetitionManager(db)
+logger = logging.getLogger("app.routes")
+
+# рейтинг петиций в тренде по городам, обновляется при лайках (восстанавливается по LIKES при старте и периодически)
+trending = TrendingTracker(settings.TRENDING_HALF_LIFE, settings.TRENDING_CAPACITY)
+petition_manager = PetitionManager(db, trending=trending)
 statistics_manager = StatisticsManager(db)
+notification_manager = NotificationManager(db)
+# разбор очереди уведомлений в пакеты получателей (запускается при старте приложения)
+notification_dispatcher = NotificationDispatcher(notification_manager, settings.NOTIFICATION_PAGE_SIZE,
+                                                 settings.NOTIFICATION_IDLE_INTERVAL)
+# кэш результатов аналитики, записи помечены регионом для инвалидации при смене статуса петиции
+analytics_cache = TTLCache(settings.ANALYTICS_CACHE_SIZE)
+# кэш готовых ответов /get_petition_data, записи помечены id петиции и сбрасываются при ее изменении
+petition_cache = TTLCache(settings.PETITION_CACHE_SIZE)
+# ограничение одновременно выполняемых отчетов и аналитики (при промахе кэша), см. ADMISSION_* в настройках
+admission_limiters = {route_class: AdmissionLimiter(route_class,
+                                                    settings.ADMISSION_MAX_CONCURRENT[route_class],
+                                                    settings.ADMISSION_MAX_QUEUE[route_class],
+                                                    settings.ADMISSION_QUEUE_TIMEOUT[route_class])
+                      for route_class in settings.ADMISSION_MAX_CONCURRENT}
+# состояние процесса: прогрев при старте, готовность, остановка с ожиданием запросов в обработке
+lifecycle = Lifecycle()
 
 router = APIRouter()
 
 # маршрут для создания новой петиции
 @router.post("/make_petition", status_code=status.HTTP_201_CREATED)
 async def make_petition(petition: NewPetition):
+    photo_names = []
+    if petition.photos:
+        # фотографии проверяются и сохраняются до создания петиции, чтобы ошибка не оставила петицию без фото
+        try:
+            photo_storage.check_base64_photos(petition.photos)
+            photo_names = await petition_manager.save_petition_photos(petition.photos)
+        except PhotoTooLarge as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        except InvalidPhoto as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     try:
         petition_id = await petition_manager.add_new_petition(petition)
+        if photo_names:
+            await petition_manager.attach_petition_photos(int(petition_id["petition_id"]), photo_names)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    if petition.photos:
-            await petition_manager.add_petition_photos(petition_id, petition.photos)
+    # в кэше мог остаться ответ "не найдено" для этого id
+    petition_cache.invalidate(int(petition_id["petition_id"]))
     return JSONResponse(content = petition_id)
 
-# маршрут для обновления статуса заявки
+# маршрут для массового импорта петиций из NDJSON (одна петиция NewPetition в строке, можно с датой подачи и статусом).
+# тело читается потоково, петиции записываются пакетами; результаты по строкам копятся во временном файле
+# и возвращаются в NDJSON после разбора всего тела, последней строкой - итог
+@router.post("/import_petitions", status_code=status.HTTP_200_OK)
+async def import_petitions(request: Request):
+    results = tempfile.SpooledTemporaryFile(max_size=settings.IMPORT_RESULTS_MEMORY_SIZE)
+    imported = failed = 0
+    try:
+        lines = iter_ndjson_lines(request, settings.IMPORT_MAX_LINE_SIZE)
+        async for batch_results, regions in petition_manager.import_petition_lines(lines, settings.IMPORT_BATCH_SIZE):
+            for region in regions:
+                analytics_cache.invalidate(region)
+            for result in batch_results:
+                if "error" in result:
+                    failed += 1
+                else:
+                    imported += 1
+                    petition_cache.invalidate(result["petition_id"])
+                results.write(json.dumps(result, ensure_ascii=False).encode() + b"\n")
+        results.write(json.dumps({"imported": imported, "failed": failed}).encode() + b"\n")
+        results.seek(0)
+    except Exception as e:
+        results.close()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def read_results():
+        with results:
+            while chunk := results.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(read_results(), media_type="application/x-ndjson")
+
+# маршрут для потоковой загрузки фотографий петиции (multipart/form-data, файлы не буферизуются в памяти)
+@router.post("/upload_petition_photos", status_code=status.HTTP_201_CREATED)
+async def upload_petition_photos(petition_id: int, request: Request):
+    try:
+        manifest = await petition_manager.get_photo_manifest(petition_id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if manifest is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    try:
+        names = await petition_manager.upload_petition_photos(petition_id, manifest, iter_multipart_files(request))
+        petition_cache.invalidate(petition_id)
+    except PhotoTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(status_code=status.HTTP_201_CREATED,
+                        content={"petition_id": petition_id, "photos": [photo_url(name) for name in names]})
+
+# маршрут для обновления статуса заявки. уведомление подписчикам ставится в очередь вместе со сменой статуса
+# и рассылается пакетами через /claim_notification_batches, поэтому ответ не зависит от числа подписчиков
 @router.put("/update_petition_status", status_code=status.HTTP_200_OK)
 async def update_petition_status(petition: PetitionStatus):
     if not (await petition_manager.check_city_by_petition_id(petition)):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='The admin does not have rights to this city')
     try:
-        result, petitioner_emails = await asyncio.gather(petition_manager.update_petition_status(petition),
-                                                        petition_manager.get_petitioners_email(petition))
+        result = await petition_manager.update_petition_status(petition)
     except:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     if result:
-        return JSONResponse(content = petitioner_emails)
+        analytics_cache.invalidate(petition.admin_region)
+        petition_cache.invalidate(petition.id)
+        notification_dispatcher.wake()
+        await track_status_changes([petition.id])
+        return JSONResponse(content = {"petition_id": petition.id, "status": petition.status, "notification_queued": True})
     else:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND)
 
+# статус уже изменен, поэтому ошибка обновления рейтинга в тренде не влияет на ответ
+# (рейтинг исправится при следующем восстановлении)
+async def track_status_changes(petition_ids):
+    try:
+        await petition_manager.track_petitions(petition_ids)
+    except Exception:
+        logger.exception("Ошибка обновления рейтинга петиций в тренде")
+
+# маршрут для пакетной модерации: статусы нескольких заявок города админа меняются одной транзакцией,
+# результат возвращается для каждого элемента ("updated", "forbidden" или "not_found")
+@router.put("/update_petition_statuses", status_code=status.HTTP_200_OK)
+async def update_petition_statuses(batch: PetitionStatusBatch):
+    try:
+        results = await petition_manager.update_petition_statuses(batch)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    updated = {r["id"] for r in results if r["result"] == "updated"}
+    if updated:
+        analytics_cache.invalidate(batch.admin_region)
+        for petition_id in updated:
+            petition_cache.invalidate(petition_id)
+        notification_dispatcher.wake()
+        await track_status_changes(sorted(updated))
+    return JSONResponse(content = {"results": results})
+
+# маршрут для получения пакетов уведомлений на отправку: пакет выдается снова, если его не подтвердили
+# за NOTIFICATION_LEASE секунд
+@router.post("/claim_notification_batches", status_code=status.HTTP_200_OK)
+async def claim_notification_batches(claim: NotificationClaim):
+    try:
+        batches = await notification_manager.claim_batches(claim.limit, settings.NOTIFICATION_LEASE)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = {"batches": batches})
+
+# маршрут для подтверждения отправки пакетов уведомлений
+@router.post("/ack_notification_batches", status_code=status.HTTP_200_OK)
+async def ack_notification_batches(ack: NotificationAck):
+    try:
+        acknowledged = await notification_manager.ack_batches(ack.ids)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = {"acknowledged": acknowledged})
+
 
 # маршрут для проверки лайка
 @router.post("/check_like", status_code=status.HTTP_200_OK)
@@ -54,79 +200,198 @@ async def check_like(like: Like):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return JSONResponse(content = {"result": result})
 
+# маршрут для проверки лайков пользователя сразу для нескольких петиций: возвращает id лайкнутых
+@router.post("/check_likes", status_code=status.HTTP_200_OK)
+async def check_likes(lookup: LikesLookup):
+    try:
+        liked = await petition_manager.get_liked_petitions(lookup.user_email, lookup.petition_ids)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = {"liked": liked})
+
 # маршрут для добавления лайка петиции
 @router.put("/like_petition", status_code=status.HTTP_200_OK)
 async def like_petition(like: Like):
     try:
         result = await petition_manager.like_petition(like)
+        petition_cache.invalidate(like.petition_id)
         if not result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Petition doesn't exists!")
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = result)
 
-# маршрут для получения списка заявок по id  пользователя
-@router.post("/get_petitions", status_code=status.HTTP_200_OK)
-async def get_petitions(user: UserInfo):
+# маршрут для пакетной установки лайков (liked = None в ответе - петиции не существует)
+@router.put("/like_petitions", status_code=status.HTTP_200_OK)
+async def like_petitions(likes: Likes):
     try:
-        petitions = await petition_manager.get_petitions_by_email(user.email)
+        results = await petition_manager.like_petitions(likes.likes)
+        for petition_id in {l.petition_id for l in likes.likes}:
+            petition_cache.invalidate(petition_id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = {"results": results})
+
+# маршрут для получения списка заявок по id  пользователя (постранично)
+@router.post("/get_petitions", status_code=status.HTTP_200_OK, response_model=PetitionsByUser)
+async def get_petitions(user: UserPetitionsPage):
+    try:
+        petitions = await petition_manager.get_petitions_by_email(user.email, user)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return JSONResponse(content = {"petitions": petitions})
+    return Response(petitions.render(), media_type="application/json")
 
-# маршрут для получения списка заявок по названию города
-@router.post("/get_city_petitions", status_code=status.HTTP_200_OK)
-async def get_city_petitions(city: CityWithType):
+# маршрут для получения списка заявок по названию города (постранично)
+@router.post("/get_city_petitions", status_code=status.HTTP_200_OK, response_model=PetitionsByUser)
+async def get_city_petitions(city: CityPetitionsPage):
     try:
         petitions = await petition_manager.get_city_petitions(city)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return JSONResponse(content = {"petitions": petitions})
+    return Response(petitions.render(), media_type="application/json")
 
-# маршрут для получения заявок, с которыми может работать админ
-@router.post("/get_admins_city_petitions", status_code=status.HTTP_200_OK)
-async def get_admins_city_petitions(city: City):
+# маршрут для получения петиций города в тренде: по убыванию счета лайков, затухающего со временем
+@router.post("/get_trending_petitions", status_code=status.HTTP_200_OK, response_model=PetitionsByUser)
+async def get_trending_petitions(city: TrendingPetitions):
+    try:
+        petitions = await petition_manager.get_trending_petitions(city)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(petitions.render(), media_type="application/json")
+
+# маршрут для получения заявок, с которыми может работать админ (постранично)
+@router.post("/get_admins_city_petitions", status_code=status.HTTP_200_OK, response_model=AdminPetitions)
+async def get_admins_city_petitions(city: AdminPetitionsPage):
     try:
         petitions = await petition_manager.get_admin_petitions(city)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(petitions.render(), media_type="application/json")
+
+# маршрут для полнотекстового поиска петиций (без петиций на модерации), постранично
+@router.post("/search_petitions", status_code=status.HTTP_200_OK, response_model=PetitionsByUser)
+async def search_petitions(search: PetitionSearch):
+    try:
+        petitions = await petition_manager.search_petitions(search, False, settings.SEARCH_LIKES_WEIGHT)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(petitions.render(), media_type="application/json")
+
+# маршрут для поиска петиций админом, включая петиции на модерации (например, поиск дубликатов новой жалобы)
+@router.post("/search_admin_petitions", status_code=status.HTTP_200_OK, response_model=PetitionsByUser)
+async def search_admin_petitions(search: PetitionSearch):
+    try:
+        petitions = await petition_manager.search_petitions(search, True, settings.SEARCH_LIKES_WEIGHT)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return JSONResponse(content = {"petitions": petitions})
+    return Response(petitions.render(), media_type="application/json")
 
-# маршрут для получения полных данных по заявке
+# маршрут для получения полных данных по заявке: готовый JSON берется из кэша, при промахе собирается одним запросом
 @router.post('/get_petition_data', status_code=status.HTTP_200_OK)
 async def get_petition_data(petition: PetitionToGetData):
     try:
-        info, output_comments, photos = await asyncio.gather(petition_manager.get_full_petition_info(petition.id),
-                                                      petition_manager.get_petition_comments(petition.id),
-                                                      petition_manager.get_petition_photos(petition.id))
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return PetitionData(id = info["id"], 
-                        header = info["header"], 
-                        is_initiative = info["is_initiative"], 
-                        category = info["category"],
-                        description = info["petition_description"],
-                        status = info["petition_status"],
-                        petitioner_email = info["petitioner_email"],
-                        submission_time = info["submission_time"].strftime('%d.%m.%Y %H:%M'),
-                        address = info["address"],
-                        region = info["region"],
-                        city_name = info["city_name"],
-                        likes_count = info["likes_count"],
-                        comments = output_comments,
-                        photos = photos)
+        content = await petition_cache.get_or_compute(petition.id, settings.PETITION_CACHE_TTL,
+                                                      lambda: load_petition_data(petition.id), tags=(petition.id,))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return Response(content=content, media_type="application/json")
+
+async def load_petition_data(petition_id):
+    petition = await petition_manager.get_petition_data(petition_id)
+    return petition.model_dump_json().encode() if petition else None
+
+# проверка живости процесса: отвечает всегда, пока процесс обрабатывает запросы
+@router.get("/health", status_code=status.HTTP_200_OK)
+async def get_health():
+    return JSONResponse(content = lifecycle.stats())
 
+# проверка готовности для балансировщика: 503 во время прогрева, остановки или если запросы не подготовились
+@router.get("/ready", status_code=status.HTTP_200_OK)
+async def get_ready():
+    return JSONResponse(status_code=status.HTTP_200_OK if lifecycle.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content = lifecycle.stats())
+
+# маршрут для получения статистики кэша полной информации о петициях
+@router.get("/petition_cache_stats", status_code=status.HTTP_200_OK)
+async def get_petition_cache_stats():
+    return JSONResponse(content = petition_cache.stats())
+
+# маршрут для получения статистики пула соединений с БД
+@router.get("/db_stats", status_code=status.HTTP_200_OK)
+async def get_db_stats():
+    return JSONResponse(content = db.stats())
+
+# маршрут для получения статистики диспетчера уведомлений
+@router.get("/notification_stats", status_code=status.HTTP_200_OK)
+async def get_notification_stats():
+    return JSONResponse(content = notification_dispatcher.stats())
+
+# маршрут для получения статистики рейтинга петиций в тренде
+@router.get("/trending_stats", status_code=status.HTTP_200_OK)
+async def get_trending_stats():
+    return JSONResponse(content = trending.stats())
+
+# маршрут для получения состояния ограничений нагрузки по классам маршрутов
+@router.get("/admission_stats", status_code=status.HTTP_200_OK)
+async def get_admission_stats():
+    return JSONResponse(content = {route_class: limiter.stats() for route_class, limiter in admission_limiters.items()})
+
+# маршрут для получения статистики кэша аналитики
+@router.get("/analytics_cache_stats", status_code=status.HTTP_200_OK)
+async def get_analytics_cache_stats():
+    return JSONResponse(content = analytics_cache.stats())
+
+# изображения по имени из хранилища (неизменяемые, кэшируются клиентом) или по старому пути внутри PHOTOS_DIRECTORY
 @router.get("/images/{image_path:path}")
-async def get_image(image_path: str):
-    return FileResponse(image_path)
+async def get_image(image_path: str, request: Request):
+    try:
+        return await image_server.respond(image_path, request.headers)
+    except ImageNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+# метрики в текстовом формате Prometheus
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
+# маршрут для получения статистики кэша изображений
+@router.get("/image_cache_stats", status_code=status.HTTP_200_OK)
+async def get_image_cache_stats():
+    return JSONResponse(content=image_server.stats())
+
+
+# ответ на отклоненный из-за перегрузки запрос
+def overloaded_error(error: Overloaded):
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail=f"Server is overloaded ({error.reason}), retry later",
+                         headers={"Retry-After": str(error.retry_after)})
 
 # маршрут для получения краткой аналитики по населенному пункту
 @router.post("/get_brief_analysis", status_code=status.HTTP_200_OK)
 async def get_brief_analysis(subject: SubjectForBriefAnalysis):
     try:
-        info = await statistics_manager.get_brief_subject_analysis(subject.region, subject.name, subject.period)
+        info = await analytics_cache.get_or_compute(
+            ("brief", subject.region, subject.name, subject.period),
+            settings.ANALYTICS_CACHE_TTL[subject.period],
+            lambda: admission_limiters["analytics"].run(
+                lambda: statistics_manager.get_brief_subject_analysis(subject.region, subject.name, subject.period)),
+            tags=(subject.region,))
+    except Overloaded as e:
+        raise overloaded_error(e)
     except:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return JSONResponse(content = info)
@@ -135,11 +400,40 @@ async def get_brief_analysis(subject: SubjectForBriefAnalysis):
 @router.post("/get_detailed_analysis", status_code=status.HTTP_200_OK)
 async def get_detailed_analysis(subject: RegionForDetailedAnalysis):
     try:
-        info = await statistics_manager.get_full_statistics(subject.region_name, 
-                                                            subject.city_name, 
-                                                            subject.start_time, 
-                                                            subject.end_time, 
-                                                            subject.rows_count)
+        info = await analytics_cache.get_or_compute(
+            ("detailed", subject.region_name, subject.city_name, subject.start_time, subject.end_time, subject.rows_count),
+            settings.ANALYTICS_CACHE_TTL["detailed"],
+            lambda: admission_limiters["reports"].run(
+                lambda: statistics_manager.get_full_statistics(subject.region_name,
+                                                               subject.city_name,
+                                                               subject.start_time,
+                                                               subject.end_time,
+                                                               subject.rows_count)),
+            tags=(subject.region_name,))
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+       raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse(content = info)
+
+# маршрут для получения количества инициатив и жалоб в городе по дням/неделям/месяцам
+@router.post("/get_time_series", status_code=status.HTTP_200_OK)
+async def get_time_series(subject: TimeSeriesRequest):
+    try:
+        info = await analytics_cache.get_or_compute(
+            ("time_series", subject.region_name, subject.city_name, subject.start_time, subject.end_time, subject.bucket),
+            settings.ANALYTICS_CACHE_TTL["detailed"],
+            lambda: admission_limiters["reports"].run(
+                lambda: statistics_manager.get_time_series(subject.region_name,
+                                                           subject.city_name,
+                                                           subject.start_time,
+                                                           subject.end_time,
+                                                           subject.bucket)),
+            tags=(subject.region_name,))
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid period boundaries")
     except Exception as e:
        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    return JSONResponse(content = info)
\ No newline at end of file
+    return JSONResponse(content = info)
@@ -0,0 +1,64 @@
+from json.encoder import encode_basestring
+
+from app.config import settings
+
+
+# даты в списках петиций ('%d.%m.%Y %H:%M'). в одном списке много петиций, поданных в одну и ту же минуту,
+# поэтому строка собирается один раз на минуту, а дальше берется из кэша (одна строка на все такие петиции)
+class MinuteFormatter:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.cache = {}  # номер минуты от начала эпохи -> строка даты
+
+    def format(self, value):
+        key = value.toordinal() * 1440 + value.hour * 60 + value.minute
+        text = self.cache.get(key)
+        if text is None:
+            if len(self.cache) >= self.max_size:
+                self.cache.clear()
+            text = self.cache[key] = "%02d.%02d.%04d %02d:%02d" % (value.day, value.month, value.year,
+                                                                    value.hour, value.minute)
+        return text
+
+
+date_formatter = MinuteFormatter(settings.DATE_CACHE_SIZE)
+
+# шаблоны элементов списка: формат совпадает с JSONResponse для PetitionWithHeader и AdminPetition
+PETITION_TEMPLATE = '{"id":%d,"header":%s,"status":%s,"address":%s,"date":"%s","likes":%d}'
+ADMIN_PETITION_TEMPLATE = '{"id":%d,"header":%s,"status":%s,"address":%s,"date":"%s","likes":%d,"type":%s}'
+PETITION_TYPES = {True: encode_basestring("Инициатива"), False: encode_basestring("Жалоба")}
+
+
+# кортеж для списка петиций: (id, заголовок, статус, адрес, дата, лайки) - вместо модели на каждую строку
+def petition_rows(rows):
+    format_date = date_formatter.format
+    return [(r["id"], r["header"], r["petition_status"], r["address"], format_date(r["submission_time"]), r["likes_count"])
+            for r in rows]
+
+
+# то же для списка админа: дополнительно тип петиции (инициатива или жалоба)
+def admin_petition_rows(rows):
+    format_date = date_formatter.format
+    return [(r["id"], r["header"], r["petition_status"], r["address"], format_date(r["submission_time"]), r["likes_count"],
+             r["is_initiative"]) for r in rows]
+
+
+# страница списка петиций: строки в виде кортежей и курсор следующей страницы.
+# render() сразу собирает JSON-ответ того же вида, что PetitionsByUser/AdminPetitions
+class PetitionPage:
+    def __init__(self, rows, next_cursor=None, admin=False):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.admin = admin
+
+    def render(self):
+        if self.admin:
+            items = [ADMIN_PETITION_TEMPLATE % (petition_id, encode_basestring(header), encode_basestring(status),
+                                                encode_basestring(address), date, likes, PETITION_TYPES[bool(is_initiative)])
+                     for petition_id, header, status, address, date, likes, is_initiative in self.rows]
+        else:
+            items = [PETITION_TEMPLATE % (petition_id, encode_basestring(header), encode_basestring(status),
+                                          encode_basestring(address), date, likes)
+                     for petition_id, header, status, address, date, likes in self.rows]
+        next_cursor = "null" if self.next_cursor is None else encode_basestring(self.next_cursor)
+        return ('{"petitions":[' + ",".join(items) + '],"next_cursor":' + next_cursor + "}").encode()
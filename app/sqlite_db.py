@@ -0,0 +1,432 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from app.metrics import current_method, db_query_duration, db_query_errors, db_pool_wait_duration
+
+
+# схема БД для SQLite: те же таблицы и индексы, что и в scripts/db_setup.py.
+# булевы значения, даты и списки фотографий восстанавливаются по объявленному типу столбца (COLUMN_CONVERTERS)
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS PETITION (
+    ID INTEGER PRIMARY KEY,
+    IS_INITIATIVE BOOLEAN NOT NULL,
+    CATEGORY TEXT NOT NULL,
+    PETITION_DESCRIPTION TEXT NOT NULL,
+    PETITIONER_EMAIL TEXT NOT NULL,
+    ADDRESS TEXT NOT NULL,
+    HEADER TEXT NOT NULL,
+    REGION TEXT NOT NULL,
+    CITY_NAME TEXT NOT NULL,
+    PETITION_STATUS TEXT NOT NULL DEFAULT 'На модерации',
+    SUBMISSION_TIME TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    LIKES_COUNT INTEGER NOT NULL DEFAULT 0,
+    PHOTOS JSON_ARRAY NOT NULL DEFAULT '[]'
+);
+
+CREATE TABLE IF NOT EXISTS COMMENTS (
+    ID INTEGER PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    USER_ID INTEGER NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    SUBMISSION_TIME TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS LIKES (
+    ID INTEGER PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    USER_EMAIL TEXT NOT NULL,
+    LIKED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS PHOTO_FOLDER (
+    ID INTEGER PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    FOLDER_PATH TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS PETITION_STATS_DAILY (
+    REGION TEXT NOT NULL,
+    CITY_NAME TEXT NOT NULL,
+    DAY DATE NOT NULL,
+    IS_INITIATIVE BOOLEAN NOT NULL,
+    CATEGORY TEXT NOT NULL,
+    PETITION_STATUS TEXT NOT NULL,
+    PETITIONS_COUNT INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+);
+
+CREATE TABLE IF NOT EXISTS NOTIFICATION_OUTBOX (
+    ID INTEGER PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    PETITION_STATUS TEXT NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    RECIPIENT_CURSOR TEXT,
+    CREATED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    AVAILABLE_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS NOTIFICATION_BATCH (
+    ID INTEGER PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL,
+    PETITION_STATUS TEXT NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    EMAILS JSON_ARRAY NOT NULL,
+    CREATED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    AVAILABLE_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS PETITION_EMAIL_TIME_IDX ON PETITION (PETITIONER_EMAIL, SUBMISSION_TIME, ID);
+CREATE INDEX IF NOT EXISTS PETITION_CITY_TIME_IDX ON PETITION (REGION, CITY_NAME, IS_INITIATIVE, SUBMISSION_TIME, ID);
+CREATE INDEX IF NOT EXISTS PETITION_CITY_LIKES_IDX ON PETITION (REGION, CITY_NAME, IS_INITIATIVE, LIKES_COUNT, ID);
+CREATE INDEX IF NOT EXISTS PETITION_ADMIN_TIME_IDX ON PETITION (REGION, CITY_NAME, SUBMISSION_TIME, ID);
+CREATE INDEX IF NOT EXISTS PETITION_ADMIN_LIKES_IDX ON PETITION (REGION, CITY_NAME, LIKES_COUNT, ID);
+CREATE INDEX IF NOT EXISTS PETITION_REGION_IDX ON PETITION (REGION, IS_INITIATIVE, SUBMISSION_TIME);
+CREATE UNIQUE INDEX IF NOT EXISTS LIKES_PETITION_USER_UIDX ON LIKES (PETITION_ID, USER_EMAIL);
+CREATE INDEX IF NOT EXISTS LIKES_LIKED_AT_IDX ON LIKES (LIKED_AT);
+CREATE INDEX IF NOT EXISTS COMMENTS_PETITION_IDX ON COMMENTS (PETITION_ID, SUBMISSION_TIME);
+CREATE INDEX IF NOT EXISTS PHOTO_FOLDER_PETITION_IDX ON PHOTO_FOLDER (PETITION_ID);
+CREATE INDEX IF NOT EXISTS PETITION_STATS_REGION_IDX ON PETITION_STATS_DAILY (REGION, DAY);
+CREATE INDEX IF NOT EXISTS NOTIFICATION_OUTBOX_AVAILABLE_IDX ON NOTIFICATION_OUTBOX (AVAILABLE_AT, ID);
+CREATE INDEX IF NOT EXISTS NOTIFICATION_BATCH_AVAILABLE_IDX ON NOTIFICATION_BATCH (AVAILABLE_AT, ID);
+'''
+
+# время лайка в базах, созданных до появления столбца: ALTER TABLE в SQLite не принимает DEFAULT CURRENT_TIMESTAMP,
+# поэтому значение по умолчанию постоянное, а новые лайки записываются с явным временем (LIKE_INSERT_QUERY).
+# для старых лайков временем считается момент миграции, как в PostgreSQL
+LIKED_AT_MIGRATION = '''
+ALTER TABLE LIKES ADD COLUMN LIKED_AT TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00';
+UPDATE LIKES SET LIKED_AT = CURRENT_TIMESTAMP;
+'''
+
+# полнотекстовый индекс петиций (FTS5 по содержимому таблицы PETITION) и триггеры, поддерживающие его актуальным.
+# создается один раз, при создании индекс заполняется по уже существующим петициям.
+# русского стеммера в SQLite нет: слова запроса приводятся к основе в PetitionManager и ищутся по префиксу
+SEARCH_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS PETITION_SEARCH USING FTS5(
+    HEADER, ADDRESS, PETITION_DESCRIPTION,
+    content='PETITION', content_rowid='ID', tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS PETITION_SEARCH_INSERT AFTER INSERT ON PETITION BEGIN
+    INSERT INTO PETITION_SEARCH (ROWID, HEADER, ADDRESS, PETITION_DESCRIPTION)
+    VALUES (NEW.ID, NEW.HEADER, NEW.ADDRESS, NEW.PETITION_DESCRIPTION);
+END;
+
+CREATE TRIGGER IF NOT EXISTS PETITION_SEARCH_DELETE AFTER DELETE ON PETITION BEGIN
+    INSERT INTO PETITION_SEARCH (PETITION_SEARCH, ROWID, HEADER, ADDRESS, PETITION_DESCRIPTION)
+    VALUES ('delete', OLD.ID, OLD.HEADER, OLD.ADDRESS, OLD.PETITION_DESCRIPTION);
+END;
+
+CREATE TRIGGER IF NOT EXISTS PETITION_SEARCH_UPDATE AFTER UPDATE OF HEADER, ADDRESS, PETITION_DESCRIPTION ON PETITION BEGIN
+    INSERT INTO PETITION_SEARCH (PETITION_SEARCH, ROWID, HEADER, ADDRESS, PETITION_DESCRIPTION)
+    VALUES ('delete', OLD.ID, OLD.HEADER, OLD.ADDRESS, OLD.PETITION_DESCRIPTION);
+    INSERT INTO PETITION_SEARCH (ROWID, HEADER, ADDRESS, PETITION_DESCRIPTION)
+    VALUES (NEW.ID, NEW.HEADER, NEW.ADDRESS, NEW.PETITION_DESCRIPTION);
+END;
+
+INSERT INTO PETITION_SEARCH (PETITION_SEARCH) VALUES ('rebuild');
+'''
+
+DROP_SCHEMA = '''
+DROP TABLE IF EXISTS PETITION_SEARCH;
+DROP TABLE IF EXISTS NOTIFICATION_BATCH;
+DROP TABLE IF EXISTS NOTIFICATION_OUTBOX;
+DROP TABLE IF EXISTS PETITION_STATS_DAILY;
+DROP TABLE IF EXISTS PHOTO_FOLDER;
+DROP TABLE IF EXISTS LIKES;
+DROP TABLE IF EXISTS COMMENTS;
+DROP TABLE IF EXISTS PETITION;
+'''
+
+PLACEHOLDER = re.compile(r"\$(\d+)")
+WRITE_STATEMENT = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# преобразования выполняются здесь, а не адаптерами и конвертерами модуля sqlite3: те действуют
+# на все соединения sqlite3 в процессе. значения выражений в другом формате (например, STRFTIME) не меняются
+CONVERTERS = {"BOOLEAN": lambda value: value != 0 if isinstance(value, int) else value,
+              "TIMESTAMP": lambda value: datetime.fromisoformat(value) if ISO_DATE.match(value) else value,
+              "DATE": lambda value: date.fromisoformat(value) if ISO_DATE.fullmatch(value) else value,
+              "JSON_ARRAY": json.loads}
+# столбец результата -> преобразование по типу одноименного столбца схемы (имена столбцов разных типов в схеме не совпадают)
+COLUMN_CONVERTERS = {name.lower(): CONVERTERS[column_type]
+                     for name, column_type in re.findall(rf"^\s+(\w+) ({'|'.join(CONVERTERS)})\b", SCHEMA, re.MULTILINE)}
+
+
+# параметр запроса в представлении, в котором он хранится в SQLite; списки передаются в JSON (JSON_EACH)
+def adapt(value):
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, list):
+        return json.dumps(value, default=adapt_json)
+    return value
+
+
+# даты внутри списков - в том же виде, что и отдельные параметры
+def adapt_json(value):
+    if isinstance(value, date):
+        return adapt(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# запись результата: доступ по имени столбца в нижнем регистре, как у asyncpg
+class Record(dict):
+    pass
+
+
+def record_factory(cursor, row):
+    record = Record(zip([column[0].lower() for column in cursor.description], row))
+    for name, value in record.items():
+        converter = COLUMN_CONVERTERS.get(name)
+        if converter is not None and value is not None:
+            record[name] = converter(value)
+    return record
+
+
+# запросы написаны с параметрами asyncpg ($1, $2, ...), в SQLite им соответствуют ?1, ?2, ...
+@lru_cache(maxsize=1024)
+def translate(query):
+    return PLACEHOLDER.sub(r"?\1", query)
+
+
+# запрос только читает данные и может выполняться на соединении для чтения
+@lru_cache(maxsize=1024)
+def is_read_only(query):
+    return query.lstrip().upper().startswith(("SELECT", "WITH")) and not WRITE_STATEMENT.search(query)
+
+
+# встроенное хранилище на SQLite с тем же интерфейсом, что и Database (PostgreSQL).
+# база в файле работает в режиме WAL: все изменения выполняются одним потоком записи
+# (по одной транзакции за раз), чтение - пулом потоков со своими соединениями и не ждет записи.
+# подготовленные запросы кэшируются каждым соединением (cached_statements).
+# path=":memory:" - база в памяти с одним соединением, запросы выполняются прямо в цикле событий
+# (подмена PostgreSQL в scripts/bench_routes.py: запросы к ней занимают микросекунды)
+class SQLiteDatabase:
+    dialect = "sqlite"
+
+    def __init__(self, path=":memory:", read_pool_size=4, statement_cache_size=256, busy_timeout=5):
+        self.path = path
+        self.in_memory = path == ":memory:"
+        self.read_pool_size = 0 if self.in_memory else read_pool_size
+        self.statement_cache_size = statement_cache_size
+        self.busy_timeout = busy_timeout
+        self.connection = None
+        self.writer = None
+        self.readers = None
+        self.reader_connections = []
+        self.local = threading.local()
+        # запись (и любые запросы к базе в памяти) - по одной; транзакция держит блокировку до конца
+        self.write_lock = asyncio.Lock()
+
+        self.waiting = 0
+        self.queries_total = 0
+        self.query_errors = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _open(self, read_only=False):
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                     timeout=self.busy_timeout, cached_statements=self.statement_cache_size)
+        connection.row_factory = record_factory
+        connection.execute("PRAGMA foreign_keys = ON")
+        if not self.in_memory:
+            connection.execute("PRAGMA synchronous = NORMAL")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def _open_reader(self):
+        self.local.connection = self._open(read_only=True)
+        self.reader_connections.append(self.local.connection)
+
+    # открытие соединений и создание схемы (вызывается при старте приложения)
+    async def connect(self):
+        if self.connection is not None:
+            return
+        if self.in_memory:
+            self.connection = self._open()
+        else:
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+            self.connection = await asyncio.get_running_loop().run_in_executor(self.writer, self._open)
+            await self._run(self.writer, lambda: self.connection.execute("PRAGMA journal_mode = WAL"))
+        await self.bootstrap()
+        if self.read_pool_size:
+            self.readers = ThreadPoolExecutor(max_workers=self.read_pool_size, thread_name_prefix="sqlite-reader",
+                                              initializer=self._open_reader)
+
+    # создание недостающих таблиц и индексов; reset=True - пересоздание схемы (все данные удаляются!)
+    async def bootstrap(self, reset=False):
+        script = SCHEMA
+        if reset:
+            script = DROP_SCHEMA + script
+        async with self.write_lock:
+            columns_query = "PRAGMA table_info(LIKES)"
+            columns = await self._run(self.writer, lambda: self.connection.execute(columns_query).fetchall())
+            if columns and "LIKED_AT" not in {c["name"].upper() for c in columns}:
+                await self._run(self.writer, lambda: self.connection.executescript(LIKED_AT_MIGRATION))
+            await self._run(self.writer, lambda: self.connection.executescript(script))
+            search_query = "SELECT 1 FROM SQLITE_MASTER WHERE NAME = 'PETITION_SEARCH'"
+            if await self._run(self.writer, lambda: self.connection.execute(search_query).fetchone()) is None:
+                await self._run(self.writer, lambda: self.connection.executescript(SEARCH_SCHEMA))
+
+    # закрытие: ждем завершения запросов в потоках, затем закрываем соединения
+    async def close(self):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        readers, self.readers = self.readers, None
+        async with self.write_lock:
+            await asyncio.to_thread(self._shutdown, connection, readers)
+
+    def _shutdown(self, connection, readers):
+        if readers is not None:
+            readers.shutdown(wait=True)
+        for reader in self.reader_connections:
+            reader.close()
+        self.reader_connections = []
+        if self.writer is not None:
+            self.writer.shutdown(wait=True)
+            self.writer = None
+        connection.close()
+
+    def stats(self):
+        return {"path": self.path,
+                "read_pool_size": self.read_pool_size,
+                "waiting": self.waiting,
+                "queries_total": self.queries_total,
+                "query_errors": self.query_errors,
+                "avg_wait_ms": self.wait_time_total / self.queries_total * 1000 if self.queries_total else 0.0,
+                "max_wait_ms": self.wait_time_max * 1000}
+
+    # прогрев при старте: открываются все соединения для чтения, запросы менеджеров компилируются (EXPLAIN)
+    # на соединении записи, ошибки схемы видны до первого запроса. интерфейс тот же, что у Database.warmup
+    async def warmup(self, queries):
+        if self.readers is not None:
+            # задачи ждут друг друга на барьере, поэтому каждая занимает свой поток (и открывает свое соединение)
+            barrier = threading.Barrier(self.read_pool_size)
+            await asyncio.gather(*[self._run(self.readers, lambda: barrier.wait(self.busy_timeout))
+                                   for _ in range(self.read_pool_size)])
+        failed = {}
+        async with self.write_lock:
+            for query, args in queries:
+                try:
+                    await self._write("explain", "EXPLAIN " + query, args, "all")
+                except Exception as e:
+                    failed[query] = e
+        return 1 + len(self.reader_connections), failed
+
+    # выполнение функции в потоке соединения с учетом времени ожидания потока и метрик
+    async def _run(self, executor, function, operation="script"):
+        method = current_method.get()
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return started, function()
+
+        self.waiting += 1
+        try:
+            if executor is None:
+                started, result = timed()
+            else:
+                started, result = await asyncio.get_running_loop().run_in_executor(executor, timed)
+        except Exception as e:
+            self.query_errors += 1
+            db_query_errors.inc((method, operation, type(e).__name__))
+            raise
+        finally:
+            self.waiting -= 1
+        finished = time.perf_counter()
+        wait_time = started - submitted
+        self.queries_total += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        db_pool_wait_duration.observe((method,), wait_time)
+        db_query_duration.observe((method, operation), finished - started)
+        return result
+
+    def _fetch(self, connection, query, args, fetch):
+        cursor = connection.execute(translate(query), [adapt(value) for value in args])
+        if fetch == "all":
+            return cursor.fetchall()
+        if fetch == "one":
+            return cursor.fetchone()
+        if fetch == "value":
+            row = cursor.fetchone()
+            return next(iter(row.values())) if row else None
+        return None
+
+    # запрос в потоке записи; вызывающий должен держать write_lock
+    async def _write(self, operation, query, args, fetch):
+        if self.connection is None:
+            raise RuntimeError("Database is not connected")
+        return await self._run(self.writer, lambda: self._fetch(self.connection, query, args, fetch), operation)
+
+    async def _execute(self, operation, query, args, fetch):
+        if self.readers is not None and is_read_only(query):
+            return await self._run(self.readers, lambda: self._fetch(self.local.connection, query, args, fetch), operation)
+        async with self.write_lock:
+            return await self._write(operation, query, args, fetch)
+
+    # выборка нескольких записей
+    async def select_query(self, query, *args):
+        return await self._execute("select", query, args, "all")
+
+    # выборка одной записи (None, если записи нет)
+    async def select_one(self, query, *args):
+        return await self._execute("select_one", query, args, "one")
+
+    # вставка с возвратом значения первого столбца из RETURNING
+    async def insert_returning(self, query, *args):
+        return await self._execute("insert_returning", query, args, "value")
+
+    # выполнение запроса без возврата данных
+    async def exec_query(self, query, *args):
+        await self._execute("exec", query, args, None)
+
+    # выполнение нескольких запросов в одной транзакции: {запрос: [аргументы]}
+    async def exec_many_query(self, queries):
+        async with self.transaction() as transaction:
+            for query, args in queries.items():
+                await transaction.exec_query(query, *args)
+
+    # транзакция для нескольких зависящих друг от друга запросов (то, что в PostgreSQL
+    # делается одним запросом с изменяющими данные CTE); выполняется целиком в потоке записи
+    @asynccontextmanager
+    async def transaction(self):
+        async with self.write_lock:
+            await self._write("begin", "BEGIN IMMEDIATE", (), None)
+            try:
+                yield SQLiteTransaction(self)
+            except BaseException:
+                await self._write("rollback", "ROLLBACK", (), None)
+                raise
+            await self._write("commit", "COMMIT", (), None)
+
+
+# запросы внутри открытой транзакции (блокировка записи уже у нее)
+class SQLiteTransaction:
+    def __init__(self, database):
+        self.database = database
+
+    async def select_query(self, query, *args):
+        return await self.database._write("select", query, args, "all")
+
+    async def select_one(self, query, *args):
+        return await self.database._write("select_one", query, args, "one")
+
+    async def insert_returning(self, query, *args):
+        return await self.database._write("insert_returning", query, args, "value")
+
+    async def exec_query(self, query, *args):
+        await self.database._write("exec", query, args, None)
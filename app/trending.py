@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger("app.trending")
+
+
+# рейтинг петиций "в тренде" по городам: (регион, город, is_initiative) -> петиции с наибольшим счетом.
+# счет - сумма лайков, каждый из которых теряет половину веса за half_life секунд. веса считаются
+# от общей точки отсчета (вес нового лайка растет со временем), поэтому старые счета не нужно пересчитывать:
+# порядок петиций тот же, что у честно затухающих счетов. в каждом городе хранится не больше capacity
+# петиций; новая петиция вытесняет петицию с наименьшим счетом, только если ее счет больше.
+# счет петиции вне заполненного рейтинга неизвестен, поэтому ее лайк не прибавляется, а like() просит
+# полный счет из БД (load_scores). рейтинг обновляется при каждом лайке и смене статуса (PetitionManager)
+# и периодически восстанавливается по таблице LIKES: так учитываются лайки через другие процессы приложения.
+# изменения, пришедшие во время загрузки счетов из БД, повторяются поверх загруженных; изменение, успевшее
+# попасть и в загрузку, учитывается дважды (до следующего восстановления)
+class TrendingTracker:
+    def __init__(self, half_life, capacity):
+        self.decay = math.log(2) / half_life
+        # лайки старше 10 периодов полураспада дают меньше 0.1% веса и не загружаются
+        self.window = 10 * half_life
+        self.capacity = capacity
+        self.landmark = time.monotonic()
+        self.groups = {}        # (регион, город, is_initiative) -> {id петиции: счет}
+        self.truncated = set()  # группы, из которых вытеснялись петиции
+        self.tops = {}          # группа -> id петиций по убыванию счета (пересчитывается после изменений)
+        # загрузки счетов из БД в процессе: (id петиций или None - все петиции, изменения во время загрузки)
+        self.watches = []
+        self.task = None
+
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.refresh_duration = 0.0
+
+    # вес лайка, поставленного в момент moment (по time.monotonic), относительно точки отсчета
+    def weight(self, moment):
+        exponent = self.decay * (moment - self.landmark)
+        if exponent > 500:
+            self._rebase()
+            exponent = self.decay * (moment - self.landmark)
+        return math.exp(exponent)
+
+    # перенос точки отсчета на текущий момент, чтобы веса не переполнились
+    def _rebase(self):
+        now = time.monotonic()
+        factor = math.exp(-self.decay * (now - self.landmark))
+        for scores in self.groups.values():
+            for petition_id in scores:
+                scores[petition_id] *= factor
+        self.landmark = now
+
+    # лайк петиции. False - петиции нет в рейтинге, из которого уже вытеснялись петиции:
+    # прибавлять лайк не к чему, нужен ее полный счет (load_scores)
+    def like(self, petition_id, group, status):
+        if status == "На модерации":
+            return True
+        if petition_id not in self.groups.get(group, {}) and self._lossy(group):
+            return False
+        self._apply(("add", petition_id, group, time.monotonic(), 1))
+        return True
+
+    # снятие лайка, поставленного age секунд назад: вычитается его вклад
+    def unlike(self, petition_id, group, status, age):
+        if status != "На модерации":
+            self._apply(("add", petition_id, group, time.monotonic() - age, -1))
+
+    # полные текущие счета петиций из БД (после лайка петиции вне рейтинга или смены статуса):
+    # load_petitions(ids, decay, window) возвращает строки с id, region, city_name, is_initiative, petition_status и score
+    async def load_scores(self, load_petitions, petition_ids):
+        watch = (set(petition_ids), [])
+        self.watches.append(watch)
+        try:
+            rows = await load_petitions(petition_ids, self.decay, self.window)
+        finally:
+            self.watches.remove(watch)
+        now = time.monotonic()
+        for r in rows:
+            score = 0 if r["petition_status"] == "На модерации" else r["score"]
+            self._apply(("set", r["id"], (r["region"], r["city_name"], r["is_initiative"]), now, score))
+        for change in watch[1]:
+            self._change(*change)
+
+    # в группе могут быть петиции с неизвестным счетом: рейтинг заполнен или из него уже вытеснялись петиции
+    def _lossy(self, group):
+        return group in self.truncated or len(self.groups.get(group, ())) >= self.capacity
+
+    def _apply(self, change):
+        for petition_ids, changes in self.watches:
+            if petition_ids is None or change[1] in petition_ids:
+                changes.append(change)
+        self._change(*change)
+
+    # add - прибавить вес лайка (value = 1 или -1), set - заменить счет (value - счет на момент moment).
+    # False - лайк петиции вне рейтинга, где ее счет неизвестен (только при повторе изменений после загрузки)
+    def _change(self, kind, petition_id, group, moment, value):
+        scores = self.groups.setdefault(group, {})
+        if kind == "add":
+            delta = value * self.weight(moment)
+            if petition_id in scores:
+                score = scores[petition_id] + delta
+                # остаток после снятия последнего лайка (погрешность времени лайка) - петиция уходит из рейтинга
+                if score > 0.01 * self.weight(time.monotonic()):
+                    scores[petition_id] = score
+                else:
+                    del scores[petition_id]
+            elif delta > 0:
+                if self._lossy(group):
+                    return False
+                self._insert(scores, group, petition_id, delta)
+        else:
+            scores.pop(petition_id, None)
+            if value > 0:
+                self._insert(scores, group, petition_id, value * self.weight(moment))
+        self.tops.pop(group, None)
+        return True
+
+    def _insert(self, scores, group, petition_id, score):
+        if len(scores) >= self.capacity:
+            self.truncated.add(group)
+            weakest = min(scores, key=scores.get)
+            if scores[weakest] >= score:
+                return
+            del scores[weakest]
+        scores[petition_id] = score
+
+    # id limit петиций с наибольшим счетом в группе
+    def top(self, group, limit):
+        ranking = self.tops.get(group)
+        if ranking is None:
+            scores = self.groups.get(group, {})
+            ranking = self.tops[group] = sorted(scores, key=scores.get, reverse=True)
+        return ranking[:limit]
+
+    # восстановление по таблице LIKES: load(decay, window) возвращает петиции с лайками за окно
+    # (id, region, city_name, is_initiative, score - текущий счет). полные счета петиций, лайки которых
+    # после загрузки не к чему прибавить, дает load_petitions (см. load_scores)
+    async def refresh(self, load, load_petitions):
+        start_time = time.perf_counter()
+        watch = (None, [])
+        self.watches.append(watch)
+        try:
+            landmark = time.monotonic()
+            rows = await load(self.decay, self.window)
+        finally:
+            self.watches.remove(watch)
+        groups = {}
+        for r in rows:
+            groups.setdefault((r["region"], r["city_name"], r["is_initiative"]), {})[r["id"]] = r["score"]
+        truncated = set()
+        for group, scores in groups.items():
+            if len(scores) > self.capacity:
+                groups[group] = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.capacity])
+                truncated.add(group)
+        self.groups = groups
+        self.truncated = truncated
+        self.tops = {}
+        self.landmark = landmark
+        unknown = sorted({change[1] for change in watch[1] if not self._change(*change)})
+        if unknown:
+            await self.load_scores(load_petitions, unknown)
+        self.refreshes += 1
+        self.refresh_duration = time.perf_counter() - start_time
+
+    # периодическое восстановление (запускается при старте приложения)
+    def start(self, load, load_petitions, interval):
+        if self.task is None and interval > 0:
+            self.task = asyncio.create_task(self.run(load, load_petitions, interval))
+
+    async def stop(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def run(self, load, load_petitions, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(load, load_petitions)
+            except Exception:
+                self.refresh_errors += 1
+                logger.exception("Ошибка восстановления рейтинга петиций в тренде")
+
+    def stats(self):
+        return {"groups": len(self.groups),
+                "petitions": sum(len(scores) for scores in self.groups.values()),
+                "truncated_groups": len(self.truncated),
+                "capacity": self.capacity,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "last_refresh_ms": self.refresh_duration * 1000}
@@ -0,0 +1,102 @@
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+# потоковый разбор тела multipart/form-data без буферизации файлов в памяти.
+# выдает события ("file", имя файла), ("data", часть содержимого), ("end", None) для каждого файла;
+# обычные поля формы и файловые поля с пустым именем файла (так браузер отправляет поле без выбранного файла) пропускаются
+async def iter_multipart_files(request):
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected multipart/form-data with boundary")
+
+    events = []
+    part = {"header_field": b"", "header_value": b"", "disposition": b"", "is_file": False}
+
+    def on_part_begin():
+        part.update(header_field=b"", header_value=b"", disposition=b"", is_file=False)
+
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        if part["header_field"].lower() == b"content-disposition":
+            part["disposition"] = part["header_value"]
+        part["header_field"] = part["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["disposition"])
+        if options.get(b"filename"):
+            part["is_file"] = True
+            events.append(("file", options[b"filename"].decode("utf-8", "replace")))
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            events.append(("data", data[start:end]))
+
+    def on_part_end():
+        if part["is_file"]:
+            events.append(("end", None))
+
+    parser = MultipartParser(params[b"boundary"], {"on_part_begin": on_part_begin,
+                                                   "on_header_field": on_header_field,
+                                                   "on_header_value": on_header_value,
+                                                   "on_header_end": on_header_end,
+                                                   "on_headers_finished": on_headers_finished,
+                                                   "on_part_data": on_part_data,
+                                                   "on_part_end": on_part_end})
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events:
+                yield event
+            events.clear()
+        parser.finalize()
+    except InvalidUpload:
+        raise
+    except Exception as e:
+        if type(e).__module__.startswith("multipart"):
+            raise InvalidUpload(str(e))
+        raise
+    for event in events:
+        yield event
+
+
+# потоковый разбор тела в формате NDJSON по строкам без буферизации всего тела.
+# выдает (номер строки, содержимое); для строки длиннее max_line_size содержимое None, остаток строки пропускается.
+# пустые строки не выдаются, но учитываются в нумерации
+async def iter_ndjson_lines(request, max_line_size):
+    buffer = bytearray()
+    number = 1
+    skipping = False
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_size:
+                        buffer.clear()
+                        skipping = True
+                        yield number, None
+                break
+            if skipping:
+                skipping = False
+            else:
+                buffer += chunk[start:end]
+                if len(buffer) > max_line_size:
+                    yield number, None
+                elif buffer.strip():
+                    yield number, bytes(buffer)
+            buffer.clear()
+            number += 1
+            start = end + 1
+    if not skipping and buffer.strip():
+        yield number, None if len(buffer) > max_line_size else bytes(buffer)
@@ -1,45 +1,47 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 #from fastapi.middleware.cors import CORSMiddleware
-from app.routes import router
-import logging
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
-import time
-
-# Настройка логирования в файл
-logging.basicConfig(
-    level=logging.ERROR,  # Уровень логирования ERROR
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='app.log',  # Имя файла для логов
-)
-
-app = FastAPI()
-
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        inf = f"Запрос: {request.method} {request.url} Headers: {request.headers} Body: {await request.body()}"
-        response = await call_next(request)
-        
-        # Если статус ответа - ошибка (код >= 400), записываем в лог
-        if response.status_code >= 400:
-            # Логгирование ошибки
-            execution_time = time.time() - start_time
-            logging.error(f"Ошибка: {response.status_code} {request.method} {request.url} Время выполнения: {execution_time:.2f} сек, {inf}")
-        
-        return response
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
-
-app.add_middleware(LoggingMiddleware)
+from app.routes import router, notification_dispatcher, lifecycle, trending, petition_manager
+from app.db import db
+from app.config import settings
+from app.logging_setup import configure_logging
+from app.middleware import RequestLoggingMiddleware, MetricsMiddleware, LifecycleMiddleware
+
+# Настройка логирования в файл (запись в файл выполняется в отдельном потоке)
+log_listener = configure_logging(settings.LOG_FILE, settings.LOG_LEVEL)
+
+# при старте проверяем настройки, открываем пул соединений с БД, прогреваем его (подготовка запросов менеджеров)
+# восстанавливаем рейтинг петиций в тренде по лайкам и запускаем диспетчер уведомлений.
+# сигнал остановки сначала переводит процесс в draining (см. Lifecycle.install_signal_handlers), и только после
+# завершения запросов сервер запускает остановку: останавливаем фоновые задачи и закрываем пул
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    errors = settings.validate()
+    if errors:
+        raise RuntimeError("Некорректные настройки: " + "; ".join(errors))
+    log_listener.start()
+    await db.connect()
+    try:
+        await lifecycle.warm_up(db)
+        await trending.refresh(petition_manager.get_like_scores, petition_manager.get_petition_like_scores)
+        trending.start(petition_manager.get_like_scores, petition_manager.get_petition_like_scores,
+                       settings.TRENDING_REFRESH_INTERVAL)
+        notification_dispatcher.start()
+        lifecycle.install_signal_handlers(settings.SHUTDOWN_DRAIN_DELAY, settings.SHUTDOWN_DRAIN_TIMEOUT)
+        yield
+    finally:
+        lifecycle.state = "draining"
+        await notification_dispatcher.stop()
+        await trending.stop()
+        await db.close()
+        log_listener.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(LifecycleMiddleware, lifecycle=lifecycle)
+app.add_middleware(RequestLoggingMiddleware, body_snapshot_size=settings.LOG_BODY_SNAPSHOT_SIZE,
+                   rate_limit=settings.LOG_RATE_LIMIT)
+app.add_middleware(MetricsMiddleware)
 
 # Разрешить запросы с любых источников (*)
 '''app.add_middleware(
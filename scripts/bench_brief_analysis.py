@@ -0,0 +1,78 @@
+# Сравнение краткой аналитики: один проход по сводной статистике против восьми параллельных запросов
+# Запуск из корня проекта: python -m scripts.bench_brief_analysis --region Регион --city Город
+#   --seed N  - предварительно добавить N синтетических петиций в регион (только для тестовой БД!)
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from app.db import db
+from app.managers.statistics_manager import StatisticsManager
+
+CATEGORIES = ["Дороги", "ЖКХ", "Благоустройство", "Транспорт", "Экология", "Освещение", "Мусор", "Парковки"]
+STATUSES = ["На модерации", "Открыта", "В работе", "Решена", "Отклонена"]
+
+
+async def seed(region, city, count):
+    now = datetime.now()
+    cities = [city] + [f"{city} {i}" for i in range(1, 10)]
+    rows = [(random.random() < 0.4, random.choice(CATEGORIES), "", "bench@mail.ru", "", "",
+             region, random.choice(cities), random.choice(STATUSES), now - timedelta(days=random.randint(0, 730)))
+            for _ in range(count)]
+    async with db.pool.acquire() as connection:
+        await connection.copy_records_to_table("petition", records=rows, columns=[
+            "is_initiative", "category", "petition_description", "petitioner_email", "address", "header",
+            "region", "city_name", "petition_status", "submission_time"])
+    await StatisticsManager(db).rebuild_stats_rollup()
+
+
+async def measure(method, region, city, period, iterations, concurrency):
+    latencies = []
+    acquired_before = db.acquired_total
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start_time = time.perf_counter()
+            await method(region, city, period)
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[call() for _ in range(iterations)])
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+    return {"rps": iterations / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            "queries_per_call": (db.acquired_total - acquired_before) / iterations}
+
+
+async def main(args):
+    await db.connect()
+    try:
+        if args.seed:
+            await seed(args.region, args.city, args.seed)
+        manager = StatisticsManager(db)
+        single_pass = await manager.get_brief_subject_analysis(args.region, args.city, args.period)
+        fanout = await manager.get_brief_subject_analysis_fanout(args.region, args.city, args.period)
+        print("Результаты совпадают:", single_pass == fanout)
+        for name, method in (("один проход", manager.get_brief_subject_analysis),
+                             ("8 запросов", manager.get_brief_subject_analysis_fanout)):
+            result = await measure(method, args.region, args.city, args.period, args.iterations, args.concurrency)
+            print(f"{name:12} {result['rps']:8.1f} запр/с  p50 {result['p50_ms']:7.2f} мс  "
+                  f"p95 {result['p95_ms']:7.2f} мс  обращений к пулу на вызов {result['queries_per_call']:.0f}")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк краткой аналитики")
+    parser.add_argument("--region", required=True)
+    parser.add_argument("--city", required=True)
+    parser.add_argument("--period", choices=["day", "week", "month", "year"], default="year")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,430 @@
+# Нагрузочный тест всех маршрутов app/routes.py через ASGI-приложение, без сети и без PostgreSQL:
+# менеджеры работают с SQLite в памяти, заполненной воспроизводимыми данными (--seed).
+# Запуск из корня проекта:
+#   python -m scripts.bench_routes                          - прогон и сравнение с scripts/bench_baseline.json
+#   python -m scripts.bench_routes --update-baseline        - прогон и сохранение результатов как базовых
+#   python -m scripts.bench_routes --only like_toggle list_city
+#   python -m scripts.bench_routes --db-file                - встроенная база в файле (WAL, поток записи, пул чтения)
+#   python -m scripts.bench_routes --keep-workdir           - не удалять временный каталог (фотографии, журнал, база)
+# Код возврата 1, если какой-либо сценарий медленнее базового больше чем на --threshold или завершился ошибками.
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# фотографии, журнал и база бенчмарка не должны попадать в рабочие каталоги; временный каталог
+# удаляется при выходе, если не передан --keep-workdir
+_workdir = tempfile.mkdtemp(prefix="bench-routes-")
+_keep_workdir = False
+
+
+@atexit.register
+def _remove_workdir():
+    if _keep_workdir:
+        print(f"Рабочий каталог сохранен: {_workdir}")
+    else:
+        shutil.rmtree(_workdir, ignore_errors=True)
+
+
+os.environ["PHOTOS_DIRECTORY"] = os.path.join(_workdir, "photos") + "/"
+os.environ["LOG_FILE"] = os.path.join(_workdir, "app.log")
+# очереди ограничения нагрузки вмещают все одновременные запросы сценария: меряются сами маршруты, а не отказы
+os.environ.setdefault("ADMISSION_MAX_QUEUE_REPORTS", "1000")
+os.environ.setdefault("ADMISSION_MAX_QUEUE_ANALYTICS", "1000")
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+import main
+from app import routes
+from app.managers.statistics_manager import StatisticsManager
+from app.sqlite_db import SQLiteDatabase
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+REGIONS = [f"Регион {i}" for i in range(1, 5)]
+CITIES = [f"Город {i}" for i in range(1, 6)]
+CATEGORIES = ["Дороги", "ЖКХ", "Благоустройство", "Транспорт", "Экология", "Освещение", "Мусор", "Парковки"]
+STATUSES = ["На модерации", "Открыта", "В работе", "Решена", "Отклонена"]
+PERIODS = ["day", "week", "month", "year"]
+
+
+# вызов ASGI-приложения в том же процессе: (код ответа, тело)
+async def call(app, method, path, body=b"", headers=()):
+    path, _, query_string = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": query_string.encode(), "server": ("bench", 80), "client": ("127.0.0.1", 1),
+             "headers": [(b"host", b"bench"), (b"content-length", str(len(body)).encode()), *headers]}
+    received = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+async def call_json(app, method, path, payload):
+    return await call(app, method, path, json.dumps(payload).encode(), [(b"content-type", b"application/json")])
+
+
+def multipart(files):
+    boundary = "benchboundary"
+    parts = []
+    for name, content in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="photos"; filename="{name}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + content + b"\r\n")
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+    return body, [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]
+
+
+# сценарий нагрузки: функция одного запроса и допустимые коды ответа
+class Scenario:
+    def __init__(self, name, request, expected=(200,), concurrency=None):
+        self.name = name
+        self.request = request
+        self.expected = expected
+        self.concurrency = concurrency
+
+
+# воспроизводимые данные: петиции за последние 400 дней; число петиций у авторов и число лайков
+# распределены с длинным хвостом (немного очень популярных петиций и очень активных авторов)
+def seed(db, petitions, rng):
+    now = datetime.now().replace(microsecond=0)
+    users = [f"user{i}@mail.ru" for i in range(max(petitions // 10, 10))]
+    rows = [(rng.random() < 0.4, rng.choice(CATEGORIES), "Описание петиции " * 10,
+             users[min(int(rng.paretovariate(1.1)) - 1, len(users) - 1)], "Адрес", "Заголовок петиции",
+             rng.choice(REGIONS), rng.choice(CITIES), rng.choice(STATUSES),
+             (now - timedelta(seconds=rng.randint(0, 400 * 24 * 3600))).isoformat(" "), min(int(rng.paretovariate(1.2)) - 1, 3000))
+            for _ in range(petitions)]
+    connection = db.connection
+    connection.execute("BEGIN")
+    connection.executemany('''INSERT INTO PETITION (IS_INITIATIVE, CATEGORY, PETITION_DESCRIPTION, PETITIONER_EMAIL,
+        ADDRESS, HEADER, REGION, CITY_NAME, PETITION_STATUS, SUBMISSION_TIME, LIKES_COUNT)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    connection.executemany("INSERT INTO LIKES (PETITION_ID, USER_EMAIL) VALUES (?, ?)",
+                           ((petition_id, f"liker{n}@mail.ru") for petition_id, likes in enumerate((r[-1] for r in rows), 1)
+                            for n in range(likes)))
+    connection.executemany("INSERT INTO COMMENTS (PETITION_ID, USER_ID, COMMENT_DESCRIPTION) VALUES (?, ?, ?)",
+                           ((rng.randint(1, petitions), 1, "Комментарий администратора") for _ in range(petitions // 2)))
+    connection.execute("COMMIT")
+    hot = [r["id"] for r in connection.execute("SELECT ID FROM PETITION ORDER BY LIKES_COUNT DESC LIMIT 20")]
+    return {"petitions": petitions, "users": users, "hot": hot, "cursors": {}, "photos": [], "next_user": 0}
+
+
+# случайный id петиции: чаще открывают популярные
+def pick_petition(state, rng):
+    return rng.choice(state["hot"]) if rng.random() < 0.3 else rng.randint(1, state["petitions"])
+
+
+# следующая страница списка: продолжение по курсору предыдущего ответа или первая страница
+async def list_page(app, state, rng, path, payload, key):
+    cursor = state["cursors"].get(key)
+    if cursor and rng.random() < 0.7:
+        payload["cursor"] = cursor
+    status, body = await call_json(app, "POST", path, payload)
+    if status == 200:
+        state["cursors"][key] = json.loads(body)["next_cursor"]
+    return status, body
+
+
+async def list_user(app, state, rng):
+    email = state["users"][min(int(rng.paretovariate(1.1)) - 1, len(state["users"]) - 1)]
+    return await list_page(app, state, rng, "/get_petitions", {"email": email, "limit": 20}, ("user", email))
+
+
+async def list_city(app, state, rng):
+    region, city, kind = rng.choice(REGIONS), rng.choice(CITIES), rng.random() < 0.5
+    return await list_page(app, state, rng, "/get_city_petitions",
+                           {"region": region, "name": city, "is_initiative": kind, "limit": 20},
+                           ("city", region, city, kind))
+
+
+async def list_city_likes(app, state, rng):
+    region, city, kind = rng.choice(REGIONS), rng.choice(CITIES), rng.random() < 0.5
+    return await list_page(app, state, rng, "/get_city_petitions",
+                           {"region": region, "name": city, "is_initiative": kind, "limit": 20, "sort": "likes"},
+                           ("city_likes", region, city, kind))
+
+
+# петиции города в тренде: id из рейтинга в памяти, данные - одним запросом по id
+async def list_trending(app, state, rng):
+    return await call_json(app, "POST", "/get_trending_petitions",
+                           {"region": rng.choice(REGIONS), "name": rng.choice(CITIES), "is_initiative": rng.random() < 0.5,
+                            "limit": 20})
+
+
+async def list_admin(app, state, rng):
+    region, city = rng.choice(REGIONS), rng.choice(CITIES)
+    status = rng.choice([None, "На модерации"])
+    return await list_page(app, state, rng, "/get_admins_city_petitions",
+                           {"region": region, "name": city, "limit": 50, "status": status},
+                           ("admin", region, city, status))
+
+
+async def petition_data(app, state, rng):
+    return await call_json(app, "POST", "/get_petition_data", {"id": pick_petition(state, rng)})
+
+
+async def check_like(app, state, rng):
+    return await call_json(app, "POST", "/check_like",
+                           {"petition_id": pick_petition(state, rng), "user_email": f"liker{rng.randint(0, 50)}@mail.ru"})
+
+
+# состояние лайков для всех карточек страницы списка одним запросом
+async def check_likes(app, state, rng):
+    return await call_json(app, "POST", "/check_likes",
+                           {"user_email": f"liker{rng.randint(0, 50)}@mail.ru",
+                            "petition_ids": [pick_petition(state, rng) for _ in range(100)]})
+
+
+# много пользователей одновременно переключают лайки у нескольких популярных петиций
+async def like_toggle(app, state, rng):
+    return await call_json(app, "PUT", "/like_petition",
+                           {"petition_id": rng.choice(state["hot"][:5]), "user_email": f"toggler{rng.randint(0, 200)}@mail.ru"})
+
+
+async def like_bulk(app, state, rng):
+    likes = [{"petition_id": pick_petition(state, rng), "user_email": f"toggler{rng.randint(0, 200)}@mail.ru",
+              "liked": rng.random() < 0.7} for _ in range(50)]
+    return await call_json(app, "PUT", "/like_petitions", {"likes": likes})
+
+
+async def brief_analysis(app, state, rng):
+    return await call_json(app, "POST", "/get_brief_analysis",
+                           {"region": rng.choice(REGIONS), "name": rng.choice(CITIES), "period": rng.choice(PERIODS)})
+
+
+def random_range(rng, days):
+    end = date.today() - timedelta(days=rng.randint(0, 30))
+    return (end - timedelta(days=days)).isoformat(), end.isoformat()
+
+
+async def detailed_analysis(app, state, rng):
+    start, end = random_range(rng, rng.choice([30, 90, 365]))
+    return await call_json(app, "POST", "/get_detailed_analysis",
+                           {"region_name": rng.choice(REGIONS), "city_name": rng.choice(CITIES),
+                            "start_time": start, "end_time": end, "rows_count": 10})
+
+
+async def time_series(app, state, rng):
+    start, end = random_range(rng, 365)
+    return await call_json(app, "POST", "/get_time_series",
+                           {"region_name": rng.choice(REGIONS), "city_name": rng.choice(CITIES),
+                            "start_time": start, "end_time": end, "bucket": rng.choice(["day", "week", "month"])})
+
+
+async def make_petition(app, state, rng):
+    photos = [{"filename": "photo.jpg", "content": base64.b64encode(rng.randbytes(2048)).decode()}] if rng.random() < 0.2 else None
+    return await call_json(app, "POST", "/make_petition",
+                           {"is_initiative": rng.random() < 0.4, "category": rng.choice(CATEGORIES),
+                            "petition_description": "Описание", "petitioner_email": rng.choice(state["users"]),
+                            "address": "Адрес", "header": "Заголовок", "region": rng.choice(REGIONS),
+                            "city_name": rng.choice(CITIES), "photos": photos})
+
+
+async def update_status(app, state, rng):
+    status, body = await call_json(app, "POST", "/get_petition_data", {"id": rng.randint(1, state["petitions"])})
+    info = json.loads(body)
+    return await call_json(app, "PUT", "/update_petition_status",
+                           {"id": info["id"], "admin_id": 1, "admin_city": info["city_name"], "admin_region": info["region"],
+                            "status": rng.choice(STATUSES), "comment": "Статус изменен"})
+
+
+# пакетная модерация 50 петиций города из списка админа
+async def moderate_batch(app, state, rng):
+    region, city = rng.choice(REGIONS), rng.choice(CITIES)
+    status, body = await call_json(app, "POST", "/get_admins_city_petitions", {"region": region, "name": city, "limit": 50})
+    changes = [{"id": p["id"], "status": rng.choice(STATUSES), "comment": "Статус изменен"} for p in json.loads(body)["petitions"]]
+    if not changes:
+        return status, body
+    return await call_json(app, "PUT", "/update_petition_statuses",
+                           {"admin_id": 1, "admin_city": city, "admin_region": region, "changes": changes})
+
+
+# загрузка двух фотографий по 64 КБ в новую петицию (у существующих может не хватить лимита)
+async def upload_photos(app, state, rng):
+    state["next_user"] += 1
+    petition_id = state["petitions"] - state["next_user"] % state["petitions"]
+    body, headers = multipart([(f"{n}.jpg", rng.randbytes(64 * 1024)) for n in range(2)])
+    status, response = await call(app, "POST", f"/upload_petition_photos?{urlencode({'petition_id': petition_id})}", body, headers)
+    if status == 201:
+        state["photos"].extend(url.rsplit("/", 1)[1] for url in json.loads(response)["photos"])
+    return status, response
+
+
+async def images(app, state, rng):
+    name = rng.choice(state["photos"])
+    headers = [(b"range", b"bytes=0-1023")] if rng.random() < 0.2 else []
+    return await call(app, "GET", f"/images/{name}", headers=headers)
+
+
+async def service_stats(app, state, rng):
+    return await call(app, "GET", rng.choice(["/db_stats", "/analytics_cache_stats", "/image_cache_stats", "/metrics"]))
+
+
+SCENARIOS = [
+    Scenario("list_user", list_user),
+    Scenario("list_city", list_city),
+    Scenario("list_city_likes", list_city_likes),
+    Scenario("list_trending", list_trending),
+    Scenario("list_admin", list_admin),
+    Scenario("petition_data", petition_data),
+    Scenario("check_like", check_like),
+    Scenario("check_likes", check_likes),
+    Scenario("like_toggle", like_toggle, concurrency=64),
+    Scenario("like_bulk", like_bulk),
+    Scenario("brief_analysis", brief_analysis),
+    Scenario("detailed_analysis", detailed_analysis),
+    Scenario("time_series", time_series),
+    Scenario("make_petition", make_petition),
+    Scenario("update_status", update_status),
+    Scenario("moderate_batch", moderate_batch),
+    Scenario("upload_photos", upload_photos, expected=(201,)),
+    Scenario("images", images, expected=(200, 206)),
+    Scenario("service_stats", service_stats),
+]
+
+
+async def run_scenario(scenario, app, state, requests, concurrency, rng):
+    latencies = []
+    errors = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start_time = time.perf_counter()
+            status, body = await scenario.request(app, state, rng)
+            latencies.append(time.perf_counter() - start_time)
+            if status not in scenario.expected:
+                errors[status] = errors.get(status, 0) + 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(scenario.concurrency or concurrency)])
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {"requests": len(latencies), "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99),
+            "errors": errors}
+
+
+# лайки популярных петиций, у которых счетчик разошелся с таблицей LIKES
+async def count_inconsistent_likes(db, petition_ids):
+    rows = await db.select_query(f'''SELECT p.ID FROM PETITION p
+        WHERE p.ID IN ({", ".join(str(int(i)) for i in petition_ids)})
+        AND p.LIKES_COUNT != (SELECT COUNT(*) FROM LIKES l WHERE l.PETITION_ID = p.ID);''')
+    return len(rows)
+
+
+async def run(scenarios, petitions, requests, concurrency, seed_value, db_file):
+    rng = random.Random(seed_value)
+    db = SQLiteDatabase(os.path.join(_workdir, "petitions.db") if db_file else ":memory:")
+    await db.connect()
+    routes.petition_manager.db = db
+    routes.statistics_manager.db = db
+    routes.notification_manager.db = db
+    state = seed(db, petitions, rng)
+    await StatisticsManager(db).rebuild_stats_rollup()
+    await routes.trending.refresh(routes.petition_manager.get_like_scores, routes.petition_manager.get_petition_like_scores)
+    main.log_listener.start()
+    results = {}
+    try:
+        for scenario in scenarios:
+            if scenario.name == "images" and not state["photos"]:
+                await upload_photos(main.app, state, rng)
+            results[scenario.name] = await run_scenario(scenario, main.app, state, requests, concurrency, rng)
+            if scenario.name == "like_toggle":
+                results[scenario.name]["inconsistent_counters"] = await count_inconsistent_likes(db, state["hot"])
+    finally:
+        main.log_listener.stop()
+        await db.close()
+    return results
+
+
+# сравнение с базовым результатом: сценарий не проходит, если p95 вырос или пропускная способность
+# упала больше чем на threshold, а также при ошибках и рассогласовании счетчиков лайков
+def compare(results, baseline, threshold):
+    failures = []
+    print(f"{'сценарий':<18}{'запросов':>9}{'rps':>10}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'база p95':>10}{'Δ p95':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = ""
+        problems = []
+        if result["errors"]:
+            problems.append(f"ошибки {result['errors']}")
+        if result.get("inconsistent_counters"):
+            problems.append(f"счетчиков лайков разошлось: {result['inconsistent_counters']}")
+        if base:
+            change = f"{(result['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%"
+            if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                problems.append(f"p95 {result['p95_ms']:.2f} мс > {base['p95_ms']:.2f} мс")
+            if result["rps"] < base["rps"] * (1 - threshold):
+                problems.append(f"rps {result['rps']:.0f} < {base['rps']:.0f}")
+        print(f"{name:<18}{result['requests']:>9}{result['rps']:>10.0f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{base['p95_ms'] if base else float('nan'):>10.2f}{change:>9}")
+        failures.extend(f"{name}: {problem}" for problem in problems)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест маршрутов сервиса петиций на SQLite в памяти")
+    parser.add_argument("--only", nargs="+", choices=[s.name for s in SCENARIOS], help="запустить только эти сценарии")
+    parser.add_argument("--petitions", type=int, default=20000, help="количество петиций в тестовых данных")
+    parser.add_argument("--requests", type=int, default=500, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора тестовых данных и запросов")
+    parser.add_argument("--threshold", type=float, default=0.5, help="допустимое ухудшение относительно базового результата")
+    parser.add_argument("--db-file", action="store_true", help="встроенная база в файле вместо базы в памяти")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="сохранить результаты как базовые")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="не удалять временный каталог с фотографиями, журналом и базой")
+    args = parser.parse_args()
+    _keep_workdir = args.keep_workdir
+
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    results = asyncio.run(run(scenarios, args.petitions, args.requests, args.concurrency, args.seed, args.db_file))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["scenarios"]
+    failures = compare(results, {} if args.update_baseline else baseline, args.threshold)
+
+    if args.update_baseline:
+        baseline.update({name: {key: round(result[key], 3) for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+                         for name, result in results.items()})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"params": {"petitions": args.petitions, "requests": args.requests,
+                                  "concurrency": args.concurrency, "seed": args.seed},
+                       "scenarios": baseline}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nБазовый результат сохранен в {args.baseline}")
+    if failures:
+        print("\nУхудшения:\n  " + "\n  ".join(failures))
+        sys.exit(1)
@@ -0,0 +1,88 @@
+# Сериализация списков петиций: модели pydantic + JSONResponse (как раньше) против кортежей и PetitionPage.render().
+# Строки имитируют результат запроса списка по городу; проверяется, что ответы побайтно совпадают.
+# Запуск из корня проекта: python -m scripts.bench_serialization --rows 50000
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models import PetitionWithHeader, PetitionsByUser, AdminPetition, AdminPetitions
+from app.serialization import PetitionPage, petition_rows, admin_petition_rows, date_formatter
+
+STATUSES = ["На модерации", "Открыта", "В работе", "Решена", "Отклонена"]
+
+
+def make_rows(count, days):
+    rng = random.Random(42)
+    now = datetime.now()
+    rows = [{"id": i,
+             "is_initiative": rng.random() < 0.4,
+             "header": f"Яма на дороге \"{i}\"",
+             "petition_status": rng.choice(STATUSES),
+             "address": f"ул. Ленина, {rng.randint(1, 200)}",
+             "submission_time": now - timedelta(seconds=rng.randint(0, days * 86400), microseconds=rng.randint(0, 999999)),
+             "likes_count": rng.randint(0, 5000)} for i in range(count, 0, -1)]
+    rows.sort(key=lambda r: r["submission_time"], reverse=True)
+    return rows
+
+
+# прежний путь: модель на каждую строку, strftime, затем jsonable_encoder и JSONResponse в FastAPI
+def render_models(rows, admin):
+    if admin:
+        petitions = [AdminPetition(id=r["id"], header=r["header"], status=r["petition_status"], address=r["address"],
+                                   date=r["submission_time"].strftime('%d.%m.%Y %H:%M'), likes=r["likes_count"],
+                                   type='Жалоба' if r["is_initiative"] == False else 'Инициатива') for r in rows]
+        page = AdminPetitions(petitions=petitions, next_cursor="cursor")
+    else:
+        petitions = [PetitionWithHeader(id=r["id"], header=r["header"], status=r["petition_status"], address=r["address"],
+                                        date=r["submission_time"].strftime('%d.%m.%Y %H:%M'), likes=r["likes_count"]) for r in rows]
+        page = PetitionsByUser(petitions=petitions, next_cursor="cursor")
+    return JSONResponse(content=jsonable_encoder(page)).body
+
+
+def render_tuples(rows, admin):
+    if admin:
+        return PetitionPage(admin_petition_rows(rows), "cursor", admin=True).render()
+    return PetitionPage(petition_rows(rows), "cursor").render()
+
+
+def measure(render, rows, admin, repeat):
+    times = []
+    for _ in range(repeat):
+        date_formatter.cache.clear()
+        start_time = time.perf_counter()
+        body = render(rows, admin)
+        times.append(time.perf_counter() - start_time)
+    date_formatter.cache.clear()
+    tracemalloc.start()
+    render(rows, admin)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return body, min(times) / len(rows) * 1e9, peak / len(rows)
+
+
+def main(args):
+    rows = make_rows(args.rows, args.days)
+    print(f"строк: {len(rows)}, разных минут: {len({r['submission_time'].replace(second=0, microsecond=0) for r in rows})}")
+    for admin in (False, True):
+        old_body, old_ns, old_bytes = measure(render_models, rows, admin, args.repeat)
+        new_body, new_ns, new_bytes = measure(render_tuples, rows, admin, args.repeat)
+        print(f"\n{'список админа' if admin else 'список города'}: ответы совпадают: {old_body == new_body}, "
+              f"размер ответа {len(new_body) / 1024:.0f} КБ")
+        print(f"  {'':<22}{'нс/строка':>12}{'байт/строка (пик)':>20}")
+        print(f"  {'модели + JSONResponse':<22}{old_ns:>12.0f}{old_bytes:>20.0f}")
+        print(f"  {'кортежи + render':<22}{new_ns:>12.0f}{new_bytes:>20.0f}")
+        print(f"  {'экономия':<22}{old_ns - new_ns:>12.0f}{old_bytes - new_bytes:>20.0f}"
+              f"  (в {old_ns / new_ns:.1f} раза быстрее)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации списков петиций")
+    parser.add_argument("--rows", type=int, default=50000, help="строк в списке")
+    parser.add_argument("--days", type=int, default=30, help="за сколько дней поданы петиции")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов замера времени (берется лучший)")
+    main(parser.parse_args())
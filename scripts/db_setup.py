@@ -1,15 +1,378 @@
-from pymongo import MongoClient
+# Управление схемой БД. Запуск из корня проекта:
+#   python -m scripts.db_setup reset    - пересоздание схемы (все данные удаляются!)
+#   python -m scripts.db_setup migrate  - создание недостающих таблиц, столбцов и индексов без потери данных
+#                                         (индексы строятся без блокировки записи, --skip-rewrites откладывает
+#                                         столбцы, для которых таблица перезаписывается)
+#   python -m scripts.db_setup explain  - проверка планов запросов менеджеров на полное сканирование таблиц
+# Хранилище выбирается в app/config.py (DB_BACKEND); для встроенной SQLite схема задается в app/sqlite_db.py
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from contextlib import asynccontextmanager
 
+from app.config import settings
+from app.db import Database, db
+from app.managers.petition_manager import PetitionManager
+from app.managers.statistics_manager import StatisticsManager
+from app.managers.notification_manager import NotificationManager
+from app.query_shapes import query_shapes
+from app.photo_storage import photo_storage
 
-client = MongoClient()
-db = client['Petitions']
 
-db.petitions.drop()
-db.comments.drop()
-db.likes.drop()
-db.photo_folders.drop()
+TABLES = '''
+CREATE TABLE IF NOT EXISTS PETITION (
+    ID SERIAL PRIMARY KEY,
+    IS_INITIATIVE BOOLEAN NOT NULL,
+    CATEGORY TEXT NOT NULL,
+    PETITION_DESCRIPTION TEXT NOT NULL,
+    PETITIONER_EMAIL TEXT NOT NULL,
+    ADDRESS TEXT NOT NULL,
+    HEADER TEXT NOT NULL,
+    REGION TEXT NOT NULL,
+    CITY_NAME TEXT NOT NULL,
+    PETITION_STATUS TEXT NOT NULL DEFAULT 'На модерации',
+    SUBMISSION_TIME TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    LIKES_COUNT INTEGER NOT NULL DEFAULT 0,
+    PHOTOS TEXT[] NOT NULL DEFAULT '{}',
+    -- поисковый вектор: заголовок важнее адреса, адрес важнее описания; слова приводятся к основе (русский словарь)
+    SEARCH_VECTOR TSVECTOR GENERATED ALWAYS AS (SETWEIGHT(TO_TSVECTOR('russian', HEADER), 'A') ||
+                                               SETWEIGHT(TO_TSVECTOR('russian', ADDRESS), 'B') ||
+                                               SETWEIGHT(TO_TSVECTOR('russian', PETITION_DESCRIPTION), 'C')) STORED
+);
 
-db.create_collection("petitions")
-db.create_collection("comments")
-db.create_collection("likes")
-db.create_collection("photo_folders")
+CREATE TABLE IF NOT EXISTS COMMENTS (
+    ID SERIAL PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    USER_ID INTEGER NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    SUBMISSION_TIME TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS LIKES (
+    ID SERIAL PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    USER_EMAIL TEXT NOT NULL,
+    LIKED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS PHOTO_FOLDER (
+    ID SERIAL PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    FOLDER_PATH TEXT NOT NULL
+);
+
+-- сводная статистика: количество петиций по дням подачи в разрезе города, типа, категории и статуса
+CREATE TABLE IF NOT EXISTS PETITION_STATS_DAILY (
+    REGION TEXT NOT NULL,
+    CITY_NAME TEXT NOT NULL,
+    DAY DATE NOT NULL,
+    IS_INITIATIVE BOOLEAN NOT NULL,
+    CATEGORY TEXT NOT NULL,
+    PETITION_STATUS TEXT NOT NULL,
+    PETITIONS_COUNT INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (REGION, CITY_NAME, DAY, IS_INITIATIVE, CATEGORY, PETITION_STATUS)
+);
+
+-- очередь уведомлений о смене статуса: запись добавляется в одной транзакции с изменением статуса,
+-- диспетчер постранично разбирает получателей в пакеты (RECIPIENT_CURSOR - последний обработанный email)
+CREATE TABLE IF NOT EXISTS NOTIFICATION_OUTBOX (
+    ID SERIAL PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL REFERENCES PETITION (ID) ON DELETE CASCADE,
+    PETITION_STATUS TEXT NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    RECIPIENT_CURSOR TEXT,
+    CREATED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    AVAILABLE_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- пакеты получателей уведомлений: выданный потребителю пакет скрыт до AVAILABLE_AT, подтвержденный удаляется
+CREATE TABLE IF NOT EXISTS NOTIFICATION_BATCH (
+    ID SERIAL PRIMARY KEY,
+    PETITION_ID INTEGER NOT NULL,
+    PETITION_STATUS TEXT NOT NULL,
+    COMMENT_DESCRIPTION TEXT NOT NULL,
+    EMAILS TEXT[] NOT NULL,
+    CREATED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    AVAILABLE_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+'''
+
+# столбцы, появившиеся после первой версии схемы. значения по умолчанию постоянные или вычисляются один раз
+# (CURRENT_TIMESTAMP), поэтому PostgreSQL 11+ не перезаписывает таблицу: блокировка таблицы держится мгновения
+COLUMNS = '''
+ALTER TABLE PETITION ADD COLUMN IF NOT EXISTS LIKES_COUNT INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE PETITION ADD COLUMN IF NOT EXISTS PHOTOS TEXT[] NOT NULL DEFAULT '{}';
+-- для лайков, поставленных до появления столбца, временем считается момент миграции
+ALTER TABLE LIKES ADD COLUMN IF NOT EXISTS LIKED_AT TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+'''
+
+# столбцы, добавление которых перезаписывает всю таблицу: (таблица, столбец, запрос).
+# ALTER TABLE держит блокировку ACCESS EXCLUSIVE до конца перезаписи - чтение и запись таблицы ждут,
+# поэтому на большой базе шаг выполняется в окно обслуживания (migrate --skip-rewrites откладывает его)
+REWRITE_COLUMNS = [
+    ("PETITION", "SEARCH_VECTOR", '''ALTER TABLE PETITION ADD COLUMN IF NOT EXISTS
+    SEARCH_VECTOR TSVECTOR GENERATED ALWAYS AS (SETWEIGHT(TO_TSVECTOR('russian', HEADER), 'A') ||
+                                               SETWEIGHT(TO_TSVECTOR('russian', ADDRESS), 'B') ||
+                                               SETWEIGHT(TO_TSVECTOR('russian', PETITION_DESCRIPTION), 'C')) STORED;'''),
+]
+
+# индексы под запросы PetitionManager и StatisticsManager
+INDEXES = '''
+-- петиции пользователя
+CREATE INDEX IF NOT EXISTS PETITION_EMAIL_TIME_IDX ON PETITION (PETITIONER_EMAIL, SUBMISSION_TIME, ID);
+-- постраничные списки петиций города и городская статистика за период
+CREATE INDEX IF NOT EXISTS PETITION_CITY_TIME_IDX ON PETITION (REGION, CITY_NAME, IS_INITIATIVE, SUBMISSION_TIME, ID);
+CREATE INDEX IF NOT EXISTS PETITION_CITY_LIKES_IDX ON PETITION (REGION, CITY_NAME, IS_INITIATIVE, LIKES_COUNT, ID);
+-- постраничные списки петиций города для админа (без фильтра по типу)
+CREATE INDEX IF NOT EXISTS PETITION_ADMIN_TIME_IDX ON PETITION (REGION, CITY_NAME, SUBMISSION_TIME, ID);
+CREATE INDEX IF NOT EXISTS PETITION_ADMIN_LIKES_IDX ON PETITION (REGION, CITY_NAME, LIKES_COUNT, ID);
+-- региональная статистика за период
+CREATE INDEX IF NOT EXISTS PETITION_REGION_IDX ON PETITION (REGION, IS_INITIATIVE, SUBMISSION_TIME);
+-- полнотекстовый поиск петиций
+CREATE INDEX IF NOT EXISTS PETITION_SEARCH_IDX ON PETITION USING GIN (SEARCH_VECTOR);
+-- проверка и переключение лайка, выборка подписчиков петиции
+CREATE UNIQUE INDEX IF NOT EXISTS LIKES_PETITION_USER_UIDX ON LIKES (PETITION_ID, USER_EMAIL);
+-- восстановление рейтинга "в тренде" по недавним лайкам
+CREATE INDEX IF NOT EXISTS LIKES_LIKED_AT_IDX ON LIKES (LIKED_AT);
+CREATE INDEX IF NOT EXISTS COMMENTS_PETITION_IDX ON COMMENTS (PETITION_ID, SUBMISSION_TIME);
+CREATE INDEX IF NOT EXISTS PHOTO_FOLDER_PETITION_IDX ON PHOTO_FOLDER (PETITION_ID);
+-- региональная сводная статистика за период
+CREATE INDEX IF NOT EXISTS PETITION_STATS_REGION_IDX ON PETITION_STATS_DAILY (REGION, DAY);
+-- очереди уведомлений: выборка доступных записей по порядку
+CREATE INDEX IF NOT EXISTS NOTIFICATION_OUTBOX_AVAILABLE_IDX ON NOTIFICATION_OUTBOX (AVAILABLE_AT, ID);
+CREATE INDEX IF NOT EXISTS NOTIFICATION_BATCH_AVAILABLE_IDX ON NOTIFICATION_BATCH (AVAILABLE_AT, ID);
+'''
+
+# индексы, замененные более полными
+OBSOLETE_INDEXES = '''
+DROP INDEX IF EXISTS PETITION_EMAIL_IDX;
+DROP INDEX IF EXISTS PETITION_CITY_IDX;
+'''
+
+# удаление повторных лайков, оставшихся от версий без уникального индекса
+DEDUPLICATE_LIKES = '''
+DELETE FROM LIKES l
+USING LIKES d
+WHERE l.PETITION_ID = d.PETITION_ID AND l.USER_EMAIL = d.USER_EMAIL AND l.ID > d.ID;
+'''
+
+
+async def reset():
+    if db.dialect == "sqlite":
+        await db.bootstrap(reset=True)
+        print("Схема пересоздана")
+        return
+    await db.exec_many_query({
+        'DROP TABLE IF EXISTS NOTIFICATION_BATCH, NOTIFICATION_OUTBOX, PETITION_STATS_DAILY, PHOTO_FOLDER, LIKES, COMMENTS, PETITION;': [],
+        TABLES: [],
+        INDEXES: []
+    })
+    print("Схема пересоздана")
+
+
+# перенос фотографий из папок петиций (PHOTO_FOLDER) в хранилище по хешу и список фотографий петиции
+async def backfill_photo_manifests(database, petition_manager):
+    no_photos = "CARDINALITY(p.PHOTOS) = 0" if database.dialect == "postgres" else "JSON_ARRAY_LENGTH(p.PHOTOS) = 0"
+    folders = await database.select_query(f'''SELECT f.PETITION_ID, f.FOLDER_PATH
+        FROM PHOTO_FOLDER f
+        JOIN PETITION p ON p.ID = f.PETITION_ID
+        WHERE {no_photos};''')
+    for folder in folders:
+        path = folder["folder_path"]
+        if not os.path.isdir(path):
+            continue
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+        names = [await asyncio.to_thread(photo_storage.import_file, file) for file in files if os.path.isfile(file)]
+        if names:
+            await petition_manager.attach_petition_photos(folder["petition_id"], names)
+    return len(folders)
+
+
+# соединение для миграции PostgreSQL: без таймаута запросов (перестроение индексов и таблиц на большой базе
+# идет дольше DB_QUERY_TIMEOUT), но с ограничением ожидания блокировок - если таблицу держит долгая транзакция,
+# миграция останавливается, а не выстраивает за собой очередь запросов приложения. шаги можно повторить
+MIGRATION_LOCK_TIMEOUT = "10s"
+
+
+def migration_database():
+    return Database(host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER, password=settings.DB_PASSWORD,
+                    database=settings.DB_NAME, min_size=1, max_size=1, acquire_timeout=settings.DB_ACQUIRE_TIMEOUT,
+                    query_timeout=None, close_timeout=settings.DB_CLOSE_TIMEOUT,
+                    server_settings={"lock_timeout": MIGRATION_LOCK_TIMEOUT})
+
+
+# запросы скрипта индексов по одному, в виде без блокировки записи: (имя индекса, запрос).
+# CONCURRENTLY не выполняется внутри транзакции, поэтому каждый запрос идет отдельно
+def concurrent_statements(script):
+    return [(name, re.sub(r"^(CREATE (?:UNIQUE )?INDEX|DROP INDEX)", r"\1 CONCURRENTLY", statement))
+            for statement, name in re.findall(r"^((?:CREATE (?:UNIQUE )?INDEX|DROP INDEX) IF (?:NOT )?EXISTS (\w+)[^;]*;)",
+                                              script, re.MULTILINE)]
+
+
+async def migrate_postgres(database, skip_rewrites):
+    await database.exec_many_query({TABLES: [], COLUMNS: []})
+    deferred = []
+    for table, column, query in REWRITE_COLUMNS:
+        if await database.select_one('''SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_NAME = LOWER($1) AND COLUMN_NAME = LOWER($2);''', table, column):
+            continue
+        if skip_rewrites:
+            print(f"Отложено: столбец {table}.{column} (перезапись таблицы)")
+            deferred.append(column)
+            continue
+        rows = await database.select_one(f"SELECT COUNT(*) AS count FROM {table};")
+        print(f"Добавление столбца {table}.{column}: перезапись {rows['count']} строк, таблица заблокирована до конца")
+        await database.exec_query(query)
+    await database.exec_query(DEDUPLICATE_LIKES)
+    for name, query in concurrent_statements(INDEXES):
+        if any(re.search(rf"\b{column}\b", query) for column in deferred):
+            print(f"Отложено: индекс {name} (по отложенному столбцу)")
+            continue
+        # прерванное построение оставляет недействительный индекс, который IF NOT EXISTS не стал бы перестраивать
+        if await database.select_one('''SELECT 1 FROM PG_INDEX i JOIN PG_CLASS c ON c.OID = i.INDEXRELID
+            WHERE c.RELNAME = LOWER($1) AND NOT i.INDISVALID;''', name):
+            await database.exec_query(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        await database.exec_query(query)
+    for _, query in concurrent_statements(OBSOLETE_INDEXES):
+        await database.exec_query(query)
+
+
+async def migrate(database, skip_rewrites=False):
+    if database.dialect == "sqlite":
+        # встроенная база создает недостающие таблицы и индексы при подключении
+        await database.bootstrap()
+    else:
+        await migrate_postgres(database, skip_rewrites)
+    petition_manager = PetitionManager(database)
+    fixed = await petition_manager.reconcile_likes_count()
+    migrated_folders = await backfill_photo_manifests(database, petition_manager)
+    # сводная статистика заполняется один раз, дальше она поддерживается при каждом изменении петиций
+    if not await database.select_one('SELECT 1 FROM PETITION_STATS_DAILY LIMIT 1;'):
+        await StatisticsManager(database).rebuild_stats_rollup()
+    print(f"Миграция завершена, исправлено счетчиков лайков: {len(fixed)}, перенесено папок с фотографиями: {migrated_folders}")
+
+
+# подменяет хранилище для менеджеров: вместо выполнения запросов строит их планы
+class QueryPlanRecorder:
+    dialect = "postgres"
+
+    def __init__(self, connection):
+        self.connection = connection
+        # менеджеры запускают запросы параллельно через asyncio.gather, а соединение одно
+        self.lock = asyncio.Lock()
+        self.plans = []
+
+    async def _explain(self, query, *args):
+        async with self.lock:
+            try:
+                plan = await self.connection.fetchval('EXPLAIN (FORMAT JSON) ' + query, *args)
+                self.plans.append((query, json.loads(plan)[0]["Plan"], None))
+            except Exception as e:
+                self.plans.append((query, None, e))
+
+    async def select_query(self, query, *args):
+        await self._explain(query, *args)
+        return []
+
+    async def select_one(self, query, *args):
+        await self._explain(query, *args)
+
+    async def insert_returning(self, query, *args):
+        await self._explain(query, *args)
+
+    async def exec_query(self, query, *args):
+        await self._explain(query, *args)
+
+    async def exec_many_query(self, queries):
+        for query, args in queries.items():
+            await self._explain(query, *args)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self
+
+
+# таблицы, которые читаются в плане полным сканированием, включая обход индекса целиком:
+# без условия по ключу или с условием, не затрагивающим первый столбец индекса. индексы без первого столбца
+# в leading_columns (по выражению) так не проверяются: их условие не содержит имени столбца
+def find_seq_scans(plan, leading_columns):
+    tables = []
+    if plan["Node Type"] == "Seq Scan":
+        tables.append(plan["Relation Name"])
+    elif plan["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Index Scan"):
+        condition = plan.get("Index Cond", "")
+        column = leading_columns.get(plan["Index Name"])
+        if column is not None and not re.search(rf"\b{re.escape(column)}\b", condition):
+            tables.append(plan.get("Relation Name", plan["Index Name"]))
+    for child in plan.get("Plans", []):
+        tables.extend(find_seq_scans(child, leading_columns))
+    return tables
+
+
+async def explain():
+    flagged = 0
+    async with db.pool.acquire() as connection:
+        # без этих настроек планировщик выбирает полное сканирование (и соединение хешированием
+        # или слиянием) на маленьких таблицах, даже если подходящий индекс есть
+        await connection.execute('SET enable_seqscan = off; SET enable_hashjoin = off; SET enable_mergejoin = off;')
+        leading_columns = {r["index_name"]: r["column_name"] for r in await connection.fetch('''
+            SELECT c.RELNAME AS index_name, a.ATTNAME AS column_name
+            FROM PG_INDEX i
+            JOIN PG_CLASS c ON c.OID = i.INDEXRELID
+            JOIN PG_ATTRIBUTE a ON a.ATTRELID = i.INDRELID AND a.ATTNUM = i.INDKEY[0];''')}
+        recorder = QueryPlanRecorder(connection)
+        shapes = query_shapes(PetitionManager(recorder), StatisticsManager(recorder), NotificationManager(recorder))
+        for name, call in shapes.items():
+            recorder.plans = []
+            try:
+                await call
+            except Exception as e:
+                # менеджер может упасть на пустом результате, запросы к этому моменту уже записаны;
+                # ошибка до первого запроса значит, что планы этого вызова не проверены
+                if not recorder.plans:
+                    flagged += 1
+                    print(f"ERROR     {name}: запросы не записаны\n          {type(e).__name__}: {e}")
+            for query, plan, error in recorder.plans:
+                first_line = " ".join(query.split())[:90]
+                if error is not None:
+                    flagged += 1
+                    print(f"ERROR     {name}: {first_line}\n          {type(error).__name__}: {error}")
+                    continue
+                tables = find_seq_scans(plan, leading_columns)
+                if tables:
+                    flagged += 1
+                    print(f"SEQ SCAN  {name}: {first_line}\n          таблицы: {', '.join(sorted(set(tables)))}")
+                else:
+                    print(f"OK        {name}: {first_line}")
+    print(f"\nЗапросов с проблемами: {flagged}")
+    return flagged
+
+
+async def main(mode, skip_rewrites):
+    database = migration_database() if mode == "migrate" and db.dialect == "postgres" else db
+    await database.connect()
+    try:
+        if mode == "reset":
+            await reset()
+        elif mode == "migrate":
+            await migrate(database, skip_rewrites)
+        elif db.dialect != "postgres":
+            print("Проверка планов запросов доступна только для PostgreSQL")
+            return 1
+        else:
+            return 1 if await explain() else 0
+    finally:
+        await database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Управление схемой БД сервиса петиций")
+    parser.add_argument("mode", nargs="?", choices=["reset", "migrate", "explain"], default="reset")
+    parser.add_argument("--skip-rewrites", action="store_true",
+                        help="migrate: не добавлять столбцы, требующие перезаписи таблицы (см. REWRITE_COLUMNS)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.mode, args.skip_rewrites)))
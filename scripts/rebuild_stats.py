@@ -0,0 +1,20 @@
+# Полный пересчет сводной статистики PETITION_STATS_DAILY по таблице петиций
+# Запуск из корня проекта: python -m scripts.rebuild_stats
+import asyncio
+
+from app.db import db
+from app.managers.statistics_manager import StatisticsManager
+
+
+async def main():
+    await db.connect()
+    try:
+        await StatisticsManager(db).rebuild_stats_rollup()
+        rows = await db.select_one('SELECT COUNT(*) AS rows, COALESCE(SUM(PETITIONS_COUNT), 0) AS petitions FROM PETITION_STATS_DAILY;')
+    finally:
+        await db.close()
+    print(f"Сводная статистика пересчитана: строк {rows['rows']}, петиций {rows['petitions']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+# Сверка счетчиков PETITION.LIKES_COUNT с таблицей LIKES (можно запускать по cron)
+# Запуск из корня проекта: python -m scripts.reconcile_likes
+import asyncio
+
+from app.db import db
+from app.managers.petition_manager import PetitionManager
+
+
+async def main():
+    await db.connect()
+    try:
+        fixed = await PetitionManager(db).reconcile_likes_count()
+    finally:
+        await db.close()
+    print(f"Исправлено счетчиков лайков: {len(fixed)}")
+    if fixed:
+        print("ID петиций:", ", ".join(str(petition_id) for petition_id in fixed))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
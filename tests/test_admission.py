@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionLimiter, Overloaded
+
+
+# запрос, который держит место в ограничении, пока не будет отпущен
+async def hold(limiter, name, order, release):
+    async def compute():
+        order.append(name)
+        await release.wait()
+        return name
+    return await limiter.run(compute)
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=10, queue_timeout=5)
+        order = []
+        releases = {name: asyncio.Event() for name in "abcd"}
+        tasks = []
+        for name in "abc":
+            tasks.append(asyncio.create_task(hold(limiter, name, order, releases[name])))
+            await asyncio.sleep(0)
+        assert order == ["a"]
+        assert limiter.stats()["queued"] == 2
+
+        releases["a"].set()
+        await tasks[0]
+        # место передано "b" напрямую; запрос, пришедший сейчас, встает в очередь после "c"
+        tasks.append(asyncio.create_task(hold(limiter, "d", order, releases["d"])))
+        for name in "bcd":
+            await asyncio.sleep(0)
+            releases[name].set()
+        assert await asyncio.gather(*tasks) == list("abcd")
+        assert order == list("abcd")
+        assert limiter.active == 0
+        assert limiter.stats()["admitted"] == 4
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(limiter, "a", [], release))
+        queued = asyncio.create_task(hold(limiter, "b", [], release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire()
+        assert error.value.reason == "queue_full"
+        assert 1 <= error.value.retry_after <= 60
+        release.set()
+        await asyncio.gather(running, queued)
+        assert limiter.stats()["rejected_queue_full"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejects_and_frees_queue_place():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=0.01)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(limiter, "a", [], release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire()
+        assert error.value.reason == "queue_timeout"
+        assert limiter.stats()["queued"] == 0
+        assert limiter.stats()["rejected_timeout"] == 1
+        release.set()
+        await running
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=5)
+        release = asyncio.Event()
+        order = []
+        running = asyncio.create_task(hold(limiter, "a", order, release))
+        cancelled = asyncio.create_task(hold(limiter, "b", order, release))
+        waiting = asyncio.create_task(hold(limiter, "c", order, release))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert limiter.stats()["queued"] == 1
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert order == ["a", "c"]
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_handoff_racing_with_cancellation_keeps_place():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=5)
+        await limiter.acquire()
+        late = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # место передается ожидающему, который в тот же момент отменяется: он либо получает место
+        # (wait_for уже завершился), либо отдает его, но место не теряется и не достается двоим
+        limiter.release()
+        late.cancel()
+        try:
+            await late
+            holders = 1
+        except asyncio.CancelledError:
+            holders = 0
+        assert limiter.active == holders
+        assert limiter.stats()["queued"] == 0
+
+    asyncio.run(scenario())
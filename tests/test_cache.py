@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from app.cache import TTLCache
+
+
+# вычисление, которое завершается только по сигналу: так запросы гарантированно пересекаются по времени
+class Computation:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    # вычисление, которое завершается сразу
+    @classmethod
+    def ready(cls, value):
+        computation = cls(value)
+        computation.release.set()
+        return computation
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+def test_concurrent_requests_share_one_computation():
+    async def scenario():
+        cache = TTLCache(10)
+        compute = Computation("value")
+        waiters = [asyncio.create_task(cache.get_or_compute("key", 60, compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        compute.release.set()
+        assert await asyncio.gather(*waiters) == ["value"] * 3
+        assert compute.calls == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["coalesced"] == 2
+        assert await cache.get_or_compute("key", 60, compute) == "value"
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_computation():
+    async def scenario():
+        cache = TTLCache(10)
+        compute = Computation("value")
+        first = asyncio.create_task(cache.get_or_compute("key", 60, compute))
+        second = asyncio.create_task(cache.get_or_compute("key", 60, compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        compute.release.set()
+        assert await second == "value"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # результат сохранен, несмотря на отмену первого запроса
+        assert cache.stats()["size"] == 1
+        assert compute.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_computation_is_not_stored():
+    async def scenario():
+        cache = TTLCache(10)
+
+        async def fail():
+            raise RuntimeError("db is down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("key", 60, fail)
+        assert cache.stats()["size"] == 0
+        assert cache.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_removes_stored_entries_with_tag():
+    async def scenario():
+        cache = TTLCache(10)
+        await cache.get_or_compute("a", 60, Computation.ready("a"), tags=(1,))
+        await cache.get_or_compute("b", 60, Computation.ready("b"), tags=(1, 2))
+        await cache.get_or_compute("c", 60, Computation.ready("c"), tags=(2,))
+        cache.invalidate(1)
+        assert set(cache.entries) == {"c"}
+        assert cache.tag_keys == {2: {"c"}}
+        assert cache.stats()["invalidations"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_during_computation_discards_its_result():
+    async def scenario():
+        cache = TTLCache(10)
+        stale = Computation("stale")
+        waiter = asyncio.create_task(cache.get_or_compute("key", 60, stale, tags=(1,)))
+        await asyncio.sleep(0)
+        cache.invalidate(1)
+        # после инвалидации запрос не присоединяется к устаревшему вычислению, а начинает новое
+        fresh = Computation("fresh")
+        fresh.release.set()
+        assert await cache.get_or_compute("key", 60, fresh, tags=(1,)) == "fresh"
+        stale.release.set()
+        # первый запрос получает свой результат, но кэш его не сохраняет поверх нового
+        assert await waiter == "stale"
+        assert cache.entries["key"][1] == "fresh"
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_of_other_tag_keeps_computation_result():
+    async def scenario():
+        cache = TTLCache(10)
+        compute = Computation("value")
+        waiter = asyncio.create_task(cache.get_or_compute("key", 60, compute, tags=(1,)))
+        await asyncio.sleep(0)
+        cache.invalidate(2)
+        compute.release.set()
+        assert await waiter == "value"
+        assert "key" in cache.entries
+        assert cache.tag_versions == {}
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def scenario():
+        cache = TTLCache(2)
+        for key in ("a", "b"):
+            await cache.get_or_compute(key, 60, Computation.ready(key), tags=(key,))
+        await cache.get_or_compute("a", 60, Computation.ready("a"))
+        await cache.get_or_compute("c", 60, Computation.ready("c"), tags=("c",))
+        assert list(cache.entries) == ["a", "c"]
+        assert "b" not in cache.tag_keys
+        assert cache.stats()["evictions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_expired_entry_is_recomputed():
+    async def scenario():
+        cache = TTLCache(10)
+        await cache.get_or_compute("key", 0, Computation.ready("old"))
+        assert await cache.get_or_compute("key", 60, Computation.ready("new")) == "new"
+        assert cache.stats()["expirations"] == 1
+
+    asyncio.run(scenario())
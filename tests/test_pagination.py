@@ -0,0 +1,79 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models import PageParams
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor, paginate, split_page
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor("submission_time", moment, 42), "submission_time") == (moment, 42)
+    assert decode_cursor(encode_cursor("likes", 17, 42), "likes") == (17, 42)
+    assert decode_cursor(encode_cursor("relevance", 0.25, 42), "relevance") == (0.25, 42)
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor("submission_time", datetime(2024, 5, 1), 1)
+    assert "=" not in cursor
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def test_cursor_for_other_sort_order_is_rejected():
+    with pytest.raises(InvalidCursor, match="another sort order"):
+        decode_cursor(encode_cursor("likes", 17, 42), "submission_time")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "!!!",
+    "курсор",
+    encode_cursor("likes", 17, 42)[:-3],
+    raw_cursor(b"not json"),
+    raw_cursor(b'{"sort": "likes"}'),
+    raw_cursor(b'["likes", 17]'),
+    raw_cursor(b'["likes", 17, 42, 1]'),
+    raw_cursor(b'["likes", "many", 42]'),
+    raw_cursor(b'["likes", 17, "id"]'),
+    raw_cursor(b'["likes", 17, null]'),
+    raw_cursor(b'["likes", [17], 42]'),
+])
+def test_tampered_likes_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "likes")
+
+
+@pytest.mark.parametrize("value", ["2024-13-45", "yesterday", 1714566615, None])
+def test_tampered_submission_time_is_rejected(value):
+    cursor = raw_cursor(json.dumps(["submission_time", value, 42]).encode())
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "submission_time")
+
+
+def test_paginate_adds_cursor_condition_after_existing_parameters():
+    page = PageParams(limit=10, sort="likes", status="Открыта", cursor=encode_cursor("likes", 17, 42))
+    query, args = paginate("SELECT p.ID FROM PETITION p WHERE p.CITY_NAME = $1", ["Город"], page)
+    assert args == ["Город", "Открыта", 17, 42, 11]
+    assert query.endswith(" AND p.PETITION_STATUS = $2 AND (p.LIKES_COUNT, p.ID) < ($3, $4)"
+                          " ORDER BY p.LIKES_COUNT DESC, p.ID DESC LIMIT $5;")
+
+
+def test_paginate_rejects_tampered_cursor():
+    page = PageParams(cursor=raw_cursor(b'["submission_time", "1; DROP TABLE PETITION", 1]'))
+    with pytest.raises(InvalidCursor):
+        paginate("SELECT p.ID FROM PETITION p WHERE TRUE", [], page)
+
+
+def test_split_page_returns_cursor_of_last_row_only_when_more_rows_exist():
+    page = PageParams(limit=2, sort="likes")
+    rows = [{"id": 3, "likes_count": 9}, {"id": 2, "likes_count": 5}, {"id": 1, "likes_count": 5}]
+    assert split_page(rows[:2], page) == (rows[:2], None)
+    kept, cursor = split_page(rows, page)
+    assert kept == rows[:2]
+    assert decode_cursor(cursor, "likes") == (5, 2)
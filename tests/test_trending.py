@@ -0,0 +1,134 @@
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+
+import app.trending
+from app.trending import TrendingTracker
+
+GROUP = ("Регион", "Город", True)
+OPEN = "Открыта"
+
+
+# часы трекера переводятся вручную; часы цикла событий не затрагиваются
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(app.trending, "time", SimpleNamespace(monotonic=lambda: clock.now, perf_counter=lambda: clock.now))
+    return clock
+
+
+def decayed(tracker, petition_id, group=GROUP):
+    return tracker.groups[group][petition_id] / tracker.weight(app.trending.time.monotonic())
+
+
+def test_like_loses_half_of_its_weight_per_half_life(clock):
+    tracker = TrendingTracker(half_life=100, capacity=10)
+    tracker.like(1, GROUP, OPEN)
+    assert decayed(tracker, 1) == pytest.approx(1)
+    clock.now += 100
+    assert decayed(tracker, 1) == pytest.approx(0.5)
+    clock.now += 200
+    assert decayed(tracker, 1) == pytest.approx(0.125)
+
+
+def test_recent_likes_outrank_older_ones(clock):
+    tracker = TrendingTracker(half_life=100, capacity=10)
+    for _ in range(3):
+        tracker.like(1, GROUP, OPEN)
+    clock.now += 200
+    tracker.like(2, GROUP, OPEN)
+    tracker.like(2, GROUP, OPEN)
+    # 3 лайка два периода назад весят 0.75, 2 новых - 2
+    assert tracker.top(GROUP, 10) == [2, 1]
+    assert decayed(tracker, 1) == pytest.approx(0.75)
+
+
+def test_rebase_keeps_scores_finite_and_ordered(clock):
+    tracker = TrendingTracker(half_life=1, capacity=10)
+    tracker.like(1, GROUP, OPEN)
+    tracker.like(1, GROUP, OPEN)
+    clock.now += 1000
+    tracker.like(2, GROUP, OPEN)
+    assert tracker.landmark == clock.now
+    assert all(math.isfinite(score) for score in tracker.groups[GROUP].values())
+    assert tracker.top(GROUP, 10) == [2, 1]
+
+
+def test_unlike_of_last_like_removes_petition(clock):
+    tracker = TrendingTracker(half_life=100, capacity=10)
+    tracker.like(1, GROUP, OPEN)
+    clock.now += 30
+    tracker.unlike(1, GROUP, OPEN, age=30)
+    assert tracker.top(GROUP, 10) == []
+
+
+def test_petitions_under_moderation_are_not_ranked(clock):
+    tracker = TrendingTracker(half_life=100, capacity=10)
+    assert tracker.like(1, GROUP, "На модерации")
+    assert tracker.top(GROUP, 10) == []
+
+
+def test_weakest_petition_is_evicted_from_full_group(clock):
+    tracker = TrendingTracker(half_life=100, capacity=2)
+    tracker.like(1, GROUP, OPEN)
+    tracker.like(2, GROUP, OPEN)
+    tracker.like(2, GROUP, OPEN)
+    # рейтинг заполнен: счет новой петиции неизвестен, лайк не прибавляется
+    assert not tracker.like(3, GROUP, OPEN)
+    assert tracker.top(GROUP, 10) == [2, 1]
+
+    async def load_petitions(petition_ids, decay, window):
+        return [{"id": 3, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2],
+                 "petition_status": OPEN, "score": 1.5}]
+
+    asyncio.run(tracker.load_scores(load_petitions, [3]))
+    assert tracker.top(GROUP, 10) == [2, 3]
+    assert GROUP in tracker.truncated
+    # петиция со счетом меньше самого слабого в рейтинге не попадает в него
+    clock.now += 1
+
+    async def load_weak(petition_ids, decay, window):
+        return [{"id": 4, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2],
+                 "petition_status": OPEN, "score": 0.1}]
+
+    asyncio.run(tracker.load_scores(load_weak, [4]))
+    assert tracker.top(GROUP, 10) == [2, 3]
+
+
+def test_status_change_to_moderation_removes_petition(clock):
+    tracker = TrendingTracker(half_life=100, capacity=10)
+    tracker.like(1, GROUP, OPEN)
+
+    async def load_petitions(petition_ids, decay, window):
+        return [{"id": 1, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2],
+                 "petition_status": "На модерации", "score": 1.0}]
+
+    asyncio.run(tracker.load_scores(load_petitions, [1]))
+    assert tracker.top(GROUP, 10) == []
+
+
+def test_likes_during_refresh_are_kept(clock):
+    tracker = TrendingTracker(half_life=100, capacity=2)
+
+    async def load(decay, window):
+        # лайки приходят, пока запрос к БД выполняется, и в его результат не попадают
+        tracker.like(1, GROUP, OPEN)
+        tracker.like(3, GROUP, OPEN)
+        return [{"id": 1, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2], "score": 5.0},
+                {"id": 2, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2], "score": 4.0},
+                {"id": 3, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2], "score": 0.5}]
+
+    async def load_petitions(petition_ids, decay, window):
+        assert petition_ids == [3]
+        return [{"id": 3, "region": GROUP[0], "city_name": GROUP[1], "is_initiative": GROUP[2],
+                 "petition_status": OPEN, "score": 7.0}]
+
+    asyncio.run(tracker.refresh(load, load_petitions))
+    # лайк петиции 1 прибавлен к загруженному счету; петиция 3 вытеснена при восстановлении,
+    # поэтому ее полный счет загружен отдельно, и она вытесняет более слабую петицию 2
+    assert decayed(tracker, 1) == pytest.approx(6)
+    assert decayed(tracker, 3) == pytest.approx(7)
+    assert tracker.top(GROUP, 10) == [3, 1]
+    assert tracker.stats()["refreshes"] == 1